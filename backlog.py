@@ -0,0 +1,78 @@
+import logging
+from typing import List
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Telegram отдаёт не больше 100 апдейтов за запрос
+FETCH_LIMIT = 100
+# Кнопки, каждое нажатие которых меняет состояние: два нажатия не равны одному
+NON_IDEMPOTENT_PREFIXES = ('toggle_',)
+
+def _supersede_key(update: Update):
+    """Ключ, по которому более поздний апдейт заменяет более ранний, или None, если апдейт нужен всегда"""
+    query = update.callback_query
+    if query is not None:
+        if query.data is None or query.data.startswith(NON_IDEMPOTENT_PREFIXES):
+            return None
+        # Повторные нажатия одной и той же кнопки одного сообщения: важно только последнее
+        if query.message is not None:
+            return 'callback', query.from_user.id, query.message.chat_id, query.message.message_id, query.data
+        return 'callback', query.from_user.id, query.inline_message_id, query.data
+
+    message = update.message
+    if message is not None and message.text and message.from_user is not None:
+        # Один и тот же текст от пользователя (например, город) достаточно обработать один раз
+        return 'text', message.from_user.id, message.chat_id, message.text.strip().lower()
+
+    return None
+
+def compact_updates(updates: List[Update]) -> List[Update]:
+    """Убрать апдейты, которые заменены более поздними; порядок оставшихся сохраняется"""
+    last_by_key = {}
+    for index, update in enumerate(updates):
+        key = _supersede_key(update)
+        if key is not None:
+            last_by_key[key] = index
+
+    survivors = []
+    for index, update in enumerate(updates):
+        key = _supersede_key(update)
+        if key is None or last_by_key[key] == index:
+            survivors.append(update)
+    return survivors
+
+async def drain_backlog(application: Application):
+    """Забрать накопившиеся за время простоя апдейты разом, сжать их и поставить в очередь обработки"""
+    bot = application.bot
+    updates: List[Update] = []
+    offset = None
+    # Запрос с offset подтверждает Telegram все апдейты с меньшим номером — их повторно уже не получить
+    confirmed = None
+
+    try:
+        while True:
+            batch = await bot.get_updates(offset=offset, limit=FETCH_LIMIT, timeout=0,
+                                          allowed_updates=Update.ALL_TYPES)
+            confirmed = offset
+            if not batch:
+                break
+            updates.extend(batch)
+            offset = batch[-1].update_id + 1
+    except TelegramError as e:
+        # Например, ещё установлен вебхук: неподтверждённые апдейты разберёт обычный polling
+        logger.warning(f"Не удалось забрать очередь при запуске: {e}")
+
+    # Обрабатываем только подтверждённые апдейты: остальные Telegram отдаст снова
+    updates = [update for update in updates if confirmed is not None and update.update_id < confirmed]
+    if not updates:
+        return
+
+    survivors = compact_updates(updates)
+    for update in survivors:
+        await application.update_queue.put(update)
+
+    logger.info(f"Очередь при запуске: {len(updates)} апдейтов, к обработке после сжатия: {len(survivors)}")
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""Разбор callback_data: прежняя цепочка if/elif против CallbackRouter: python bench/callback_router.py"""
+import logging
+import os
+import random
+import sys
+import timeit
+from typing import Optional
+
+# Модули бота лежат в корне репозитория, пакета нет
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.callbacks import router
+
+PRESSES = 100_000
+
+def old_chain(data: str) -> Optional[str]:
+    """Прежняя цепочка if/elif из button_callback; возвращает имя обработчика"""
+    if data.startswith("weather"):
+        return 'handle_weather_callback'
+    elif data.startswith("add_favorite:"):
+        return 'handle_add_favorite'
+    elif data.startswith("remove_favorite:"):
+        return 'handle_remove_favorite'
+    elif data.startswith("fav_"):
+        return 'handle_fav_city'
+    elif data == "favorites_back":
+        return 'favorites'
+    elif data == "extra_features":
+        return 'extra_features_menu'
+    elif data.startswith("toggle_"):
+        return 'handle_toggle_feature'
+    elif data.startswith("history_"):
+        return 'handle_history_callback'
+    elif data == "clear_history":
+        return 'clear_history'
+    elif data == "main_menu":
+        return 'return_to_main_menu'
+    elif data == "my_notifications":
+        return 'show_my_notifications'
+    elif data == "add_notification_step1":
+        return 'add_notification_step1'
+    elif data == "disable_all_notifications":
+        return 'handle_disable_all_notifications'
+    elif data.startswith("share_weather:"):
+        return 'share_weather'
+    elif data.startswith("extra_data:"):
+        return 'handle_extra_data'
+    elif data.startswith("week_forecast:"):
+        return 'handle_week_forecast'
+    elif data.startswith("confirm_region:"):
+        return 'handle_confirm_region'
+    elif data.startswith("confirm_region_yes:"):
+        return 'handle_confirm_region_yes'
+    elif data == "region_cancel":
+        return 'handle_region_cancel'
+    elif data == "language":
+        return 'language_menu'
+    elif data.startswith("lang_"):
+        return 'handle_language_change'
+    elif data == "settings_back":
+        return 'settings'
+    elif data == "change_region":
+        return 'change_region_menu'
+    elif data == "region_back":
+        return 'change_region_menu'
+    elif data == "autodetect_region":
+        return 'autodetect_region'
+    elif data == "autodetect_location_request":
+        return 'autodetect_region'
+    elif data == "manual_set_region":
+        return 'manual_set_region'
+    elif data == "change_timezone":
+        return 'change_timezone_menu'
+    elif data.startswith("tz_user_"):
+        return 'handle_timezone_change'
+    elif data == "manual_timezone_number":
+        return 'manual_timezone_number'
+    elif data == "tz_add_my":
+        return 'handle_tz_add_my'
+    elif data == "tz_add_list":
+        return 'tz_add_list'
+    elif data.startswith("tz_add_"):
+        return 'handle_tz_add'
+    elif data == "manual_time_add":
+        return 'manual_time_add'
+    elif data.startswith("time_add_"):
+        return 'handle_time_add'
+    elif data.startswith("edit_notification_"):
+        return 'edit_notification'
+    elif data.startswith("delete_notification_"):
+        return 'delete_notification'
+    elif data == "pressure_settings":
+        return 'pressure_settings_menu'
+    elif data in ("pressure_mm", "pressure_hpa"):
+        return 'handle_pressure_change'
+    elif data.startswith("day_forecast_"):
+        return 'handle_day_forecast'
+    elif data == "clear_favorites":
+        return 'clear_favorites'
+    elif data == "partners":
+        return 'partners_menu'
+    return None
+
+def handler_name(handler) -> Optional[str]:
+    """Имя исходной функции обработчика (обёртки регистрации хранят её в замыкании)"""
+    if handler is None:
+        return None
+    func = handler
+    for cell in handler.__closure__ or ():
+        if callable(cell.cell_contents):
+            func = cell.cell_contents
+    return func.__name__
+
+# Смесь нажатий с весами: кнопки дней и настройка уведомлений встречаются чаще всего
+MIX = [
+    ('day_forecast_2024-06-01', 30),
+    ('day_forecast_2024-06-02', 30),
+    ('day_forecast_2024-06-03', 30),
+    ('day_forecast_2024-06-04', 30),
+    ('day_forecast_2024-06-05', 30),
+    ('time_add_06:00', 8),
+    ('time_add_07:00', 8),
+    ('time_add_08:00', 8),
+    ('time_add_09:00', 8),
+    ('time_add_10:00', 8),
+    ('time_add_11:00', 8),
+    ('edit_notification_ab12cd34', 10),
+    ('delete_notification_ab12cd34', 5),
+    ('weather:Москва|55.75,37.61', 40),
+    ('weather:Paris', 15),
+    ('toggle_cloudiness', 12),
+    ('toggle_wind_gust', 8),
+    ('extra_features', 10),
+    ('main_menu', 15),
+    ('tz_add_my', 6),
+    ('tz_add_list', 4),
+    ('tz_add_UTC+3', 6),
+    ('week_forecast:Москва|55.75,37.61', 20),
+    ('fav_Rome', 8),
+    ('history_Kazan', 8),
+    ('add_favorite:Paris:FR', 5),
+    ('remove_favorite:Paris:FR', 3),
+    ('confirm_region:Kazan:55.79,49.10', 2),
+    ('confirm_region_yes:Kazan:55.79,49.10', 2),
+    ('lang_eng', 2),
+    ('pressure_hpa', 2),
+    ('partners', 1),
+    ('bogus', 1),
+    ('share_weather:Paris', 3),
+    ('extra_data:Paris|48.85,2.35', 4),
+    ('my_notifications', 8),
+    ('add_notification_step1', 5),
+    ('tz_user_UTC+5', 2),
+    ('region_cancel', 1),
+    ('clear_history', 1),
+    ('favorites_back', 3),
+    ('settings_back', 3),
+    ('autodetect_location_request', 1),
+    ('manual_time_add', 2),
+    ('disable_all_notifications', 1),
+]
+
+def main():
+    logging.disable(logging.CRITICAL)
+    random.seed(7)
+    replay = random.choices([data for data, _ in MIX], [weight for _, weight in MIX], k=PRESSES)
+
+    mismatches = sorted(data for data in set(replay) if old_chain(data) != handler_name(router.resolve(data)))
+    print(f"mismatches: {mismatches}")
+
+    resolve = router.resolve
+    for label, func in (('if/elif chain', lambda: [old_chain(data) for data in replay]),
+                        ('router', lambda: [resolve(data) for data in replay])):
+        best = min(timeit.repeat(func, number=1, repeat=7))
+        print(f"{label}: {best / PRESSES * 1e9:.0f} ns/dispatch")
+
+    for data in ('day_forecast_2024-06-01', 'main_menu', 'weather:Москва|55.75,37.61'):
+        chain = min(timeit.repeat(lambda: old_chain(data), number=PRESSES, repeat=5)) / PRESSES * 1e9
+        trie = min(timeit.repeat(lambda: resolve(data), number=PRESSES, repeat=5)) / PRESSES * 1e9
+        print(f"{data}: {chain:.0f} vs {trie:.0f} ns")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""Соединение на каждый запрос против одного соединения в потоке БД: python bench/db_connection.py"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Модули бота лежат в корне репозитория, пакета нет
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+READS = 5000
+WRITES = 1000
+
+def per_call_read(user_id: int):
+    # Так работали прежние get_user_lang_db/set_user_lang_db: новое соединение на каждый вызов
+    conn = sqlite3.connect(database.DB_PATH)
+    conn.execute(database.SQL_SELECT_USER, (user_id,)).fetchone()
+    conn.close()
+
+def per_call_write(user_id: int):
+    conn = sqlite3.connect(database.DB_PATH)
+    conn.execute('UPDATE users SET lang = ? WHERE user_id = ?', ('eng', user_id))
+    conn.commit()
+    conn.close()
+
+def _read(conn: sqlite3.Connection, user_id: int):
+    conn.execute(database.SQL_SELECT_USER, (user_id,)).fetchone()
+
+def _write(conn: sqlite3.Connection, user_id: int):
+    with conn:
+        conn.execute('UPDATE users SET lang = ? WHERE user_id = ?', ('eng', user_id))
+
+def managed_read(user_id: int):
+    database.run_in_db(_read, user_id)
+
+def managed_write(user_id: int):
+    database.run_in_db(_write, user_id)
+
+def measure(func, count: int) -> float:
+    """Среднее время одного вызова, мкс"""
+    started = time.perf_counter()
+    for i in range(count):
+        func(i % 100)
+    return (time.perf_counter() - started) / count * 1e6
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        database.save_user_batch_db({user_id: {'lang': 'rus'} for user_id in range(100)}).result()
+
+        print(f"read:  per-call connect {measure(per_call_read, READS):.1f} us/op, "
+              f"managed connection {measure(managed_read, READS):.1f} us/op")
+        print(f"write: per-call connect {measure(per_call_write, WRITES):.1f} us/op, "
+              f"managed connection {measure(managed_write, WRITES):.1f} us/op")
+        database.close_db()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
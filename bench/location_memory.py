@@ -0,0 +1,74 @@
+"""Память на координаты городов: словари у каждого пользователя против общей таблицы мест: python bench/location_memory.py"""
+import gc
+import logging
+import os
+import random
+import sys
+import tracemalloc
+import types
+
+# Модули бота лежат в корне репозитория, пакета нет
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_data import ProfileCache, UserDataManager, UserProfile
+
+USERS = 200_000
+PLACES = 5000
+GEOLOCATION_SHARE = 0.3
+
+def make_plan() -> tuple:
+    """Города каждого пользователя (по Ципфу: крупные встречаются чаще) и его геолокация"""
+    rnd = random.Random(1)
+    names = [f"City{i}" for i in range(PLACES)]
+    coordinates = [(rnd.uniform(-60, 70), rnd.uniform(-180, 180)) for _ in range(PLACES)]
+    weights = [1 / (i + 1) for i in range(PLACES)]
+    plan = []
+    for _ in range(USERS):
+        cities = rnd.choices(range(PLACES), weights, k=rnd.choice([1, 1, 2, 2, 3, 5, 8]))
+        geolocation = (rnd.uniform(40, 60), rnd.uniform(30, 60)) if rnd.random() < GEOLOCATION_SHARE else None
+        plan.append((cities, geolocation))
+    return names, coordinates, plan
+
+def per_user_dicts(names, coordinates, plan):
+    # Прежний bot_data['city_coordinates']: user_id → {город: {'lat', 'lon'}}
+    city_coordinates = {}
+    for user_id, (cities, geolocation) in enumerate(plan):
+        saved = city_coordinates.setdefault(user_id, {})
+        for city in cities:
+            lat, lon = coordinates[city]
+            saved[''.join(names[city])] = {'lat': lat, 'lon': lon}
+        if geolocation:
+            saved['geolocation'] = {'lat': geolocation[0], 'lon': geolocation[1]}
+    return city_coordinates
+
+def shared_table(names, coordinates, plan, context):
+    for user_id, (cities, geolocation) in enumerate(plan):
+        for city in cities:
+            UserDataManager.save_city_coordinates(context, user_id, ''.join(names[city]), *coordinates[city])
+        if geolocation:
+            UserDataManager.save_city_coordinates(context, user_id, 'geolocation', *geolocation)
+
+def measure(func, *args) -> float:
+    """Память, которую заняли данные, созданные func, МиБ"""
+    gc.collect()
+    tracemalloc.start()
+    result = func(*args)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current / 2 ** 20
+
+def main():
+    logging.disable(logging.CRITICAL)
+    names, coordinates, plan = make_plan()
+    profiles = ProfileCache(USERS)
+    for user_id in range(USERS):
+        profiles.put(user_id, UserProfile())
+    context = types.SimpleNamespace(bot_data={'profiles': profiles})
+
+    print(f"{USERS} users, {PLACES} places, {GEOLOCATION_SHARE:.0%} shared geolocation")
+    print(f"old per-user dicts: {measure(per_user_dicts, names, coordinates, plan):.1f} MiB")
+    print(f"shared table:       {measure(shared_table, names, coordinates, plan, context):.1f} MiB")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""Пропускная способность режима 'sharded' при 1, 2, 4... рабочих процессах: python bench/shard_scaling.py [1 2 4]"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+# Модули бота лежат в корне репозитория, пакета нет
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sharding import ShardRouter
+from webhook import SECRET_HEADER, WebhookServer
+
+UPDATES = 6000
+CPU_MS = 1.0
+SENDERS = 64
+PATH = '/hook'
+SECRET = 'bench'
+
+class _BusyWorker(WebhookServer):
+    """Рабочий процесс без Telegram: каждый апдейт занимает CPU_MS миллисекунд процессора"""
+
+    async def _accept(self, method: str, path: str, headers: dict, body: bytes) -> int:
+        status = self._check(method, path, headers)
+        if status != 200:
+            return status
+        json.loads(body)
+        deadline = time.perf_counter() + CPU_MS / 1000
+        while time.perf_counter() < deadline:
+            pass
+        return 200
+
+def _worker_main(ports: multiprocessing.Queue):
+    async def serve():
+        server = _BusyWorker(None, '127.0.0.1', 0, PATH, SECRET, 1 << 20)
+        await server.start()
+        ports.put(server.port)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+def _body(update_id: int) -> bytes:
+    user_id = update_id % 1000 + 1
+    return json.dumps({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'}, 'text': 'Москва'}}).encode()
+
+async def _sender(port: int, update_ids: range) -> list:
+    """Отправлять апдейты по одному keep-alive соединению, как это делает Telegram"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    statuses = []
+    for update_id in update_ids:
+        body = _body(update_id)
+        writer.write(f"POST {PATH} HTTP/1.1\r\n{SECRET_HEADER}: {SECRET}\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        head = await reader.readuntil(b'\r\n\r\n')
+        statuses.append(int(head.split(b' ', 2)[1]))
+    writer.close()
+    return statuses
+
+async def _run(worker_ports: list) -> tuple:
+    router = ShardRouter('127.0.0.1', 0, PATH, SECRET, 1 << 20, worker_ports)
+    await router.start()
+    try:
+        per_sender = UPDATES // SENDERS
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            _sender(router.port, range(i * per_sender, (i + 1) * per_sender)) for i in range(SENDERS)
+        ))
+        elapsed = time.perf_counter() - started
+    finally:
+        await router.stop()
+    statuses = [status for result in results for status in result]
+    return len(statuses) / elapsed, sum(status != 200 for status in statuses)
+
+def measure(workers: int) -> tuple:
+    """Апдейтов в секунду и число ответов не 200"""
+    context = multiprocessing.get_context('spawn')
+    ports = context.Queue()
+    processes = [context.Process(target=_worker_main, args=(ports,), daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        return asyncio.run(_run([ports.get(timeout=30) for _ in processes]))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+def main():
+    logging.disable(logging.CRITICAL)
+    counts = [int(arg) for arg in sys.argv[1:]] or [1, 2, 4]
+    print(f"{UPDATES} updates, {CPU_MS} ms CPU each, cpu_count={os.cpu_count()}")
+    for workers in counts:
+        rate, errors = measure(workers)
+        print(f"{workers} workers: {rate:.0f} updates/s, non-200 responses: {errors}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""Чтение настроек для одного отображения погоды: отдельные геттеры против UserContext: python bench/user_context.py"""
+import os
+import sys
+import timeit
+import types
+
+# Модули бота лежат в корне репозитория, пакета нет
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_data import UserDataManager, UserProfile, _get_profiles, make_favorite_key
+
+USER_ID = 1
+NUMBER = 200_000
+REPEAT = 7
+
+bot_data = {}
+profile = UserProfile()
+profile.favorites = {make_favorite_key('Paris', 'FR'): 'Paris'}
+_get_profiles(bot_data).put(USER_ID, profile)
+
+def separate_getters():
+    # Каждый апдейт получает свой CallbackContext
+    context = types.SimpleNamespace(bot_data=bot_data)
+    UserDataManager.get_user_lang(context, USER_ID)
+    UserDataManager.get_user_features(context, USER_ID)
+    UserDataManager.get_user_timezone(context, USER_ID)
+    UserDataManager.get_user_pressure_unit(context, USER_ID)
+    make_favorite_key('Paris', 'FR') in UserDataManager.get_user_favorites_dict(context, USER_ID)
+    'Paris'.lower() == UserDataManager.get_user_region(context, USER_ID).lower()
+
+def user_context():
+    context = types.SimpleNamespace(bot_data=bot_data)
+    user = UserDataManager.get_user_context(context, USER_ID)
+    user.lang
+    user.features
+    user.timezone
+    user.pressure_unit
+    user.is_favorite('Paris', 'FR')
+    user.is_current_region('Paris')
+
+def main():
+    print(f"best of {REPEAT} x {NUMBER}")
+    for func in (separate_getters, user_context):
+        best = min(timeit.repeat(func, number=NUMBER, repeat=REPEAT))
+        print(f"{func.__name__}: {best / NUMBER * 1e9:.0f} ns")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""Память на 1M пользователей: параллельные словари bot_data против UserProfile: python bench/user_memory.py [N]"""
+import gc
+import os
+import sys
+import tracemalloc
+
+# Модули бота лежат в корне репозитория, пакета нет
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import FEATURE_BITS
+from user_data import UserProfile
+
+REGIONS = ['Moscow', 'Kazan', 'Paris', 'London', 'Berlin']
+TIMEZONES = ['UTC+3', 'UTC+0', 'UTC+1']
+
+def parallel_dicts(count: int) -> dict:
+    # Прежняя раскладка: десять словарей user_id → значение, коллекции создавались сразу
+    bot_data = {name: {} for name in ('lang', 'region', 'timezone', 'pressure_unit', 'features', 'notifications',
+                                      'favorites', 'favorites_dict', 'history', 'city_coordinates')}
+    for user_id in range(count):
+        bot_data['lang'][user_id] = 'rus'
+        # ''.join — отдельная строка на пользователя, как после чтения из БД
+        bot_data['region'][user_id] = ''.join(REGIONS[user_id % len(REGIONS)])
+        bot_data['timezone'][user_id] = ''.join(TIMEZONES[user_id % len(TIMEZONES)])
+        bot_data['pressure_unit'][user_id] = 'mmhg'
+        bot_data['features'][user_id] = {name: False for name in FEATURE_BITS}
+        bot_data['notifications'][user_id] = []
+        bot_data['favorites'][user_id] = []
+        bot_data['favorites_dict'][user_id] = {}
+        bot_data['history'][user_id] = []
+        bot_data['city_coordinates'][user_id] = {}
+    return bot_data
+
+def profiles(count: int) -> dict:
+    row = {'lang': 'rus', 'pressure_unit': 'mmhg', 'features': 0, 'notifications': [], 'favorites': []}
+    result = {}
+    for user_id in range(count):
+        row['region'] = ''.join(REGIONS[user_id % len(REGIONS)])
+        row['timezone'] = ''.join(TIMEZONES[user_id % len(TIMEZONES)])
+        result[user_id] = UserProfile.from_row(row)
+    return {'profiles': result}
+
+def measure(build, count: int) -> float:
+    """Память, занятая построенной структурой, МиБ"""
+    gc.collect()
+    tracemalloc.start()
+    data = build(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return current / 2 ** 20
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"{count} users")
+    print(f"old parallel dicts: {measure(parallel_dicts, count):.1f} MiB")
+    print(f"UserProfile map:    {measure(profiles, count):.1f} MiB")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
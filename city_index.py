@@ -0,0 +1,75 @@
+import logging
+import re
+from typing import Dict, NamedTuple, Optional
+
+from config import RUSSIANCITYCOORDINATES, CITY_EXONYMS
+
+logger = logging.getLogger(__name__)
+
+class CityRecord(NamedTuple):
+    """Город из локального справочника: ключ словаря координат, отображаемое название и координаты"""
+    key: str
+    name: str
+    lat: float
+    lon: float
+
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+
+# Разные системы транслитерации сводятся к одной форме: Nizhniy/Nizhny/Nizhnij, Yekaterinburg/Ekaterinburg, Khimki/Himki
+_LATIN_VARIANTS = [
+    ('shch', 'sch'), ('iy', 'y'), ('yy', 'y'), ('ij', 'y'), ('kh', 'h'),
+    ('ja', 'ya'), ('ju', 'yu'), ('jo', 'e'), ('yo', 'e'), ('ye', 'e'),
+]
+
+_SEPARATORS = re.compile(r"[\s\-‐–—_]+")
+_PUNCTUATION = re.compile(r"[.,'’`ʹ\"]")
+
+def _fold(name: str) -> str:
+    """Регистр, ё/е, дефисы, пробелы и точки не различаются"""
+    name = _PUNCTUATION.sub('', name.lower().replace('ё', 'е'))
+    return _SEPARATORS.sub(' ', name).strip()
+
+def _latin_skeleton(name: str) -> str:
+    for variant, canonical in _LATIN_VARIANTS:
+        name = name.replace(variant, canonical)
+    return name
+
+def alias_key(name: str) -> str:
+    """Ключ поиска города: одна и та же строка для всех написаний одного названия"""
+    folded = _fold(name)
+    if folded.isascii():
+        return _latin_skeleton(folded)
+    return folded
+
+def transliterate(name: str) -> str:
+    """Латинская запись русского названия"""
+    return ''.join(_TRANSLIT.get(char, char) for char in name.lower())
+
+def _build_index() -> Dict[str, CityRecord]:
+    index: Dict[str, CityRecord] = {}
+
+    def add(alias: str, record: CityRecord):
+        existing = index.setdefault(alias_key(alias), record)
+        if existing.key != record.key:
+            logger.warning(f"Написание '{alias}' уже относится к городу '{existing.key}', пропускаем для '{record.key}'")
+
+    for key, (lat, lon) in RUSSIANCITYCOORDINATES.items():
+        record = CityRecord(key, key.title(), lat, lon)
+        add(key, record)
+        add(transliterate(key), record)
+        for exonym in CITY_EXONYMS.get(key, ()):
+            add(exonym, record)
+
+    return index
+
+# Строится один раз при импорте; каждый поиск — одно обращение к словарю
+_index = _build_index()
+
+def find_city(name: str) -> Optional[CityRecord]:
+    """Найти город в локальном справочнике по любому написанию"""
+    return _index.get(alias_key(name))
\ No newline at end of file
@@ -123,6 +123,25 @@ RUSSIANCITYCOORDINATES = {
     "ялта": (44.4952, 34.1663)
 }
 
+# Справочник населённых пунктов (собирается из GeoNames: python gazetteer.py cities15000.txt); без него города ищутся через API
+GAZETTEER_PATH = 'gazetteer.bin'
+# Населённые пункты меньше этого размера в справочник не попадают
+GAZETTEER_MIN_POPULATION = 15000
+
+# Английские названия, которые не совпадают с транслитерацией русских
+CITY_EXONYMS = {
+    "москва": ["Moscow"],
+    "санкт-петербург": ["Saint Petersburg", "St. Petersburg", "Petersburg", "Leningrad"],
+    "ростов-на-дону": ["Rostov-on-Don"],
+    "великий новгород": ["Veliky Novgorod", "Novgorod", "Great Novgorod"],
+    "тольятти": ["Togliatti"],
+    "архангельск": ["Archangel"],
+    "королёв": ["Korolyov"],
+    "щелково": ["Shchyolkovo"],
+    "сергиев посад": ["Sergiyev Posad"],
+    "севастополь": ["Sebastopol"],
+}
+
 # Константы для настроек
 DEFAULT_LANG = 'rus'
 DEFAULT_REGION = 'Moscow'
@@ -131,6 +150,72 @@ DEFAULT_PRESSURE_UNIT = 'mmhg'
 MAX_NOTIFICATIONS = 10
 MAX_HISTORY_ITEMS = 10
 WEATHER_CACHE_TTL_MINUTES = 10
+# Сколько минут после получения устаревшая погода ещё показывается сразу, пока в фоне запрашивается свежая
+WEATHER_STALE_MAX_MINUTES = 60
+# Сколько ответов погоды держать в памяти процесса на одну функцию; старые вытесняются
+WEATHER_CACHE_MAX_ITEMS = 5000
+
+# Дополнительные функции хранятся битовой маской: один бит на функцию
+FEATURE_BITS = {
+    'cloudiness': 1,
+    'wind_direction': 2,
+    'wind_gust': 4,
+    'sunrise_sunset': 8
+}
+
+# Настройки базы данных
+DB_PATH = 'weather_bot.db'
+DB_SYNCHRONOUS = 'NORMAL'  # в режиме WAL NORMAL безопасен и не делает fsync на каждый коммит
+DB_CACHE_SIZE_KB = 8192
+
+# Отложенная запись: сброс раз в WRITE_BEHIND_INTERVAL_MS или после WRITE_BEHIND_MAX_CHANGES изменений
+WRITE_BEHIND_INTERVAL_MS = 300
+WRITE_BEHIND_MAX_CHANGES = 100
+
+# Сколько недавно активных пользователей держать в памяти, остальные читаются из БД по требованию
+HOT_USERS_LIMIT = 10000
+# Сколько мест держать в общей таблице координат; давно не использованные вытесняются
+LOCATIONS_MAX_ITEMS = 50000
+
+# Токены длинных данных в кнопках: сколько живут и сколько хранится одновременно
+CALLBACK_PAYLOAD_TTL_HOURS = 48
+CALLBACK_PAYLOAD_MAX_ITEMS = 100000
+
+# Прогнозы хранятся одной общей копией на место: сколько минут живут и сколько мест хранится одновременно
+FORECAST_TTL_MINUTES = 30
+FORECAST_STORE_MAX_ITEMS = 2000
+
+# Правки одного сообщения (переключатели, дни прогноза): первая сразу, следующие за окно EDIT_DEBOUNCE_MS — одной последней
+EDIT_DEBOUNCE_MS = 250
+# Сколько сообщений помнить, чтобы не отправлять правку без изменений
+EDIT_HISTORY_MAX_ITEMS = 5000
+
+# Режим получения апдейтов: 'polling', 'webhook' или 'sharded'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# В режиме polling при запуске сжимать накопившуюся очередь: повторные нажатия и одинаковые запросы обрабатываются один раз
+COMPACT_BACKLOG_ON_START = True
+# Вебхук: публичный адрес, на который Telegram шлёт апдейты, и где его слушает встроенный сервер
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token; если не задан, генерируется при запуске
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+# Сколько принятых вебхуком апдейтов могут ждать или проходить обработку; сверх этого — 503, Telegram повторит доставку позже
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+WEBHOOK_MAX_BODY_BYTES = 1024 * 1024
+WEBHOOK_MAX_CONNECTIONS = 40
+
+# Режим 'sharded': фронт-процесс принимает вебхук и раздаёт апдейты рабочим процессам по user_id.
+# Рабочий процесс i слушает 127.0.0.1:SHARD_BASE_PORT + i
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', str(os.cpu_count() or 1)))
+SHARD_BASE_PORT = int(os.getenv('SHARD_BASE_PORT', '9100'))
+SHARD_LINK_CONNECTIONS = 8
+# Кэш погоды, общий для всех рабочих процессов
+WEATHER_SHARED_CACHE_PATH = 'weather_cache.db'
+
+# Сколько апдейтов обрабатывается одновременно; апдейты одного пользователя всегда идут по очереди
+MAX_CONCURRENT_UPDATES = 32
 
 # Настройки логирования
 LOG_FILE = 'bot.log'
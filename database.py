@@ -1,11 +1,96 @@
 import sqlite3
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Optional
+
+from config import DB_PATH, DB_SYNCHRONOUS, DB_CACHE_SIZE_KB, FEATURE_BITS, MAX_HISTORY_ITEMS
+from utils import get_next_fire_utc
 
 logger = logging.getLogger(__name__)
 
-def init_db():
-    """Инициализация базы данных"""
-    conn = sqlite3.connect('weather_bot.db')
+# Все обращения к SQLite выполняются в одном выделенном потоке,
+# которому принадлежит единственное долгоживущее соединение
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+_conn = None
+
+# Тексты запросов держим константами: sqlite3 кэширует подготовленные
+# выражения по тексту SQL, поэтому повторные вызовы не компилируют их заново
+SQL_INSERT_USER = '''
+    INSERT OR IGNORE INTO users (user_id, lang, region, timezone, pressure_unit)
+    VALUES (?, ?, ?, ?, ?)
+'''
+SQL_SELECT_USER = 'SELECT lang, region, timezone, pressure_unit, features FROM users WHERE user_id = ?'
+SQL_SELECT_NOTIFICATIONS = '''
+    SELECT notification_id, hour, minute, timezone, region
+    FROM notifications WHERE user_id = ? ORDER BY id
+'''
+SQL_SELECT_ALL_NOTIFICATIONS = '''
+    SELECT user_id, notification_id, hour, minute, timezone, region
+    FROM notifications ORDER BY next_fire_utc
+'''
+SQL_SELECT_FAVORITES = 'SELECT city_name, country FROM favorites WHERE user_id = ? ORDER BY id'
+SQL_DELETE_FAVORITES = 'DELETE FROM favorites WHERE user_id = ?'
+SQL_INSERT_FAVORITE = 'INSERT INTO favorites (user_id, city_name, country) VALUES (?, ?, ?)'
+SQL_SELECT_HISTORY = 'SELECT city_name, used_at FROM history WHERE user_id = ? ORDER BY used_at'
+SQL_UPSERT_HISTORY = '''
+    INSERT INTO history (user_id, city_name, used_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT(user_id, city_name) DO UPDATE SET used_at = excluded.used_at
+'''
+SQL_TRIM_HISTORY = '''
+    DELETE FROM history WHERE user_id = ? AND city_name NOT IN (
+        SELECT city_name FROM history WHERE user_id = ? ORDER BY used_at DESC LIMIT ?
+    )
+'''
+SQL_DELETE_HISTORY = 'DELETE FROM history WHERE user_id = ?'
+SQL_DELETE_NOTIFICATIONS = 'DELETE FROM notifications WHERE user_id = ?'
+SQL_INSERT_NOTIFICATION = '''
+    INSERT INTO notifications (user_id, notification_id, hour, minute, timezone, region, next_fire_utc)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_UPDATE_NEXT_FIRE = 'UPDATE notifications SET next_fire_utc = ? WHERE user_id = ? AND notification_id = ?'
+SQL_UPSERT_CALLBACK_PAYLOAD = '''
+    INSERT OR REPLACE INTO callback_payloads (token, city, country, lat, lon, expires_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+SQL_SELECT_CALLBACK_PAYLOAD = 'SELECT city, country, lat, lon, expires_at FROM callback_payloads WHERE token = ?'
+SQL_PRUNE_CALLBACK_PAYLOADS = 'DELETE FROM callback_payloads WHERE expires_at < ?'
+
+# Поля пользователя, которые хранятся прямо в таблице users
+USER_COLUMNS = ('lang', 'region', 'timezone', 'pressure_unit', 'features')
+
+def _get_conn() -> sqlite3.Connection:
+    """Получить соединение потока БД (создаётся при первом обращении)"""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH, cached_statements=64)
+        _conn.execute('PRAGMA journal_mode=WAL')
+        _conn.execute(f'PRAGMA synchronous={DB_SYNCHRONOUS}')
+        _conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        _conn.execute('PRAGMA temp_store=MEMORY')
+        logger.info(f"Открыто соединение с базой данных {DB_PATH}")
+    return _conn
+
+def _log_db_error(future: Future):
+    if future.exception() is not None:
+        logger.error(f"Ошибка запроса к базе данных: {future.exception()}")
+
+def submit_to_db(func, *args) -> Future:
+    """Поставить func(conn, *args) в очередь потока БД, не дожидаясь результата"""
+    future = _db_executor.submit(lambda: func(_get_conn(), *args))
+    future.add_done_callback(_log_db_error)
+    return future
+
+def run_in_db(func, *args):
+    """Выполнить func(conn, *args) в потоке БД и дождаться результата"""
+    return submit_to_db(func, *args).result()
+
+async def run_in_db_async(func, *args):
+    """Выполнить func(conn, *args) в потоке БД, не блокируя цикл событий"""
+    return await asyncio.wrap_future(submit_to_db(func, *args))
+
+def _init_db(conn: sqlite3.Connection):
     cursor = conn.cursor()
 
     # Таблица пользователей
@@ -47,8 +132,13 @@ def init_db():
         )
     ''')
 
-    # Таблица дополнительных функций
-    cursor.execute('''
+    conn.commit()
+    _run_migrations(conn)
+
+def _migration_1(conn: sqlite3.Connection):
+    """Индексы по user_id, составной ключ для features, время срабатывания уведомлений"""
+    # Старая таблица features есть только в БД, созданных до миграций; в новой БД создаём её пустой
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS features (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER,
@@ -57,48 +147,233 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users (user_id)
         )
     ''')
+    conn.execute('''
+        CREATE TABLE features_new (
+            user_id INTEGER NOT NULL,
+            feature_name TEXT NOT NULL,
+            enabled BOOLEAN DEFAULT 1,
+            PRIMARY KEY (user_id, feature_name),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO features_new (user_id, feature_name, enabled)
+        SELECT user_id, feature_name, enabled FROM features
+        WHERE user_id IS NOT NULL AND feature_name IS NOT NULL
+        ORDER BY id
+    ''')
+    conn.execute('DROP TABLE features')
+    conn.execute('ALTER TABLE features_new RENAME TO features')
 
-    conn.commit()
-    conn.close()
+    conn.execute('CREATE INDEX idx_favorites_user ON favorites (user_id)')
+
+    conn.execute('ALTER TABLE notifications ADD COLUMN next_fire_utc INTEGER')
+    conn.execute('CREATE INDEX idx_notifications_user ON notifications (user_id)')
+    conn.execute('CREATE INDEX idx_notifications_time ON notifications (hour, minute, timezone)')
+    conn.execute('CREATE INDEX idx_notifications_next_fire ON notifications (next_fire_utc)')
+
+def _migration_2(conn: sqlite3.Connection):
+    """Дополнительные функции — битовая маска в колонке users.features вместо отдельной таблицы"""
+    conn.execute('ALTER TABLE users ADD COLUMN features INTEGER NOT NULL DEFAULT 0')
+    conn.execute('INSERT OR IGNORE INTO users (user_id) SELECT DISTINCT user_id FROM features')
+
+    bits = ' '.join(f"WHEN '{name}' THEN {bit}" for name, bit in FEATURE_BITS.items())
+    conn.execute(f'''
+        UPDATE users SET features = (
+            SELECT COALESCE(SUM(CASE feature_name {bits} ELSE 0 END), 0)
+            FROM features WHERE features.user_id = users.user_id AND enabled
+        )
+    ''')
+    conn.execute('DROP TABLE features')
+
+def _migration_3(conn: sqlite3.Connection):
+    """История поиска: по одной строке на город, порядок — по времени последнего запроса"""
+    conn.execute('''
+        CREATE TABLE history (
+            user_id INTEGER NOT NULL,
+            city_name TEXT NOT NULL,
+            used_at REAL NOT NULL,
+            PRIMARY KEY (user_id, city_name),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX idx_history_user_time ON history (user_id, used_at)')
+
+def _migration_4(conn: sqlite3.Connection):
+    """Токены кнопок с городами: переживают перезапуск бота"""
+    conn.execute('''
+        CREATE TABLE callback_payloads (
+            token TEXT PRIMARY KEY,
+            city TEXT NOT NULL,
+            country TEXT NOT NULL,
+            lat REAL,
+            lon REAL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX idx_callback_payloads_expires ON callback_payloads (expires_at)')
+
+# Миграции схемы по порядку: миграция с индексом i переводит БД на версию i + 1
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+]
+
+def _run_migrations(conn: sqlite3.Connection):
+    """Применить недостающие миграции, версия схемы хранится в PRAGMA user_version"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    for target, migration in enumerate(MIGRATIONS, start=1):
+        if target <= version:
+            continue
+
+        conn.execute('BEGIN')
+        try:
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {target}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"Применена миграция схемы БД #{target}")
+
+def init_db():
+    """Инициализация базы данных"""
+    run_in_db(_init_db)
     logger.info("База данных инициализирована")
 
-def get_db_connection():
-    """Получить соединение с базой данных"""
-    return sqlite3.connect('weather_bot.db', check_same_thread=False)
+def close_db():
+    """Закрыть соединение с базой данных и остановить поток БД"""
+    def _close(conn: sqlite3.Connection):
+        global _conn
+        conn.close()
+        _conn = None
 
-def get_user_lang_db(user_id: int):
-    """Получить язык пользователя из БД"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    if _conn is not None:
+        run_in_db(_close)
+    _db_executor.shutdown(wait=True)
+    logger.info("Соединение с базой данных закрыто")
 
-    cursor.execute('SELECT lang FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-
-    if result:
-        lang = result[0]
-    else:
-        # Создаем пользователя, если не существует
-        cursor.execute('''
-            INSERT OR IGNORE INTO users (user_id, lang, region, timezone, pressure_unit) 
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, 'rus', 'Moscow', 'UTC+0', 'mmhg'))
+def _load_user(conn: sqlite3.Connection, user_id: int) -> dict:
+    row = conn.execute(SQL_SELECT_USER, (user_id,)).fetchone()
+    if row is None:
+        conn.execute(SQL_INSERT_USER, (user_id, 'rus', 'Moscow', 'UTC+0', None))
         conn.commit()
-        lang = 'rus'
+        row = ('rus', 'Moscow', 'UTC+0', None, 0)
 
-    conn.close()
-    return lang
+    notifications = [
+        {'id': notification_id, 'hour': hour, 'minute': minute, 'timezone': timezone, 'region': region}
+        for notification_id, hour, minute, timezone, region in conn.execute(SQL_SELECT_NOTIFICATIONS, (user_id,))
+    ]
 
-def set_user_lang_db(user_id: int, lang: str):
-    """Установить язык пользователя в БД"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    favorites = conn.execute(SQL_SELECT_FAVORITES, (user_id,)).fetchall()
 
-    cursor.execute('''
-        INSERT OR REPLACE INTO users (user_id, lang) 
-        VALUES (?, ?)
-        ON CONFLICT(user_id) DO UPDATE SET lang = excluded.lang
-    ''', (user_id, lang))
+    return {
+        'lang': row[0],
+        'region': row[1],
+        'timezone': row[2],
+        'pressure_unit': row[3],
+        'features': row[4],
+        'notifications': notifications,
+        'favorites': favorites
+    }
+
+async def load_user_db_async(user_id: int) -> dict:
+    """Загрузить настройки пользователя из БД (асинхронно)"""
+    return await run_in_db_async(_load_user, user_id)
+
+def _load_history(conn: sqlite3.Connection, user_id: int) -> list:
+    return conn.execute(SQL_SELECT_HISTORY, (user_id,)).fetchall()
+
+async def load_history_db_async(user_id: int) -> list:
+    """Загрузить историю поиска пользователя: пары (город, время), от старых к новым"""
+    return await run_in_db_async(_load_history, user_id)
+
+def _save_user_batch(conn: sqlite3.Connection, batch: Dict[int, dict]):
+    with conn:
+        for user_id, fields in batch.items():
+            columns = sorted(name for name in fields if name in USER_COLUMNS)
+            if columns:
+                conn.execute(
+                    f"INSERT INTO users (user_id, {', '.join(columns)}) "
+                    f"VALUES (?{', ?' * len(columns)}) "
+                    f"ON CONFLICT(user_id) DO UPDATE SET "
+                    f"{', '.join(f'{name} = excluded.{name}' for name in columns)}",
+                    (user_id, *(fields[name] for name in columns))
+                )
+
+            if 'favorites' in fields:
+                conn.execute(SQL_DELETE_FAVORITES, (user_id,))
+                conn.executemany(SQL_INSERT_FAVORITE, [
+                    (user_id, city, country) for city, country in fields['favorites']
+                ])
+
+            if fields.get('history_cleared'):
+                conn.execute(SQL_DELETE_HISTORY, (user_id,))
+
+            if fields.get('history'):
+                conn.executemany(
+                    SQL_UPSERT_HISTORY,
+                    [(user_id, city, used_at) for city, used_at in fields['history'].items()]
+                )
+                conn.execute(SQL_TRIM_HISTORY, (user_id, user_id, MAX_HISTORY_ITEMS))
 
+            if 'notifications' in fields:
+                conn.execute(SQL_DELETE_NOTIFICATIONS, (user_id,))
+                conn.executemany(SQL_INSERT_NOTIFICATION, [
+                    (user_id, n['id'], n['hour'], n['minute'], n['timezone'], n['region'],
+                     get_next_fire_utc(n['hour'], n['minute'], n['timezone']))
+                    for n in fields['notifications']
+                ])
+
+def save_user_batch_db(batch: Dict[int, dict]) -> Future:
+    """Записать пачку изменённых пользователей одной транзакцией"""
+    return submit_to_db(_save_user_batch, batch)
+
+def _load_all_notifications(conn: sqlite3.Connection) -> Dict[int, list]:
+    notifications = {}
+    for user_id, notification_id, hour, minute, timezone, region in conn.execute(SQL_SELECT_ALL_NOTIFICATIONS):
+        notifications.setdefault(user_id, []).append(
+            {'id': notification_id, 'hour': hour, 'minute': minute, 'timezone': timezone, 'region': region}
+        )
+    return notifications
+
+def load_all_notifications_db() -> Dict[int, list]:
+    """Загрузить уведомления всех пользователей (для восстановления задач при запуске)"""
+    return run_in_db(_load_all_notifications)
+
+
+def _save_callback_payload(conn: sqlite3.Connection, token: str, city: str, country: str,
+                           lat: Optional[float], lon: Optional[float], expires_at: float):
+    conn.execute(SQL_UPSERT_CALLBACK_PAYLOAD, (token, city, country, lat, lon, expires_at))
     conn.commit()
-    conn.close()
-    logger.info(f"Язык пользователя {user_id} установлен: {lang}")
\ No newline at end of file
+
+def save_callback_payload_db(token: str, city: str, country: str,
+                             lat: Optional[float], lon: Optional[float], expires_at: float) -> Future:
+    """Сохранить токен кнопки, не дожидаясь записи"""
+    return submit_to_db(_save_callback_payload, token, city, country, lat, lon, expires_at)
+
+def _load_callback_payload(conn: sqlite3.Connection, token: str) -> Optional[tuple]:
+    return conn.execute(SQL_SELECT_CALLBACK_PAYLOAD, (token,)).fetchone()
+
+async def load_callback_payload_db_async(token: str) -> Optional[tuple]:
+    """Найти токен кнопки: (город, страна, широта, долгота, срок действия) или None"""
+    return await run_in_db_async(_load_callback_payload, token)
+
+def _prune_callback_payloads(conn: sqlite3.Connection, now: float):
+    conn.execute(SQL_PRUNE_CALLBACK_PAYLOADS, (now,))
+    conn.commit()
+
+def prune_callback_payloads_db(now: float) -> Future:
+    """Удалить истёкшие токены кнопок"""
+    return submit_to_db(_prune_callback_payloads, now)
+
+def _update_next_fire(conn: sqlite3.Connection, user_id: int, notification_id: str, next_fire_utc: Optional[int]):
+    conn.execute(SQL_UPDATE_NEXT_FIRE, (next_fire_utc, user_id, notification_id))
+    conn.commit()
+
+def update_next_fire_db(user_id: int, notification_id: str, next_fire_utc: Optional[int]) -> Future:
+    """Записать время следующего срабатывания одного уведомления"""
+    return submit_to_db(_update_next_fire, user_id, notification_id, next_fire_utc)
\ No newline at end of file
@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from telegram import CallbackQuery, InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import ExtBot
+
+from config import EDIT_DEBOUNCE_MS, EDIT_HISTORY_MAX_ITEMS
+
+logger = logging.getLogger(__name__)
+
+# Установлен, пока правку отправляет сам планировщик: такие правки не считаются прямыми
+_scheduled_send = contextvars.ContextVar('scheduled_send', default=False)
+
+class EditScheduler:
+    """Объединение частых правок одного сообщения: отправляется только последняя, неизменённые пропускаются"""
+
+    def __init__(self, debounce_ms: int, max_items: int):
+        self._debounce = debounce_ms / 1000
+        self._max_items = max_items
+        # (чат, сообщение) → (запрос, текст, разметка), ожидающие отправки
+        self._pending: Dict[Tuple[int, int], tuple] = {}
+        self._tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+        # (чат, сообщение) → (текст, разметка), которые сейчас показаны пользователю
+        self._shown: OrderedDict = OrderedDict()
+        self.sent = 0
+        self.skipped = 0
+        self.superseded = 0
+
+    async def edit(self, query: CallbackQuery, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        """Правка сообщения с кнопкой: первая отправляется сразу, следующие в пределах окна — одной последней"""
+        message = query.message
+        if message is None:
+            # Inline-сообщения не объединяем
+            await query.edit_message_text(text, reply_markup=reply_markup)
+            return
+
+        key = (message.chat_id, message.message_id)
+        if key not in self._shown:
+            self._remember(key, (message.text, message.reply_markup))
+
+        if key in self._tasks:
+            # Окно уже открыто: запоминаем только последнее состояние
+            self._pending[key] = (query, text, reply_markup)
+            return
+
+        self._tasks[key] = asyncio.create_task(self._window(key))
+        await self._send(key, query, text, reply_markup)
+
+    async def _window(self, key: Tuple[int, int]):
+        """Окно объединения: по его окончании отправить последнюю отложенную правку, если она есть"""
+        try:
+            while True:
+                await asyncio.sleep(self._debounce)
+                pending = self._pending.pop(key, None)
+                if pending is None:
+                    break
+                await self._send(key, *pending)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _send(self, key: Tuple[int, int], query: CallbackQuery, text: str,
+                    reply_markup: Optional[InlineKeyboardMarkup]):
+        if self._shown.get(key) == (text, reply_markup):
+            self.skipped += 1
+            return
+
+        token = _scheduled_send.set(True)
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup)
+        except BadRequest as e:
+            # Сообщение уже совпадает с новым текстом — это не ошибка
+            if 'not modified' not in str(e).lower():
+                logger.error(f"Ошибка правки сообщения {key}: {e}")
+                return
+        except TelegramError as e:
+            logger.error(f"Ошибка правки сообщения {key}: {e}")
+            return
+        finally:
+            _scheduled_send.reset(token)
+
+        self.sent += 1
+        self._remember(key, (text, reply_markup))
+
+    def direct_edit(self, chat_id: Optional[int], message_id: Optional[int]):
+        """Сообщение правят в обход планировщика: отложенная правка устарела, показанное состояние неизвестно"""
+        if _scheduled_send.get() or chat_id is None or message_id is None:
+            return
+        key = (chat_id, message_id)
+        if self._pending.pop(key, None) is not None:
+            self.superseded += 1
+        self._shown.pop(key, None)
+
+    def _remember(self, key: Tuple[int, int], shown: tuple):
+        self._shown[key] = shown
+        self._shown.move_to_end(key)
+        while len(self._shown) > self._max_items:
+            self._shown.popitem(last=False)
+
+edit_scheduler = EditScheduler(EDIT_DEBOUNCE_MS, EDIT_HISTORY_MAX_ITEMS)
+
+class SchedulingBot(ExtBot):
+    """Бот приложения: прямая правка сообщения отменяет отложенную правку того же сообщения в планировщике"""
+
+    async def edit_message_text(self, *args, **kwargs):
+        edit_scheduler.direct_edit(kwargs.get('chat_id'), kwargs.get('message_id'))
+        return await super().edit_message_text(*args, **kwargs)
+
+    async def edit_message_reply_markup(self, *args, **kwargs):
+        edit_scheduler.direct_edit(kwargs.get('chat_id'), kwargs.get('message_id'))
+        return await super().edit_message_reply_markup(*args, **kwargs)
\ No newline at end of file
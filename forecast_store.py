@@ -0,0 +1,127 @@
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+from config import FORECAST_TTL_MINUTES, FORECAST_STORE_MAX_ITEMS
+
+class ForecastColumns:
+    """3-часовые записи прогноза по колонкам: по массиву на поле вместо словаря на запись"""
+
+    __slots__ = ('timestamps', 'temps', 'feels_like', 'humidity', 'pressure', 'wind_speed',
+                 'descriptions', 'icons')
+
+    def __init__(self, forecast_list: list):
+        self.timestamps = array('q', (f['dt'] for f in forecast_list))
+        self.temps = array('d', (f['main']['temp'] for f in forecast_list))
+        self.feels_like = array('d', (f['main']['feels_like'] for f in forecast_list))
+        self.humidity = array('B', (int(f['main']['humidity']) for f in forecast_list))
+        self.pressure = array('H', (int(f['main']['pressure']) for f in forecast_list))
+        self.wind_speed = array('d', (f['wind']['speed'] for f in forecast_list))
+        # Описания повторяются от записи к записи, поэтому хранятся одной строкой
+        self.descriptions = [sys.intern(f['weather'][0]['description']) for f in forecast_list]
+        self.icons = [sys.intern(f['weather'][0]['icon']) for f in forecast_list]
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+def local_now(utc_offset: int) -> datetime:
+    """Текущее время в городе со смещением utc_offset секунд от UTC (часовой пояс сервера не важен)"""
+    return datetime.now(timezone.utc) + timedelta(seconds=utc_offset)
+
+def summarize_days(columns: ForecastColumns, utc_offset: int = 0) -> Dict[date, dict]:
+    """Сводки по местным дням города за один проход: мин/макс температуры и дневная запись (12-15 ч, иначе первая за день)"""
+    # Дата → [мин, макс, первая запись, дневная запись]
+    days: Dict[date, list] = {}
+    temps = columns.temps
+
+    for i, timestamp in enumerate(columns.timestamps):
+        forecast_dt = datetime.fromtimestamp(timestamp + utc_offset, timezone.utc)
+        temp = temps[i]
+        day = days.get(forecast_dt.date())
+        if day is None:
+            day = days[forecast_dt.date()] = [temp, temp, i, None]
+        else:
+            if temp < day[0]:
+                day[0] = temp
+            if temp > day[1]:
+                day[1] = temp
+        if day[3] is None and 12 <= forecast_dt.hour <= 15:
+            day[3] = i
+
+    summaries = {}
+    for target_date, (temp_min, temp_max, first, midday) in days.items():
+        i = first if midday is None else midday
+        summaries[target_date] = {
+            'date': target_date,
+            'temp_min': temp_min,
+            'temp_max': temp_max,
+            'temp_day': temps[i],
+            'feels_like': columns.feels_like[i],
+            'humidity': columns.humidity[i],
+            'pressure': columns.pressure[i],
+            'wind_speed': columns.wind_speed[i],
+            'description': columns.descriptions[i],
+            'icon': columns.icons[i]
+        }
+    return summaries
+
+class Forecast(NamedTuple):
+    """Прогноз для места: название города от API, смещение от UTC, записи по колонкам и сводки по дням"""
+    city: str
+    utc_offset: int
+    columns: ForecastColumns
+    days: Dict[date, dict]
+
+    @classmethod
+    def from_api(cls, data: dict) -> 'Forecast':
+        """Разобрать ответ API один раз при получении прогноза"""
+        utc_offset = data['city'].get('timezone', 0)
+        columns = ForecastColumns(data['list'])
+        return cls(data['city']['name'], utc_offset, columns, summarize_days(columns, utc_offset))
+
+    def local_date(self, day_offset: int = 0) -> date:
+        """Местная дата в городе через day_offset дней от сегодняшнего"""
+        return (local_now(self.utc_offset) + timedelta(days=day_offset)).date()
+
+def forecast_key(place: str, lang: str) -> str:
+    """Ключ прогноза: место (название или координаты) и язык описаний"""
+    return f"{lang}:{place.strip().lower()}"
+
+class ForecastStore:
+    """Общее хранилище прогнозов: одна копия на место и язык, устаревшие записи вытесняются по TTL"""
+
+    def __init__(self, ttl_seconds: float, max_items: int):
+        self._ttl = ttl_seconds
+        self._max_items = max_items
+        # Ключ → (время истечения, прогноз); порядок — по времени добавления
+        self._items: OrderedDict = OrderedDict()
+
+    def put(self, keys: List[str], forecast: Forecast):
+        """Сохранить прогноз под несколькими ключами (запрошенное место и название от API)"""
+        now = time.monotonic()
+        self._evict(now)
+        for key in keys:
+            self._items[key] = (now + self._ttl, forecast)
+            self._items.move_to_end(key)
+
+    def get(self, key: Optional[str]) -> Optional[Forecast]:
+        """Получить прогноз или None, если его нет или он устарел"""
+        item = self._items.get(key) if key else None
+        if item is None or item[0] < time.monotonic():
+            return None
+        return item[1]
+
+    def _evict(self, now: float):
+        while self._items:
+            key, (expires_at, _) = next(iter(self._items.items()))
+            if expires_at >= now and len(self._items) < self._max_items:
+                break
+            del self._items[key]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+forecast_store = ForecastStore(FORECAST_TTL_MINUTES * 60, FORECAST_STORE_MAX_ITEMS)
\ No newline at end of file
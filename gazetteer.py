@@ -0,0 +1,182 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from city_index import alias_key
+from config import GAZETTEER_PATH, GAZETTEER_MIN_POPULATION
+
+logger = logging.getLogger(__name__)
+
+# Формат файла: заголовок, отсортированные по ключу записи фиксированного размера, затем блок строк
+MAGIC = b'GAZ1'
+HEADER = struct.Struct('<4sI')
+# Смещение и длина ключа, названия и часового пояса в блоке строк, страна, координаты, население
+ENTRY = struct.Struct('<IHIHIB2sffI')
+
+class GazetteerEntry(NamedTuple):
+    """Населённый пункт из справочника"""
+    name: str
+    country: str
+    lat: float
+    lon: float
+    population: int
+    timezone: str
+
+class Gazetteer:
+    """Справочник населённых пунктов в отображённом в память файле: поиск — двоичный, без загрузки в память"""
+
+    def __init__(self, data: mmap.mmap):
+        magic, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("файл не является справочником населённых пунктов")
+        self._data = data
+        self._count = count
+        self._strings = HEADER.size + count * ENTRY.size
+
+    @classmethod
+    def open(cls, path: str) -> 'Gazetteer':
+        with open(path, 'rb') as f:
+            # Страницы файла общие для всех процессов, которые его открыли
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _string(self, offset: int, length: int) -> bytes:
+        start = self._strings + offset
+        return self._data[start:start + length]
+
+    def _key(self, index: int) -> bytes:
+        key_offset, key_length = struct.unpack_from('<IH', self._data, HEADER.size + index * ENTRY.size)
+        return self._string(key_offset, key_length)
+
+    def _entry(self, index: int) -> GazetteerEntry:
+        (_, _, name_offset, name_length, tz_offset, tz_length,
+         country, lat, lon, population) = ENTRY.unpack_from(self._data, HEADER.size + index * ENTRY.size)
+        return GazetteerEntry(
+            self._string(name_offset, name_length).decode(),
+            country.decode().rstrip('\0'),
+            # float32 хранит координаты с точностью около метра; лишние знаки отбрасываем
+            round(lat, 4), round(lon, 4), population,
+            self._string(tz_offset, tz_length).decode()
+        )
+
+    def _matches(self, key: bytes) -> Iterator[int]:
+        """Номера записей с данным ключом; записи одного ключа идут по убыванию населения"""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        while lo < self._count and self._key(lo) == key:
+            yield lo
+            lo += 1
+
+    def lookup(self, name: str, country: Optional[str] = None) -> Optional[GazetteerEntry]:
+        """Самый крупный населённый пункт с таким названием (при указании страны — в этой стране)"""
+        key = alias_key(name).encode()
+        if not key:
+            return None
+
+        for index in self._matches(key):
+            entry = self._entry(index)
+            if country is None or entry.country == country:
+                return entry
+        return None
+
+def _aliases(fields: List[str]) -> set:
+    """Названия населённого пункта: основное, латиницей и альтернативные (без кодов аэропортов и ссылок)"""
+    names = {fields[1], fields[2]}
+    for alternate in fields[3].split(','):
+        if alternate and not (len(alternate) <= 4 and alternate.isupper()) and '://' not in alternate:
+            names.add(alternate)
+    return {alias_key(name) for name in names if name} - {''}
+
+def build_gazetteer(source_path: str, out_path: str, min_population: int = GAZETTEER_MIN_POPULATION) -> int:
+    """Собрать справочник из файла GeoNames (cities15000.txt и т.п.); вернуть число записей"""
+    rows = []
+    strings: Dict[str, int] = {}
+    blob = bytearray()
+
+    def intern(value: str) -> tuple:
+        encoded = value.encode()
+        offset = strings.get(value)
+        if offset is None:
+            offset = strings[value] = len(blob)
+            blob.extend(encoded)
+        return offset, len(encoded)
+
+    with open(source_path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 18:
+                continue
+            population = int(fields[14] or 0)
+            if population < min_population:
+                continue
+
+            name = intern(fields[1])
+            timezone = intern(fields[17])
+            country = fields[8].encode()[:2]
+            lat, lon = float(fields[4]), float(fields[5])
+            for key in _aliases(fields):
+                rows.append((key.encode(), -population, name, timezone, country, lat, lon, population))
+
+    # Ключи сравниваются как байты UTF-8 — в том же порядке, что и при поиске
+    rows.sort(key=lambda row: (row[0], row[1]))
+
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, len(rows)))
+        for key, _, name, timezone, country, lat, lon, population in rows:
+            key_offset, key_length = intern(key.decode())
+            out.write(ENTRY.pack(key_offset, key_length, name[0], name[1], timezone[0], timezone[1],
+                                 country, lat, lon, population))
+        out.write(blob)
+
+    # Работающие процессы продолжают читать старый файл, новые откроют новый
+    os.replace(tmp_path, out_path)
+    return len(rows)
+
+def load_gazetteer(path: str) -> Optional[Gazetteer]:
+    """Открыть справочник, если он собран; без него названия ищутся через API"""
+    if not os.path.exists(path):
+        logger.info(f"Справочник населённых пунктов {path} не найден, поиск городов через API")
+        return None
+    try:
+        gazetteer = Gazetteer.open(path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.error(f"Не удалось открыть справочник {path}: {e}")
+        return None
+    logger.info(f"Справочник населённых пунктов: {len(gazetteer)} названий")
+    return gazetteer
+
+_gazetteer = load_gazetteer(GAZETTEER_PATH)
+
+def find_place(query: str) -> Optional[GazetteerEntry]:
+    """Найти населённый пункт по названию; допускается уточнение страной: 'Paris, FR'"""
+    if _gazetteer is None:
+        return None
+
+    name, sep, country = query.rpartition(',')
+    country = country.strip().upper()
+    if sep and len(country) == 2 and country.isalpha():
+        return _gazetteer.lookup(name, country)
+    return _gazetteer.lookup(query)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(f"Использование: python gazetteer.py cities15000.txt [{GAZETTEER_PATH}] [мин. население]")
+        sys.exit(1)
+    count = build_gazetteer(
+        sys.argv[1],
+        sys.argv[2] if len(sys.argv) > 2 else GAZETTEER_PATH,
+        int(sys.argv[3]) if len(sys.argv) > 3 else GAZETTEER_MIN_POPULATION
+    )
+    print(f"Записано {count} названий")
\ No newline at end of file
@@ -1,5 +1,7 @@
+import asyncio
 import logging
 import urllib.parse
+from typing import Optional
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup
 from telegram.ext import CallbackContext
 from telegram import Update
@@ -15,302 +17,167 @@ from weather_api import get_weather, get_weather_by_coordinates, get_extended_da
 from handlers.favorites import favorites, handle_favorite_weather, add_favorite, remove_favorite, clear_favorites
 from handlers.notifications import notification_settings, show_my_notifications, add_notification_step1, add_notification_step2
 from handlers.history import history_menu, handle_history_city, clear_history
-from handlers.weather import week_forecast, week_forecast_by_coordinates, show_day_forecast
+from handlers.weather import week_forecast, week_forecast_by_coordinates, show_day_forecast, get_weather_swr
 from handlers.commands import settings
+from handlers.router import CallbackRouter
+from handlers.state import set_state, REGION_LOCATION, REGION_MANUAL, TIMEZONE_NUMBER, NOTIFICATION_TIME
+from payloads import CityPayload, city_callback, parse_city_payload
+from edit_scheduler import edit_scheduler
 from utils import get_utc_offset
 
 logger = logging.getLogger(__name__)
 
+router = CallbackRouter()
+
+# Обработчики из других модулей, которым не нужна сама callback_data
+router.exact("favorites_back")(favorites)
+router.exact("clear_favorites")(clear_favorites)
+router.exact("clear_history")(clear_history)
+router.exact("my_notifications")(show_my_notifications)
+router.exact("add_notification_step1")(add_notification_step1)
+router.exact("settings_back")(settings)
+
 async def button_callback(update: Update, context: CallbackContext):
     """Основной обработчик callback-запросов"""
     query = update.callback_query
     await query.answer()
     data = query.data
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
     logger.info(f"User {user_id} pressed button with data: {data}")
 
-    # Обработка запросов погоды
-    if data.startswith("weather"):
-        await handle_weather_callback(update, context, data)
-        return
-    
-    # Добавление в избранное
-    elif data.startswith("add_favorite:"):
-        _, city_country = data.split(":", 1)
-        city_name, country = city_country.rsplit(":", 1) if ":" in city_country else (city_country, "")
-        await add_favorite(update, context, city_name, country)
-        return
-    
-    # Удаление из избранного
-    elif data.startswith("remove_favorite:"):
-        _, city_country = data.split(":", 1)
-        city_name, country = city_country.rsplit(":", 1) if ":" in city_country else (city_country, "")
-        await remove_favorite(update, context, city_name, country)
-        return
-    
-    # Погода для города из избранного
-    elif data.startswith("fav_"):
-        city_name = data.replace("fav_", "")
-        await handle_favorite_weather(update, context, city_name)
-        return
-    
-    # Назад к избранному
-    elif data == "favorites_back":
-        await favorites(update, context)
-        return
-    
-    # Дополнительные функции
-    elif data == "extra_features":
-        await extra_features_menu(update, context)
-        return
-    
-    # Переключение функций
-    elif data.startswith("toggle_"):
-        feature = data.replace("toggle_", "")
-        UserDataManager.toggle_user_feature(context, user_id, feature)
-        await extra_features_menu(update, context)
-        return
-    
-    # История
-    elif data.startswith("history_"):
-        city_name = data.replace("history_", "")
-        await handle_history_city(update, context, city_name)
-        return
-    
-    elif data == "clear_history":
-        await clear_history(update, context)
-        return
-    
-    # Главное меню
-    elif data == "main_menu":
-        await return_to_main_menu(update, context)
-        return
-    
-    # Уведомления
-    elif data == "my_notifications":
-        await show_my_notifications(update, context)
-        return
-    
-    elif data == "add_notification_step1":
-        await add_notification_step1(update, context)
-        return
-    
-    elif data == "disable_all_notifications":
-        UserDataManager.disable_all_notifications(context, user_id)
-        await show_my_notifications(update, context)
-        return
-    
-    # Поделиться погодой
-    elif data.startswith("share_weather:"):
-        await share_weather(update, context, data)
-        return
-    
-    # Дополнительные данные
-    elif data.startswith("extra_data:"):
-        await handle_extra_data(update, context, data)
-        return
-    
-    # Прогноз на неделю
-    elif data.startswith("week_forecast:"):
-        await handle_week_forecast(update, context, data)
-        return
-    
-    # Подтверждение региона
-    elif data.startswith("confirm_region:"):
-        await handle_confirm_region(update, context, data)
-        return
-    
-    elif data.startswith("confirm_region_yes:"):
-        await handle_confirm_region_yes(update, context, data)
-        return
-    
-    elif data == "region_cancel":
-        if lang == "rus":
-            await query.edit_message_text("❌ Установка региона отменена")
-        else:
-            await query.edit_message_text("❌ Region setup cancelled")
-        return
-    
-    # Настройки языка
-    elif data == "language":
-        await language_menu(update, context)
-        return
-    
-    elif data.startswith("lang_"):
-        await handle_language_change(update, context, data)
-        return
-    
-    # Назад в настройки
-    elif data == "settings_back":
-        await settings(update, context)
-        return
-    
-    # Изменение региона
-    elif data == "change_region":
-        await change_region_menu(update, context)
-        return
-    
-    elif data == "region_back":
-        await change_region_menu(update, context)
-        return
-    
-    elif data == "autodetect_region":
-        await autodetect_region(update, context)
-        return
-    
-    elif data == "autodetect_location_request":
-        await autodetect_region(update, context)
-        return
-    
-    elif data == "manual_set_region":
-        await manual_set_region(update, context)
-        return
-    
-    # Изменение часового пояса
-    elif data == "change_timezone":
-        await change_timezone_menu(update, context)
-        return
-    
-    elif data.startswith("tz_user_"):
-        await handle_timezone_change(update, context, data)
-        return
-    
-    elif data == "manual_timezone_number":
-        await manual_timezone_number(update, context)
-        return
-    
-    # Управление уведомлениями
-    elif data == "tz_add_my":
-        await handle_tz_add_my(update, context)
-        return
-    
-    elif data == "tz_add_list":
-        await tz_add_list(update, context)
-        return
-    
-    elif data.startswith("tz_add_"):
-        await handle_tz_add(update, context, data)
-        return
-    
-    elif data == "manual_time_add":
-        await manual_time_add(update, context)
-        return
-    
-    elif data.startswith("time_add_"):
-        await handle_time_add(update, context, data)
-        return
-    
-    elif data.startswith("edit_notification_"):
-        await edit_notification(update, context, data)
-        return
-    
-    elif data.startswith("delete_notification_"):
-        await delete_notification(update, context, data)
-        return
-    
-    # Настройки давления
-    elif data == "pressure_settings":
-        await pressure_settings_menu(update, context)
-        return
-    
-    elif data in ("pressure_mm", "pressure_hpa"):
-        await handle_pressure_change(update, context, data)
-        return
-    
-    # Прогноз на день
-    elif data.startswith("day_forecast_"):
-        await handle_day_forecast(update, context, data)
-        return
-    
-    # Очистка избранного
-    elif data == "clear_favorites":
-        await clear_favorites(update, context)
-        return
-    
-    # Партнеры
-    elif data == "partners":
-        await partners_menu(update, context)
-        return
-    
-    else:
+    handler = router.resolve(data)
+    if handler is None:
         logger.warning(f"Unknown callback data: {data}")
-        if lang == 'rus':
+        if UserDataManager.get_user_context(context, user_id).lang == 'rus':
             await query.answer("⚠️ Неизвестная команда")
         else:
             await query.answer("⚠️ Unknown command")
+        return
 
+    await handler(update, context, data)
+
+async def resolve_city_payload(update: Update, context: CallbackContext, raw: str) -> Optional[CityPayload]:
+    """Получить город из кнопки; если токен кнопки истёк, сообщить об этом пользователю"""
+    payload = await parse_city_payload(raw)
+    if payload is None:
+        query = update.callback_query
+        if UserDataManager.get_user_context(context, query.from_user.id).lang == "rus":
+            await query.message.reply_text("⌛ Кнопка устарела, запросите погоду заново.")
+        else:
+            await query.message.reply_text("⌛ This button has expired, please request the weather again.")
+    return payload
+
+@router.prefix("add_favorite:")
+async def handle_add_favorite(update: Update, context: CallbackContext, data: str):
+    """Добавление в избранное"""
+    payload = await resolve_city_payload(update, context, data[len("add_favorite:"):])
+    if payload:
+        await add_favorite(update, context, payload.city, payload.country)
+
+@router.prefix("remove_favorite:")
+async def handle_remove_favorite(update: Update, context: CallbackContext, data: str):
+    """Удаление из избранного"""
+    payload = await resolve_city_payload(update, context, data[len("remove_favorite:"):])
+    if payload:
+        await remove_favorite(update, context, payload.city, payload.country)
+
+@router.prefix("fav_")
+async def handle_fav_city(update: Update, context: CallbackContext, data: str):
+    """Погода для города из избранного"""
+    payload = await resolve_city_payload(update, context, data[len("fav_"):])
+    if payload:
+        await handle_favorite_weather(update, context, payload.city)
+
+@router.prefix("toggle_")
+async def handle_toggle_feature(update: Update, context: CallbackContext, data: str):
+    """Переключение функций"""
+    UserDataManager.toggle_user_feature(context, update.callback_query.from_user.id, data.replace("toggle_", ""))
+    await extra_features_menu(update, context)
+
+@router.prefix("history_")
+async def handle_history_callback(update: Update, context: CallbackContext, data: str):
+    """Город из истории"""
+    payload = await resolve_city_payload(update, context, data[len("history_"):])
+    if payload:
+        await handle_history_city(update, context, payload.city)
+
+@router.exact("disable_all_notifications")
+async def handle_disable_all_notifications(update: Update, context: CallbackContext):
+    """Отключить все уведомления"""
+    UserDataManager.disable_all_notifications(context, update.callback_query.from_user.id)
+    await show_my_notifications(update, context)
+
+@router.exact("region_cancel")
+async def handle_region_cancel(update: Update, context: CallbackContext):
+    """Отмена установки региона"""
+    query = update.callback_query
+    if UserDataManager.get_user_context(context, query.from_user.id).lang == "rus":
+        await query.edit_message_text("❌ Установка региона отменена")
+    else:
+        await query.edit_message_text("❌ Region setup cancelled")
+
+@router.prefix("weather")
 async def handle_weather_callback(update: Update, context: CallbackContext, data: str):
     """Обработка запроса погоды"""
     query = update.callback_query
-    user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, query.from_user.id)
+    lang = user.lang
     
-    parts = data.split(":", 1)[1]
-    if "|" in parts:
-        city_name, coords = parts.split("|", 1)
-        lat, lon = map(float, coords.split(",", 1))
-        
-        features = UserDataManager.get_user_features(context, user_id)
-        timezone = UserDataManager.get_user_timezone(context, user_id)
-        pressure_unit = UserDataManager.get_user_pressure_unit(context, user_id)
-        
-        weather_info, weather_text = get_weather_by_coordinates(
-            lat,
-            lon,
-            lang,
-            features,
-            timezone,
-            pressure_unit=pressure_unit
-        )
-    else:
-        city_name = parts
-        features = UserDataManager.get_user_features(context, user_id)
-        timezone = UserDataManager.get_user_timezone(context, user_id)
-        pressure_unit = UserDataManager.get_user_pressure_unit(context, user_id)
-        
-        weather_info, weather_text = get_weather(
-            city_name,
-            lang,
-            features,
-            timezone,
-            pressure_unit=pressure_unit
-        )
-
-    if weather_info:
+    # После 'weather' идёт ':' или '_' (старый формат кнопки из текстового запроса)
+    payload = await resolve_city_payload(update, context, data[len("weather") + 1:])
+    if payload is None:
+        return
+    
+    async def show_weather(weather_info, weather_text):
         actual_city = weather_info["city"]
         country = weather_info.get("country", "")
-        favorites_dict = UserDataManager.get_user_favorites_dict(context, user_id)
-        
-        from user_data import make_favorite_key
-        fav_key = make_favorite_key(actual_city, country)
-        city_in_favorites = fav_key in favorites_dict
-        current_region = UserDataManager.get_user_region(context, user_id)
-        is_current_region = (actual_city.lower() == current_region.lower())
 
         keyboard = create_weather_keyboard(
             actual_city,
-            city_in_favorites,
+            user.is_favorite(actual_city, country),
             lang,
             show_forecast=True,
-            is_current_region=is_current_region,
+            is_current_region=user.is_current_region(actual_city),
             lat=weather_info.get("lat"),
             lon=weather_info.get("lon"),
             country=country,
         )
         await query.edit_message_text(weather_text, reply_markup=keyboard)
+
+    if payload.has_coords:
+        weather_info, weather_text = await get_weather_swr(update, context, show_weather, get_weather_by_coordinates,
+            payload.lat,
+            payload.lon,
+            lang,
+            user.features,
+            user.timezone,
+            pressure_unit=user.pressure_unit
+        )
+    else:
+        weather_info, weather_text = await get_weather_swr(update, context, show_weather, get_weather,
+            payload.city,
+            lang,
+            user.features,
+            user.timezone,
+            pressure_unit=user.pressure_unit
+        )
+
+    if weather_info:
+        await show_weather(weather_info, weather_text)
     else:
         await query.edit_message_text(
             weather_text or ("❌ Не удалось получить погоду." if lang == "rus" else "❌ Failed to get weather.")
         )
 
+@router.exact("extra_features")
 async def extra_features_menu(update: Update, context: CallbackContext):
     """Меню дополнительных функций"""
     query = update.callback_query if hasattr(update, 'callback_query') else None
     user_id = update.effective_user.id if update.message else query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
     
-    features = UserDataManager.get_user_features(context, user_id)
+    features = user.features
     
     if lang == 'rus':
         text = "⚙️ ДОПОЛНИТЕЛЬНЫЕ ФУНКЦИИ\n\n"
@@ -322,15 +189,16 @@ async def extra_features_menu(update: Update, context: CallbackContext):
     keyboard = create_extra_features_keyboard(lang, features)
     
     if query:
-        await query.edit_message_text(text, reply_markup=keyboard)
+        await edit_scheduler.edit(query, text, reply_markup=keyboard)
     else:
         await update.message.reply_text(text, reply_markup=keyboard)
 
+@router.exact("main_menu")
 async def return_to_main_menu(update: Update, context: CallbackContext):
     """Вернуться в главное меню"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
     context.user_data.clear()
     
@@ -342,34 +210,31 @@ async def return_to_main_menu(update: Update, context: CallbackContext):
     else:
         await query.edit_message_text("Main menu", reply_markup=reply_markup)
 
+@router.prefix("share_weather:")
 async def share_weather(update: Update, context: CallbackContext, data: str):
     """Поделиться погодой"""
     query = update.callback_query
-    user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, query.from_user.id)
+    lang = user.lang
+    
+    payload = await resolve_city_payload(update, context, data[len("share_weather:"):])
+    if payload is None:
+        return
     
-    payload = data.split(":", 1)[1]
-    if "|" in payload:
-        city_name, coords = payload.split("|", 1)
-        lat, lon = map(float, coords.split(",", 1))
-        features = UserDataManager.get_user_features(context, user_id)
-        timezone = UserDataManager.get_user_timezone(context, user_id)
-        weather_info, weather_text = get_weather_by_coordinates(
-            lat,
-            lon,
+    if payload.has_coords:
+        weather_info, weather_text = await asyncio.to_thread(get_weather_by_coordinates,
+            payload.lat,
+            payload.lon,
             lang,
-            features,
-            timezone,
+            user.features,
+            user.timezone,
         )
     else:
-        city_name = payload
-        features = UserDataManager.get_user_features(context, user_id)
-        timezone = UserDataManager.get_user_timezone(context, user_id)
-        weather_info, weather_text = get_weather(
-            city_name,
+        weather_info, weather_text = await asyncio.to_thread(get_weather,
+            payload.city,
             lang,
-            features,
-            timezone,
+            user.features,
+            user.timezone,
         )
 
     if not weather_info:
@@ -388,92 +253,81 @@ async def share_weather(update: Update, context: CallbackContext, data: str):
     kb = InlineKeyboardMarkup([[InlineKeyboardButton(button_text, url=url)]])
     await query.message.reply_text(share_text, reply_markup=kb)
 
+@router.prefix("extra_data:")
 async def handle_extra_data(update: Update, context: CallbackContext, data: str):
     """Обработка запроса дополнительных данных"""
     query = update.callback_query
-    user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
-    
-    payload = data.split(":", 1)[1]
+    user = UserDataManager.get_user_context(context, query.from_user.id)
+    lang = user.lang
     
-    # payload: city|lat,lon  или просто city
-    if "|" in payload:
-        city_name, coords = payload.split("|", 1)
-        try:
-            lat, lon = map(float, coords.split(",", 1))
-        except ValueError:
-            lat = lon = None
-    else:
-        city_name = payload
-        lat = lon = None
-
-    features = UserDataManager.get_user_features(context, user_id)
-    timezone = UserDataManager.get_user_timezone(context, user_id)
+    payload = await resolve_city_payload(update, context, data[len("extra_data:"):])
+    if payload is None:
+        return
 
     # Для extra_data нам не нужны координаты, только название города
-    success, extra_text, extended_data = get_extended_data(
-        city_name,  # Передаем только название города
+    success, extra_text, extended_data = await asyncio.to_thread(get_extended_data,
+        payload.city,  # Передаем только название города
         lang,
-        features,
-        timezone,
+        user.features,
+        user.timezone,
     )
 
     if success:
         # Оставляем кнопку «Показать погоду» для этого же города
-        if lat is not None and lon is not None:
-            weather_callback = f"weather:{city_name}|{lat},{lon}"
-        else:
-            weather_callback = f"weather:{city_name}"
-            
         kb = [[InlineKeyboardButton(
             "🌤 Показать погоду" if lang == "rus" else "🌤 Show weather",
-            callback_data=weather_callback
+            callback_data=city_callback("weather:", payload)
         )]]
         await query.edit_message_text(extra_text, reply_markup=InlineKeyboardMarkup(kb))
     else:
         await query.edit_message_text(extra_text)
 
+@router.prefix("week_forecast:")
 async def handle_week_forecast(update: Update, context: CallbackContext, data: str):
     """Обработка запроса недельного прогноза"""
-    payload = data.split(":", 1)[1]
-    if "|" in payload:
-        city_name, coords = payload.split("|", 1)
-        lat, lon = map(float, coords.split(",", 1))
-        await week_forecast_by_coordinates(update, context, lat, lon, city_name)
+    payload = await resolve_city_payload(update, context, data[len("week_forecast:"):])
+    if payload is None:
+        return
+    
+    if payload.has_coords:
+        await week_forecast_by_coordinates(update, context, payload.lat, payload.lon, payload.city)
     else:
-        city_name = payload
-        await week_forecast(update, context, city_name)
+        await week_forecast(update, context, payload.city)
 
+@router.prefix("confirm_region:")
 async def handle_confirm_region(update: Update, context: CallbackContext, data: str):
     """Подтверждение установки региона"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
-    _, city_coords = data.split(":", 1)
-    city_name, coords = city_coords.rsplit(":", 1)
-    lat, lon = map(float, coords.split(","))
+    payload = await resolve_city_payload(update, context, data[len("confirm_region:"):])
+    if payload is None:
+        return
+    city_name = payload.city
 
     # Подтверждение региона
     kb = [[
         InlineKeyboardButton("✅ Да" if lang == "rus" else "✅ Yes",
-                             callback_data=f"confirm_region_yes:{city_name}:{lat},{lon}"),
+                             callback_data=city_callback("confirm_region_yes:", payload)),
         InlineKeyboardButton("❌ Нет" if lang == "rus" else "❌ No",
                              callback_data="region_cancel")
     ]]
     text = f"Установить {city_name} вашим регионом?" if lang == "rus" else f"Set {city_name} as your region?"
     await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb))
 
+@router.prefix("confirm_region_yes:")
 async def handle_confirm_region_yes(update: Update, context: CallbackContext, data: str):
     """Подтверждение установки региона - да"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
     
-    parts = data.replace("confirm_region_yes:", "").split(":")
-    city_name = parts[0]
-    if len(parts) > 1:
-        coords = parts[1]
+    payload = await resolve_city_payload(update, context, data[len("confirm_region_yes:"):])
+    if payload is None:
+        return
+    city_name = payload.city
 
     UserDataManager.set_user_region(context, user_id, city_name)
     await query.answer(
@@ -481,30 +335,21 @@ async def handle_confirm_region_yes(update: Update, context: CallbackContext, da
     )
 
     # Показываем погоду с is_current_region=True
-    features = UserDataManager.get_user_features(context, user_id)
-    timezone = UserDataManager.get_user_timezone(context, user_id)
-    pressure_unit = UserDataManager.get_user_pressure_unit(context, user_id)
-    
-    weather_info, weather_text = get_weather(
+    weather_info, weather_text = await asyncio.to_thread(get_weather,
         city_name,
         lang,
-        features,
-        timezone,
-        pressure_unit=pressure_unit
+        user.features,
+        user.timezone,
+        pressure_unit=user.pressure_unit
     )
 
     if weather_info:
         actual_city = weather_info["city"]
         country = weather_info.get("country", "")
-        favorites_dict = UserDataManager.get_user_favorites_dict(context, user_id)
-        
-        from user_data import make_favorite_key
-        fav_key = make_favorite_key(actual_city, country)
-        city_in_favorites = fav_key in favorites_dict
 
         keyboard = create_weather_keyboard(
             actual_city,
-            city_in_favorites,
+            user.is_favorite(actual_city, country),
             lang,
             show_forecast=True,
             is_current_region=True,
@@ -514,11 +359,12 @@ async def handle_confirm_region_yes(update: Update, context: CallbackContext, da
         )
         await query.edit_message_text(weather_text, reply_markup=keyboard)
 
+@router.exact("language")
 async def language_menu(update: Update, context: CallbackContext):
     """Меню выбора языка"""
     query = update.callback_query if hasattr(update, 'callback_query') else None
     user_id = update.effective_user.id if update.message else query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     if lang == 'rus':
         text = "🌐 Выбор языка"
@@ -532,6 +378,7 @@ async def language_menu(update: Update, context: CallbackContext):
     elif update.callback_query:
         await update.callback_query.edit_message_text(text, reply_markup=keyboard)
 
+@router.prefix("lang_")
 async def handle_language_change(update: Update, context: CallbackContext, data: str):
     """Обработка изменения языка"""
     query = update.callback_query
@@ -548,11 +395,12 @@ async def handle_language_change(update: Update, context: CallbackContext, data:
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         await query.message.reply_text("✅ Language changed to English", reply_markup=reply_markup)
 
+@router.exact("change_region", "region_back")
 async def change_region_menu(update: Update, context: CallbackContext):
     """Меню изменения региона"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     if lang == 'rus':
         text = "📍 Изменение региона\n\nВыберите способ:"
@@ -562,11 +410,12 @@ async def change_region_menu(update: Update, context: CallbackContext):
     keyboard = create_region_setup_keyboard(lang)
     await query.edit_message_text(text, reply_markup=keyboard)
 
+@router.exact("autodetect_region", "autodetect_location_request")
 async def autodetect_region(update: Update, context: CallbackContext):
     """Автоматическое определение региона"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     try:
         if lang == 'rus':
@@ -580,10 +429,7 @@ async def autodetect_region(update: Update, context: CallbackContext):
 
         keyboard = create_location_keyboard(lang)
 
-        context.user_data['awaiting_location'] = True
-        context.user_data['location_for'] = 'region_setup'
-        context.user_data['setting_region'] = True
-        context.user_data['was_setting_region'] = True
+        set_state(context, REGION_LOCATION)
 
         await query.message.reply_text(text, reply_markup=keyboard)
 
@@ -599,14 +445,14 @@ async def autodetect_region(update: Update, context: CallbackContext):
         else:
             await query.message.reply_text("❌ Error detecting region")
 
+@router.exact("manual_set_region")
 async def manual_set_region(update: Update, context: CallbackContext):
     """Ручная установка региона"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
-    context.user_data['setting_region'] = True
-    context.user_data['manual_region_input'] = True
+    set_state(context, REGION_MANUAL)
 
     if lang == 'rus':
         await query.message.reply_text(
@@ -621,11 +467,12 @@ async def manual_set_region(update: Update, context: CallbackContext):
             "Or type /cancel to cancel."
         )
 
+@router.exact("change_timezone")
 async def change_timezone_menu(update: Update, context: CallbackContext):
     """Меню изменения часового пояса"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     if lang == 'rus':
         text = "🕐 Выбор часового пояса\n\n"
@@ -637,11 +484,12 @@ async def change_timezone_menu(update: Update, context: CallbackContext):
     keyboard = create_timezone_keyboard(lang)
     await query.edit_message_text(text, reply_markup=keyboard)
 
+@router.prefix("tz_user_")
 async def handle_timezone_change(update: Update, context: CallbackContext, data: str):
     """Обработка изменения часового пояса"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
     timezone_code = data.split("_", 2)[2]
     timezone_map = {
@@ -674,13 +522,14 @@ async def handle_timezone_change(update: Update, context: CallbackContext, data:
             f"Now sunrise/sunset will be shown in this time."
         )
 
+@router.exact("manual_timezone_number")
 async def manual_timezone_number(update: Update, context: CallbackContext):
     """Ручной ввод часового пояса"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
-    context.user_data['setting_timezone_number'] = True
+    set_state(context, TIMEZONE_NUMBER)
 
     if lang == 'rus':
         await query.message.reply_text(
@@ -707,13 +556,15 @@ async def manual_timezone_number(update: Update, context: CallbackContext):
 
     await query.edit_message_text("⏳ Ожидание ввода числа..." if lang == 'rus' else "⏳ Waiting for number input...")
 
+@router.exact("tz_add_my")
 async def handle_tz_add_my(update: Update, context: CallbackContext):
     """Добавить уведомление с моим часовым поясом"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
     
-    user_tz = UserDataManager.get_user_timezone(context, user_id)
+    user_tz = user.timezone
     
     # Преобразуем в формат timezone string
     if user_tz.startswith("UTC"):
@@ -737,11 +588,12 @@ async def handle_tz_add_my(update: Update, context: CallbackContext):
 
     await add_notification_step2(update, context, timezone_str)
 
+@router.exact("tz_add_list")
 async def tz_add_list(update: Update, context: CallbackContext):
     """Выбор часового пояса из списка"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     if lang == 'rus':
         text = f"🌍 Выбор часового пояса из списка\n\nВыберите часовой пояс:"
@@ -771,6 +623,7 @@ async def tz_add_list(update: Update, context: CallbackContext):
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(text, reply_markup=reply_markup)
 
+@router.prefix("tz_add_")
 async def handle_tz_add(update: Update, context: CallbackContext, data: str):
     """Обработка выбора часового пояса"""
     timezone_code = data.replace("tz_add_", "")
@@ -786,13 +639,14 @@ async def handle_tz_add(update: Update, context: CallbackContext, data: str):
     timezone_str = timezone_map.get(timezone_code, 'Europe/Moscow')
     await add_notification_step2(update, context, timezone_str)
 
+@router.exact("manual_time_add")
 async def manual_time_add(update: Update, context: CallbackContext):
     """Ручной ввод времени уведомления"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
-    context.user_data['action'] = 'add_notification_time'
+    set_state(context, NOTIFICATION_TIME)
     
     if lang == 'rus':
         await query.message.reply_text(
@@ -807,16 +661,18 @@ async def manual_time_add(update: Update, context: CallbackContext):
             "Or type /cancel to cancel"
         )
 
+@router.prefix("time_add_")
 async def handle_time_add(update: Update, context: CallbackContext, data: str):
     """Обработка выбора времени"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
     
     time_code = data.replace("time_add_", "")
 
     if time_code == "manual":
-        context.user_data['action'] = 'add_notification_time'
+        set_state(context, NOTIFICATION_TIME)
 
         if lang == 'rus':
             await query.message.reply_text(
@@ -839,7 +695,7 @@ async def handle_time_add(update: Update, context: CallbackContext, data: str):
             success, result = UserDataManager.add_user_notification(context, user_id, hour, minute, timezone_str)
 
             if success:
-                region = UserDataManager.get_user_region(context, user_id)
+                region = user.region
                 utc_offset = get_utc_offset(timezone_str)
 
                 context.user_data.clear()
@@ -869,14 +725,14 @@ async def handle_time_add(update: Update, context: CallbackContext, data: str):
             else:
                 await query.answer("❌ Уже существует" if lang == 'rus' else "❌ Already exists")
 
+@router.prefix("edit_notification_")
 async def edit_notification(update: Update, context: CallbackContext, data: str):
     """Редактирование уведомления"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
     notification_id = data.replace("edit_notification_", "")
-    context.user_data['editing_notification_id'] = notification_id
 
     notifications = UserDataManager.get_user_notifications(context, user_id)
     notification = None
@@ -911,11 +767,12 @@ async def edit_notification(update: Update, context: CallbackContext, data: str)
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(text, reply_markup=reply_markup)
 
+@router.prefix("delete_notification_")
 async def delete_notification(update: Update, context: CallbackContext, data: str):
     """Удаление уведомления"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
     notification_id = data.replace("delete_notification_", "")
     UserDataManager.remove_user_notification(context, user_id, notification_id)
@@ -927,12 +784,14 @@ async def delete_notification(update: Update, context: CallbackContext, data: st
 
     await show_my_notifications(update, context)
 
+@router.exact("pressure_settings")
 async def pressure_settings_menu(update: Update, context: CallbackContext):
     """Меню настроек давления"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
-    unit = UserDataManager.get_user_pressure_unit(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
+    unit = user.pressure_unit
 
     if lang == "rus":
         text = "🔽 Давление\n\nВыберите единицы измерения:"
@@ -942,16 +801,18 @@ async def pressure_settings_menu(update: Update, context: CallbackContext):
     keyboard = create_pressure_settings_keyboard(lang, unit)
     await query.edit_message_text(text, reply_markup=keyboard)
 
+@router.exact("pressure_mm", "pressure_hpa")
 async def handle_pressure_change(update: Update, context: CallbackContext, data: str):
     """Обработка изменения единиц давления"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
     
     new_unit = "mmhg" if data == "pressure_mm" else "hpa"
     UserDataManager.set_user_pressure_unit(context, user_id, new_unit)
 
-    unit = UserDataManager.get_user_pressure_unit(context, user_id)
+    unit = user.pressure_unit
 
     if lang == "rus":
         text = "🔽 Давление\n\nВыберите единицы измерения:"
@@ -961,18 +822,21 @@ async def handle_pressure_change(update: Update, context: CallbackContext, data:
     keyboard = create_pressure_settings_keyboard(lang, unit)
     await query.edit_message_text(text, reply_markup=keyboard)
 
+@router.prefix("day_forecast_")
 async def handle_day_forecast(update: Update, context: CallbackContext, data: str):
     """Обработка запроса прогноза на день"""
-    parts = data.replace("day_forecast_", "").split("_")
-    city_name = parts[0]
-    day_offset = int(parts[1])
-    await show_day_forecast(update, context, city_name, day_offset)
+    raw, day_offset = data[len("day_forecast_"):].rsplit("_", 1)
+    payload = await resolve_city_payload(update, context, raw)
+    if payload is None:
+        return
+    await show_day_forecast(update, context, payload.city, int(day_offset))
 
+@router.exact("partners")
 async def partners_menu(update: Update, context: CallbackContext):
     """Меню партнеров"""
     query = update.callback_query
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     if lang == 'rus':
         text = "🤝 Партнёры\n\n"
@@ -4,22 +4,16 @@ import logging
 
 from user_data import UserDataManager
 from keyboards import get_main_menu_keyboard, create_settings_keyboard
-from database import init_db
 
 logger = logging.getLogger(__name__)
 
 async def start(update: Update, context: CallbackContext):
     """Обработчик команды /start"""
     user_id = update.effective_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
-
-    # Инициализация БД
-    init_db()
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     # Сбрасываем историю поиска
-    if 'history' not in context.bot_data:
-        context.bot_data['history'] = {}
-    context.bot_data['history'][user_id] = []
+    UserDataManager.clear_user_history(context, user_id)
 
     # Получаем клавиатуру главного меню
     keyboard = get_main_menu_keyboard(lang)
@@ -43,9 +37,10 @@ async def start(update: Update, context: CallbackContext):
 async def settings(update: Update, context: CallbackContext):
     """Обработчик команды /settings"""
     user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
-    region = UserDataManager.get_user_region(context, user_id)
-    features = UserDataManager.get_user_features(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
+    region = user.region
+    features = user.features
 
     if lang == 'rus':
         # Формируем текст для дополнительных функций
@@ -84,7 +79,7 @@ async def settings(update: Update, context: CallbackContext):
 async def cancel(update: Update, context: CallbackContext):
     """Обработчик команды /cancel"""
     user_id = update.effective_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     context.user_data.clear()
 
@@ -96,7 +91,7 @@ async def cancel(update: Update, context: CallbackContext):
 async def help_command(update: Update, context: CallbackContext):
     """Обработчик команды /help"""
     user_id = update.effective_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     if lang == 'rus':
         text = """
@@ -1,19 +1,20 @@
 from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
+import asyncio
 import logging
 
 from user_data import UserDataManager
 from keyboards import create_favorites_keyboard
 from weather_api import get_weather
 from keyboards import create_weather_keyboard
-from user_data import make_favorite_key
+from handlers.weather import get_weather_swr
 
 logger = logging.getLogger(__name__)
 
 async def favorites(update: Update, context: CallbackContext):
     """Показать избранное"""
     user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     favs_dict = UserDataManager.get_user_favorites_dict(context, user_id)
     favorite_cities = list(favs_dict.values())
@@ -43,43 +44,36 @@ async def handle_favorite_weather(update: Update, context: CallbackContext, city
     query = update.callback_query
     await query.answer()
     
-    user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
-    
-    # Получаем настройки пользователя
-    features = UserDataManager.get_user_features(context, user_id)
-    timezone = UserDataManager.get_user_timezone(context, user_id)
-    pressure_unit = UserDataManager.get_user_pressure_unit(context, user_id)
+    user = UserDataManager.get_user_context(context, query.from_user.id)
+    lang = user.lang
     
-    # Получаем погоду
-    weather_info, weather_text = get_weather(
-        city_name,
-        lang,
-        features,
-        timezone,
-        pressure_unit=pressure_unit
-    )
-    
-    if weather_info:
+    async def show_weather(weather_info, weather_text):
         city_name_display = weather_info["city"]
         country = weather_info.get("country", "")
-        favorites_dict = UserDataManager.get_user_favorites_dict(context, user_id)
-        fav_key = make_favorite_key(city_name_display, country)
-        city_in_favorites = fav_key in favorites_dict
-        current_region = UserDataManager.get_user_region(context, user_id)
-        is_current_region = (city_name_display.lower() == current_region.lower())
         
         keyboard = create_weather_keyboard(
             city_name_display,
-            city_in_favorites,
+            user.is_favorite(city_name_display, country),
             lang,
             show_forecast=True,
-            is_current_region=is_current_region,
+            is_current_region=user.is_current_region(city_name_display),
             lat=weather_info.get("lat"),
             lon=weather_info.get("lon"),
             country=country
         )
         await query.edit_message_text(weather_text, reply_markup=keyboard)
+    
+    # Получаем погоду
+    weather_info, weather_text = await get_weather_swr(update, context, show_weather, get_weather,
+        city_name,
+        lang,
+        user.features,
+        user.timezone,
+        pressure_unit=user.pressure_unit
+    )
+    
+    if weather_info:
+        await show_weather(weather_info, weather_text)
     else:
         await query.edit_message_text(weather_text)
 
@@ -89,7 +83,8 @@ async def add_favorite(update: Update, context: CallbackContext, city_name: str,
     await query.answer()
     
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
     
     success = UserDataManager.add_user_favorite(context, user_id, city_name, country)
     
@@ -99,23 +94,18 @@ async def add_favorite(update: Update, context: CallbackContext, city_name: str,
         )
         
         # Обновляем клавиатуру
-        features = UserDataManager.get_user_features(context, user_id)
-        timezone = UserDataManager.get_user_timezone(context, user_id)
-        pressure_unit = UserDataManager.get_user_pressure_unit(context, user_id)
-        
-        weather_info, weather_text = get_weather(
+        weather_info, weather_text = await asyncio.to_thread(get_weather,
             city_name,
             lang,
-            features,
-            timezone,
-            pressure_unit=pressure_unit
+            user.features,
+            user.timezone,
+            pressure_unit=user.pressure_unit
         )
         
         if weather_info:
             actual_city = weather_info["city"]
             country = weather_info.get("country", "")
-            current_region = UserDataManager.get_user_region(context, user_id)
-            is_current_region = (actual_city.lower() == current_region.lower())
+            is_current_region = user.is_current_region(actual_city)
 
             keyboard = create_weather_keyboard(
                 actual_city,
@@ -139,7 +129,8 @@ async def remove_favorite(update: Update, context: CallbackContext, city_name: s
     await query.answer()
     
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
     
     success = UserDataManager.remove_user_favorite(context, user_id, city_name, country)
     
@@ -149,23 +140,18 @@ async def remove_favorite(update: Update, context: CallbackContext, city_name: s
         )
         
         # Обновляем клавиатуру
-        features = UserDataManager.get_user_features(context, user_id)
-        timezone = UserDataManager.get_user_timezone(context, user_id)
-        pressure_unit = UserDataManager.get_user_pressure_unit(context, user_id)
-        
-        weather_info, weather_text = get_weather(
+        weather_info, weather_text = await asyncio.to_thread(get_weather,
             city_name,
             lang,
-            features,
-            timezone,
-            pressure_unit=pressure_unit
+            user.features,
+            user.timezone,
+            pressure_unit=user.pressure_unit
         )
         
         if weather_info:
             actual_city = weather_info["city"]
             country = weather_info.get("country", "")
-            current_region = UserDataManager.get_user_region(context, user_id)
-            is_current_region = (actual_city.lower() == current_region.lower())
+            is_current_region = user.is_current_region(actual_city)
 
             keyboard = create_weather_keyboard(
                 actual_city,
@@ -189,7 +175,7 @@ async def clear_favorites(update: Update, context: CallbackContext):
     await query.answer()
     
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
     UserDataManager.clear_user_favorites(context, user_id)
     
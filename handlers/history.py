@@ -5,15 +5,17 @@ import logging
 from user_data import UserDataManager
 from weather_api import get_weather
 from keyboards import create_weather_keyboard
-from user_data import make_favorite_key
+from handlers.weather import get_weather_swr
+from payloads import CityPayload, city_callback
 
 logger = logging.getLogger(__name__)
 
 async def history_menu(update: Update, context: CallbackContext):
     """Меню истории поиска"""
     user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
+    await UserDataManager.load_user_history(context, user_id)
     history = UserDataManager.get_user_history(context, user_id)
     
     if not history:
@@ -32,7 +34,7 @@ async def history_menu(update: Update, context: CallbackContext):
         keyboard = []
         for i, city in enumerate(history, 1):
             keyboard.append([
-                InlineKeyboardButton(f"{i}. {city}", callback_data=f"history_{city}")
+                InlineKeyboardButton(f"{i}. {city}", callback_data=city_callback("history_", CityPayload(city)))
             ])
     
     # Добавляем кнопку очистки
@@ -59,42 +61,36 @@ async def handle_history_city(update: Update, context: CallbackContext, city_nam
     query = update.callback_query
     await query.answer()
     
-    user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
-    
-    # Получаем погоду для выбранного города
-    features = UserDataManager.get_user_features(context, user_id)
-    timezone = UserDataManager.get_user_timezone(context, user_id)
-    pressure_unit = UserDataManager.get_user_pressure_unit(context, user_id)
-    
-    weather_info, weather_text = get_weather(
-        city_name,
-        lang,
-        features,
-        timezone,
-        pressure_unit=pressure_unit
-    )
+    user = UserDataManager.get_user_context(context, query.from_user.id)
+    lang = user.lang
     
-    if weather_info:
+    async def show_weather(weather_info, weather_text):
         city_name_display = weather_info["city"]
         country = weather_info.get("country", "")
-        favorites_dict = UserDataManager.get_user_favorites_dict(context, user_id)
-        fav_key = make_favorite_key(city_name_display, country)
-        city_in_favorites = fav_key in favorites_dict
-        current_region = UserDataManager.get_user_region(context, user_id)
-        is_current_region = (city_name_display.lower() == current_region.lower())
         
         keyboard = create_weather_keyboard(
             city_name_display,
-            city_in_favorites,
+            user.is_favorite(city_name_display, country),
             lang,
             show_forecast=True,
-            is_current_region=is_current_region,
+            is_current_region=user.is_current_region(city_name_display),
             lat=weather_info.get("lat"),
             lon=weather_info.get("lon"),
             country=country
         )
         await query.edit_message_text(weather_text, reply_markup=keyboard)
+    
+    # Получаем погоду для выбранного города
+    weather_info, weather_text = await get_weather_swr(update, context, show_weather, get_weather,
+        city_name,
+        lang,
+        user.features,
+        user.timezone,
+        pressure_unit=user.pressure_unit
+    )
+    
+    if weather_info:
+        await show_weather(weather_info, weather_text)
     else:
         await query.edit_message_text(weather_text)
 
@@ -104,7 +100,7 @@ async def clear_history(update: Update, context: CallbackContext):
     await query.answer()
     
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
     UserDataManager.clear_user_history(context, user_id)
     
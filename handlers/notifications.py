@@ -1,20 +1,24 @@
+import asyncio
 import logging
 from datetime import time
 from telegram import Update, InlineKeyboardMarkup
-from telegram.ext import CallbackContext
+from telegram.ext import Application, CallbackContext
 
 from user_data import UserDataManager
 from keyboards import create_notification_time_keyboard
 from weather_api import get_weather
-from utils import get_utc_offset
+from utils import get_utc_offset, get_next_fire_utc
+from database import update_next_fire_db
+from sharding import owns_user
 
 logger = logging.getLogger(__name__)
 
 async def notification_settings(update: Update, context: CallbackContext):
     """Настройки уведомлений"""
     user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
-    region = UserDataManager.get_user_region(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
+    region = user.region
     notifications = UserDataManager.get_user_notifications(context, user_id)
     has_notifications = len(notifications) > 0
 
@@ -73,7 +77,7 @@ async def show_my_notifications(update: Update, context: CallbackContext):
     """Показать мои уведомления"""
     query = update.callback_query if hasattr(update, 'callback_query') else None
     user_id = update.effective_user.id if update.message else query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     notifications = UserDataManager.get_user_notifications(context, user_id)
 
     if notifications:
@@ -116,7 +120,8 @@ async def add_notification_step1(update: Update, context: CallbackContext):
     """Первый шаг добавления уведомления"""
     query = update.callback_query if hasattr(update, 'callback_query') else None
     user_id = query.from_user.id if query else update.effective_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
     
     notifications = UserDataManager.get_user_notifications(context, user_id)
     
@@ -133,8 +138,8 @@ async def add_notification_step1(update: Update, context: CallbackContext):
             await update.message.reply_text(text)
         return
 
-    region = UserDataManager.get_user_region(context, user_id)
-    user_tz = UserDataManager.get_user_timezone(context, user_id)
+    region = user.region
+    user_tz = user.timezone
 
     if lang == 'rus':
         text = f"🔔 Добавление уведомления\n\n📍 Регион: {region}\n\nШаг 1: Выберите часовой пояс"
@@ -166,36 +171,22 @@ async def add_notification_step2(update: Update, context: CallbackContext, timez
     """Второй шаг добавления уведомления - выбор времени"""
     query = update.callback_query if hasattr(update, 'callback_query') else None
     user_id = update.effective_user.id if update.message else query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
 
     context.user_data['temp_timezone'] = timezone_str
     utc_offset = get_utc_offset(timezone_str)
 
-    # Проверяем, редактируем ли мы существующее уведомление
-    editing_notification_id = context.user_data.get('editing_notification_id')
-    action = context.user_data.get('action')
-    is_editing_mode = editing_notification_id and action == 'change_timezone'
-
     if lang == 'rus':
-        if is_editing_mode:
-            text = f"🕐 Часовой пояс выбран: {utc_offset}\n\n"
-            text += f"Теперь выберите новое время для уведомления:"
-        else:
-            text = f"🕐 Часовой пояс установлен: {utc_offset}\n\n"
-            text += f"Шаг 2: Выберите время уведомления\n\n"
-            text += f"📍 Регион: {UserDataManager.get_user_region(context, user_id)}"
-        
-        keyboard = create_notification_time_keyboard(lang)
+        text = f"🕐 Часовой пояс установлен: {utc_offset}\n\n"
+        text += f"Шаг 2: Выберите время уведомления\n\n"
+        text += f"📍 Регион: {user.region}"
     else:
-        if is_editing_mode:
-            text = f"🕐 Timezone selected: {utc_offset}\n\n"
-            text += f"Now choose new time for notification:"
-        else:
-            text = f"🕐 Timezone set: {utc_offset}\n\n"
-            text += f"Step 2: Choose notification time\n\n"
-            text += f"📍 Region: {UserDataManager.get_user_region(context, user_id)}"
-        
-        keyboard = create_notification_time_keyboard(lang)
+        text = f"🕐 Timezone set: {utc_offset}\n\n"
+        text += f"Step 2: Choose notification time\n\n"
+        text += f"📍 Region: {user.region}"
+
+    keyboard = create_notification_time_keyboard(lang)
 
     if update.message:
         await update.message.reply_text(text, reply_markup=keyboard)
@@ -213,11 +204,15 @@ async def send_daily_notification(context: CallbackContext):
         return
 
     try:
-        lang = UserDataManager.get_user_lang(context, user_id) or 'rus'
-        features = UserDataManager.get_user_features(context, user_id)
+        await UserDataManager.load_user(context, user_id)
+        # Профиль закрепляется за контекстом задачи и не потеряется, если его вытеснят из кэша
+        user = UserDataManager.get_user_context(context, user_id)
+        lang = user.lang or 'rus'
+        features = user.features
         logger.info(f"Отправка уведомления user {user_id}, features={features}")
     except Exception as e:
         logger.error(f"Ошибка получения данных для user {user_id}: {e}")
+        user = UserDataManager.get_user_context(context, user_id)
         lang = 'rus'
         features = None
 
@@ -228,12 +223,12 @@ async def send_daily_notification(context: CallbackContext):
             try:
                 # Используем дополнительные функции пользователя
                 from weather_api import get_weather
-                weather_info, weather_text = get_weather(
+                weather_info, weather_text = await asyncio.to_thread(get_weather,
                     region, 
                     lang, 
                     features,
-                    UserDataManager.get_user_timezone(context, user_id),
-                    pressure_unit=UserDataManager.get_user_pressure_unit(context, user_id)
+                    user.timezone,
+                    pressure_unit=user.pressure_unit
                 )
                 if weather_info:
                     await context.bot.send_message(
@@ -241,12 +236,33 @@ async def send_daily_notification(context: CallbackContext):
                         text=f"🔔 {region}\n\n{weather_text}"
                     )
                     logger.info(f"Уведомление отправлено пользователю {user_id} для региона {region}")
+                    # Обновляем в БД только время следующего срабатывания этого уведомления
+                    update_next_fire_db(user_id, notification_id, get_next_fire_utc(
+                        notification['hour'], notification['minute'], notification['timezone']))
                 else:
                     logger.error(f"Не удалось получить погоду для региона {region}, пользователь {user_id}")
             except Exception as e:
                 logger.error(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
             break
 
+def restore_notification_jobs(application: Application):
+    """Восстановить задачи уведомлений из БД при запуске бота"""
+    from database import load_all_notifications_db
+
+    context = CallbackContext(application)
+    notifications_by_user = load_all_notifications_db()
+    count = 0
+
+    for user_id, notifications in notifications_by_user.items():
+        # В режиме 'sharded' каждый рабочий процесс планирует уведомления только своих пользователей
+        if not owns_user(application.bot_data, user_id):
+            continue
+        for notification in notifications:
+            create_notification_job(context, user_id, notification)
+            count += 1
+
+    logger.info(f"Восстановлено задач уведомлений: {count}")
+
 def create_notification_job(context: CallbackContext, user_id: int, notification):
     """Создать задачу уведомления"""
     job_queue = context.application.job_queue
@@ -0,0 +1,17 @@
+import logging
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from user_data import UserDataManager
+
+logger = logging.getLogger(__name__)
+
+async def preload_user_data(update: Update, context: CallbackContext):
+    """Подгрузить данные пользователя до запуска основных обработчиков"""
+    user = update.effective_user
+    if user:
+        await UserDataManager.load_user(context, user.id)
+        # Контекст апдейта общий для всех групп обработчиков, поэтому данные находятся один раз
+        UserDataManager.get_user_context(context, user.id)
+        # По нему фоновые обновления понимают, что пользователь уже перешёл к другому действию
+        context.user_data['last_update_id'] = update.update_id
\ No newline at end of file
@@ -0,0 +1,111 @@
+import inspect
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Обработчик всегда вызывается как handler(update, context, data)
+RouteHandler = Callable[..., Awaitable]
+
+class _Node:
+    """Узел сжатого дерева префиксов: рёбра подписаны строками, по первому символу ищется ребро"""
+
+    __slots__ = ('handler', 'edges')
+
+    def __init__(self):
+        self.handler: Optional[RouteHandler] = None
+        self.edges: Dict[str, tuple] = {}
+
+class CallbackRouter:
+    """Маршрутизация callback_data: точное совпадение по словарю, иначе самый длинный префикс по дереву"""
+
+    def __init__(self):
+        self._exact: Dict[str, RouteHandler] = {}
+        self._root = _Node()
+
+    @staticmethod
+    def _wrap(func) -> RouteHandler:
+        """Привести обработчик к виду handler(update, context, data)"""
+        if len(inspect.signature(func).parameters) >= 3:
+            return func
+
+        async def handler(update, context, data):
+            return await func(update, context)
+
+        return handler
+
+    def exact(self, *keys: str):
+        """Декоратор: обработчик для callback_data, совпадающих с одним из ключей"""
+        def decorator(func):
+            handler = self._wrap(func)
+            for key in keys:
+                if key in self._exact:
+                    raise ValueError(f"Маршрут {key!r} уже зарегистрирован")
+                self._exact[key] = handler
+            return func
+
+        return decorator
+
+    def prefix(self, *prefixes: str):
+        """Декоратор: обработчик для callback_data, начинающихся с одного из префиксов"""
+        def decorator(func):
+            handler = self._wrap(func)
+            for prefix in prefixes:
+                node = self._insert(prefix)
+                if node.handler is not None:
+                    raise ValueError(f"Префикс {prefix!r} уже зарегистрирован")
+                node.handler = handler
+            return func
+
+        return decorator
+
+    def _insert(self, prefix: str) -> _Node:
+        """Найти или создать узел для префикса, при необходимости разделив ребро"""
+        node = self._root
+        pos = 0
+
+        while pos < len(prefix):
+            edge = node.edges.get(prefix[pos])
+            if edge is None:
+                child = _Node()
+                node.edges[prefix[pos]] = (prefix[pos:], child)
+                return child
+
+            label, child = edge
+            common = 0
+            while common < len(label) and pos + common < len(prefix) and label[common] == prefix[pos + common]:
+                common += 1
+
+            if common < len(label):
+                middle = _Node()
+                middle.edges[label[common]] = (label[common:], child)
+                node.edges[prefix[pos]] = (label[:common], middle)
+                child = middle
+
+            node = child
+            pos += common
+
+        return node
+
+    def resolve(self, data: str) -> Optional[RouteHandler]:
+        """Найти обработчик: сначала точное совпадение, затем самый длинный подходящий префикс"""
+        handler = self._exact.get(data)
+        if handler is not None:
+            return handler
+
+        node = self._root
+        pos = 0
+        length = len(data)
+
+        while pos < length:
+            edge = node.edges.get(data[pos])
+            if edge is None:
+                break
+            label, node = edge
+            if not data.startswith(label, pos):
+                break
+            pos += len(label)
+            if node.handler is not None:
+                handler = node.handler
+
+        return handler
\ No newline at end of file
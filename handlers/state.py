@@ -0,0 +1,31 @@
+from typing import Optional
+
+from telegram.ext import CallbackContext
+
+# Состояние диалога хранится в context.user_data['state']; отсутствие ключа — обычный режим
+STATE_KEY = 'state'
+
+# Ручной ввод города региона
+REGION_MANUAL = 'region_manual'
+# Ожидание геолокации для установки региона
+REGION_LOCATION = 'region_location'
+# Ожидание геолокации для показа погоды
+WEATHER_LOCATION = 'weather_location'
+# Ожидание геолокации для определения часового пояса
+TIMEZONE_LOCATION = 'timezone_location'
+# Ввод часового пояса числом
+TIMEZONE_NUMBER = 'timezone_number'
+# Ввод времени нового уведомления
+NOTIFICATION_TIME = 'notification_time'
+
+def get_state(context: CallbackContext) -> Optional[str]:
+    """Текущее состояние диалога пользователя"""
+    return context.user_data.get(STATE_KEY)
+
+def set_state(context: CallbackContext, state: str):
+    """Перевести пользователя в состояние диалога"""
+    context.user_data[STATE_KEY] = state
+
+def reset_state(context: CallbackContext):
+    """Вернуть пользователя в обычный режим, не трогая остальные данные"""
+    context.user_data.pop(STATE_KEY, None)
\ No newline at end of file
@@ -1,51 +1,98 @@
 from telegram import Update, InlineKeyboardButton
 from telegram.ext import CallbackContext
+import asyncio
 import logging
+from typing import Dict
 
 from user_data import UserDataManager
-from weather_api import get_weather, get_forecast, get_daily_forecast, get_extended_data
+from weather_api import get_weather, get_forecast, get_daily_forecast, get_extended_data, shared_cache_enabled
 from keyboards import create_weather_keyboard, create_forecast_keyboard
 from utils import normalize_city_name
+from payloads import CityPayload, city_callback
+from config import WEATHER_STALE_MAX_MINUTES
+from forecast_store import Forecast, forecast_store, forecast_key
+from locations import geolocation_key
+from edit_scheduler import edit_scheduler
 
 logger = logging.getLogger(__name__)
 
+# (функция, ключ кэша) → фоновый запрос свежей погоды; повторные нажатия ждут уже идущий запрос
+_revalidations: Dict[tuple, asyncio.Future] = {}
+
+def _revalidation(func, *args, **kwargs) -> asyncio.Future:
+    """Фоновый запрос свежей погоды: один на запись кэша, сколько бы раз её ни показали"""
+    key = (func.__name__, func.cache_key(*args, **kwargs))
+    fetch = _revalidations.get(key)
+    if fetch is None:
+        fetch = _revalidations[key] = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        fetch.add_done_callback(lambda _: _revalidations.pop(key, None))
+    return fetch
+
+async def get_weather_swr(update: Update, context: CallbackContext, on_refresh, func, *args, **kwargs):
+    """Погода из кэша без ожидания, даже устаревшая; устаревшая обновляется в фоне и передаётся в on_refresh"""
+    cached = func.peek_local(*args, **kwargs)
+    if (cached is None or cached[0] >= func.ttl_seconds) and shared_cache_enabled():
+        # Свежей записи в памяти нет — общий кэш процессов читаем в рабочем потоке
+        cached = await asyncio.to_thread(func.peek, *args, **kwargs)
+    if cached is not None:
+        age, (weather_info, weather_text) = cached
+        if age < func.ttl_seconds:
+            return weather_info, weather_text
+
+        if weather_info and age < WEATHER_STALE_MAX_MINUTES * 60:
+            context.application.create_task(
+                _revalidate_weather(update, context, on_refresh, _revalidation(func, *args, **kwargs)),
+                update=update
+            )
+            minutes = int(age // 60)
+            if UserDataManager.get_user_context(context, update.effective_user.id).lang == 'rus':
+                note = f"\n\n🕒 Данные получены {minutes} мин назад"
+            else:
+                note = f"\n\n🕒 Data fetched {minutes} min ago"
+            return weather_info, weather_text + note
+
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+async def _revalidate_weather(update: Update, context: CallbackContext, on_refresh, fetch: asyncio.Future):
+    """Дождаться свежей погоды и обновить сообщение; даже если данные не изменились, пометка о возрасте убирается"""
+    # Запрос общий для всех нажатий, отмена одного обновления не должна его прерывать
+    weather_info, weather_text = await asyncio.shield(fetch)
+    if not weather_info:
+        return
+
+    # Пока шёл запрос, пользователь мог нажать что-то ещё — тогда сообщение уже не наше
+    if context.user_data.get('last_update_id') != update.update_id:
+        return
+
+    await on_refresh(weather_info, weather_text)
+
 async def get_weather_for_region(update: Update, context: CallbackContext):
     """Получить погоду для региона пользователя"""
-    user_id = update.effective_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
-    region = UserDataManager.get_user_region(context, user_id)
+    user = UserDataManager.get_user_context(context, update.effective_user.id)
+    lang = user.lang
+    region = user.region
 
     if region == 'Moscow':
         # Регион не установлен
         await handle_region_not_set(update, context)
         return
     
-    # Получаем настройки пользователя
-    features = UserDataManager.get_user_features(context, user_id)
-    timezone = UserDataManager.get_user_timezone(context, user_id)
-    pressure_unit = UserDataManager.get_user_pressure_unit(context, user_id)
-    
     # Получаем погоду для региона
-    weather_info, weather_text = get_weather(
+    weather_info, weather_text = await asyncio.to_thread(get_weather,
         region,
         lang,
-        features,
-        timezone,
-        pressure_unit=pressure_unit
+        user.features,
+        user.timezone,
+        pressure_unit=user.pressure_unit
     )
     
     if weather_info:
         city_name = weather_info['city']
         country = weather_info.get('country', '')
-        favs_dict = UserDataManager.get_user_favorites_dict(context, user_id)
-        
-        from user_data import make_favorite_key
-        fav_key = make_favorite_key(city_name, country)
-        city_in_favorites = fav_key in favs_dict
 
         keyboard = create_weather_keyboard(
             city_name,
-            city_in_favorites,
+            user.is_favorite(city_name, country),
             lang,
             show_forecast=True,
             is_current_region=True,
@@ -64,10 +111,8 @@ async def get_weather_for_region(update: Update, context: CallbackContext):
 async def handle_region_not_set(update: Update, context: CallbackContext):
     """Обработка случая, когда регион не установлен"""
     user_id = update.effective_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
     
-    context.user_data['setting_region'] = True
-
     if lang == 'rus':
         text = "📍 Регион не установлен\n\n"
         text += "Для начала установите свой регион, чтобы получать актуальную погоду.\n\n"
@@ -106,17 +151,18 @@ async def week_forecast(update: Update, context: CallbackContext, city_name: str
             callback_query=FakeCallback(
                 update.effective_user.id,
                 update.message,
-                f"week_forecast:{city_name}"
+                city_callback("week_forecast:", CityPayload(city_name))
             )
         )
         await button_callback(fake_update, context)
         return
     
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    user = UserDataManager.get_user_context(context, user_id)
+    lang = user.lang
 
     if not city_name:
-        region = UserDataManager.get_user_region(context, user_id)
+        region = user.region
         city_name = region
 
     if lang == 'rus':
@@ -126,28 +172,33 @@ async def week_forecast(update: Update, context: CallbackContext, city_name: str
 
     await query.edit_message_text(text)
 
-    city_name_api, forecast_list, error = get_forecast(city_name, lang)
+    key = forecast_key(city_name, lang)
+    forecast = forecast_store.get(key)
 
-    if error:
-        await query.message.reply_text(error)
-        return
+    if forecast is None:
+        forecast, error = await asyncio.to_thread(get_forecast, city_name, lang)
 
-    if not forecast_list:
-        error_msg = "❌ Не удалось получить прогноз." if lang == 'rus' else "❌ Failed to get forecast."
-        await query.message.reply_text(error_msg)
-        return
+        if error:
+            await query.message.reply_text(error)
+            return
 
-    context.user_data['forecast_data'] = {
-        'city': city_name_api,
-        'forecast_list': forecast_list
-    }
+        if not forecast or not forecast.days:
+            error_msg = "❌ Не удалось получить прогноз." if lang == 'rus' else "❌ Failed to get forecast."
+            await query.message.reply_text(error_msg)
+            return
+
+        forecast_store.put([key, forecast_key(forecast.city, lang)], forecast)
+
+    # У пользователя только ссылка на общий прогноз
+    context.user_data['forecast_key'] = key
+    city_name_api = forecast.city
 
     if lang == 'rus':
         text = f"📅 Прогноз погоды в городе {city_name_api}\n\nВыберите день:"
     else:
         text = f"📅 Weather forecast in {city_name_api}\n\nChoose day:"
 
-    keyboard = create_forecast_keyboard(lang, city_name_api)
+    keyboard = create_forecast_keyboard(lang, city_name_api, forecast.utc_offset)
     await query.message.reply_text(text, reply_markup=keyboard)
 
 async def week_forecast_by_coordinates(update: Update, context: CallbackContext, lat: float, lon: float,
@@ -157,7 +208,7 @@ async def week_forecast_by_coordinates(update: Update, context: CallbackContext,
     await query.answer()
 
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
+    lang = UserDataManager.get_user_context(context, user_id).lang
 
     if lang == 'rus':
         text = f"⏳ Загружаю прогноз погоды для координат {lat:.4f}, {lon:.4f}..."
@@ -166,6 +217,20 @@ async def week_forecast_by_coordinates(update: Update, context: CallbackContext,
 
     await query.edit_message_text(text)
 
+    key = forecast_key(geolocation_key(lat, lon), lang)
+    forecast = forecast_store.get(key)
+    if forecast is not None:
+        context.user_data['forecast_key'] = key
+
+        if lang == 'rus':
+            text = f"📅 Прогноз погоды в городе {forecast.city}\n\nВыберите день:"
+        else:
+            text = f"📅 Weather forecast in {forecast.city}\n\nChoose day:"
+
+        keyboard = create_forecast_keyboard(lang, forecast.city, forecast.utc_offset)
+        await query.message.reply_text(text, reply_markup=keyboard)
+        return
+
     url = 'https://api.openweathermap.org/data/2.5/forecast'
     from config import WEATHER_TOKEN
     params = {
@@ -179,27 +244,24 @@ async def week_forecast_by_coordinates(update: Update, context: CallbackContext,
 
     try:
         import requests
-        response = requests.get(url, params=params, timeout=10)
+        response = await asyncio.to_thread(requests.get, url, params=params, timeout=10)
         if response.status_code != 200:
             error_msg = "❌ Не удалось получить прогноз." if lang == 'rus' else "❌ Failed to get forecast."
             await query.message.reply_text(error_msg)
             return
 
-        data = response.json()
-        city_name_api = data['city']['name']
-        forecast_list = data['list']
+        forecast = Forecast.from_api(response.json())
+        city_name_api = forecast.city
 
-        context.user_data['forecast_data'] = {
-            'city': city_name_api,
-            'forecast_list': forecast_list
-        }
+        forecast_store.put([key, forecast_key(city_name_api, lang)], forecast)
+        context.user_data['forecast_key'] = key
 
         if lang == 'rus':
             text = f"📅 Прогноз погоды в городе {city_name_api}\n\nВыберите день:"
         else:
             text = f"📅 Weather forecast in {city_name_api}\n\nChoose day:"
 
-        keyboard = create_forecast_keyboard(lang, city_name_api)
+        keyboard = create_forecast_keyboard(lang, city_name_api, forecast.utc_offset)
         await query.message.reply_text(text, reply_markup=keyboard)
 
     except Exception as e:
@@ -213,19 +275,25 @@ async def show_day_forecast(update: Update, context: CallbackContext, city_name:
     await query.answer()
 
     user_id = query.from_user.id
-    lang = UserDataManager.get_user_lang(context, user_id)
-
-    forecast_data = context.user_data.get('forecast_data')
-
-    if not forecast_data:
-        if lang == 'rus':
-            await query.answer("❌ Данные прогноза не найдены")
-        else:
-            await query.answer("❌ Forecast data not found")
-        return
+    lang = UserDataManager.get_user_context(context, user_id).lang
+
+    # Сначала прогноз по ссылке пользователя, затем общий прогноз города с кнопки
+    forecast = forecast_store.get(context.user_data.get('forecast_key'))
+    if forecast is None or forecast.city != city_name:
+        forecast = forecast_store.get(forecast_key(city_name, lang))
+
+    if forecast is None:
+        # Прогноз уже вытеснен из хранилища — запрашиваем заново
+        forecast, error = await asyncio.to_thread(get_forecast, city_name, lang)
+        if error or not forecast or not forecast.days:
+            if lang == 'rus':
+                await query.answer("❌ Данные прогноза не найдены")
+            else:
+                await query.answer("❌ Forecast data not found")
+            return
+        forecast_store.put([forecast_key(city_name, lang), forecast_key(forecast.city, lang)], forecast)
 
-    forecast_list = forecast_data['forecast_list']
-    day_forecast = get_daily_forecast(forecast_list, day_offset)
+    day_forecast = get_daily_forecast(forecast, day_offset)
 
     if not day_forecast:
         if lang == 'rus':
@@ -254,8 +322,8 @@ async def show_day_forecast(update: Update, context: CallbackContext, city_name:
         text += f"💨 Wind speed: {day_forecast['wind_speed']} m/s"
 
     keyboard = [[InlineKeyboardButton("◀️ К выбору дней" if lang == 'rus' else "◀️ Back to days",
-                                      callback_data=f"week_forecast:{city_name}")]]
+                                      callback_data=city_callback("week_forecast:", CityPayload(city_name)))]]
     from telegram import InlineKeyboardMarkup
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    await query.edit_message_text(text, reply_markup=reply_markup)
\ No newline at end of file
+    await edit_scheduler.edit(query, text, reply_markup=reply_markup)
\ No newline at end of file
@@ -1,12 +1,18 @@
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from typing import List, Optional
 
+from payloads import CityPayload, city_callback
+from forecast_store import local_now
+
 def create_weather_keyboard(city_name: str, in_favorites: bool, lang: str,
                            show_forecast: bool = True, is_current_region: bool = False,
                            lat: float = None, lon: float = None, country: str = "") -> InlineKeyboardMarkup:
     """Создание клавиатуры для погоды с динамическими кнопками"""
     keyboard = []
     
+    # Город и координаты передаются коротким токеном, а не строкой в callback_data
+    payload = CityPayload(city_name, country or "", lat, lon)
+    
     # Кнопка избранного и установки региона в одном ряду
     region_row = []
     
@@ -14,57 +20,41 @@ def create_weather_keyboard(city_name: str, in_favorites: bool, lang: str,
     if in_favorites:
         region_row.append(InlineKeyboardButton(
             "❌ Удалить из избранного" if lang == "rus" else "❌ Remove from favorites",
-            callback_data=f"remove_favorite:{city_name}:{country}"
+            callback_data=city_callback("remove_favorite:", payload)
         ))
     else:
         region_row.append(InlineKeyboardButton(
             "⭐ Добавить в избранное" if lang == "rus" else "⭐ Add to favorites",
-            callback_data=f"add_favorite:{city_name}:{country}"
+            callback_data=city_callback("add_favorite:", payload)
         ))
     
     # Кнопка "Сделать моим регионом" только если не текущий регион
     if not is_current_region and lat is not None and lon is not None:
         region_row.append(InlineKeyboardButton(
             "🌍 Сделать моим регионом" if lang == "rus" else "🌍 Set as my region",
-            callback_data=f"confirm_region:{city_name}:{lat},{lon}"
+            callback_data=city_callback("confirm_region:", payload)
         ))
     
     if region_row:
         keyboard.append(region_row)
 
-    # ✅ Прогноз + Доп. данные (всегда, если координаты есть)
-    if lat is not None and lon is not None:
-        forecast_row = []
-        if show_forecast:
-            forecast_row.append(InlineKeyboardButton(
-                "📅 Прогноз на 5 дней" if lang == "rus" else "📅 5-Day Forecast",
-                callback_data=f"week_forecast:{city_name}|{lat},{lon}"
-            ))
-        forecast_row.append(InlineKeyboardButton(
-            "📊 Доп. данные" if lang == "rus" else "📊 Extra Data",
-            callback_data=f"extra_data:{city_name}|{lat},{lon}"
-        ))
-        if forecast_row:
-            keyboard.append(forecast_row)
-    else:
-        # Если координат нет, используем только название города
-        forecast_row = []
-        if show_forecast:
-            forecast_row.append(InlineKeyboardButton(
-                "📅 Прогноз на 5 дней" if lang == "rus" else "📅 5-Day Forecast",
-                callback_data=f"week_forecast:{city_name}"
-            ))
+    # Прогноз + Доп. данные (по координатам, если они есть, иначе по названию города)
+    forecast_row = []
+    if show_forecast:
         forecast_row.append(InlineKeyboardButton(
-            "📊 Доп. данные" if lang == "rus" else "📊 Extra Data",
-            callback_data=f"extra_data:{city_name}"
+            "📅 Прогноз на 5 дней" if lang == "rus" else "📅 5-Day Forecast",
+            callback_data=city_callback("week_forecast:", payload)
         ))
-        if forecast_row:
-            keyboard.append(forecast_row)
+    forecast_row.append(InlineKeyboardButton(
+        "📊 Доп. данные" if lang == "rus" else "📊 Extra Data",
+        callback_data=city_callback("extra_data:", payload)
+    ))
+    keyboard.append(forecast_row)
 
     # Поделиться + Назад
     keyboard.append([InlineKeyboardButton(
         "📤 Поделиться" if lang == "rus" else "📤 Share",
-        callback_data=f"share_weather:{city_name}"
+        callback_data=city_callback("share_weather:", payload)
     )])
     keyboard.append([InlineKeyboardButton(
         "◀️ Назад" if lang == "rus" else "◀️ Back",
@@ -263,11 +253,11 @@ def create_favorites_keyboard(lang: str, favorites_dict: dict) -> InlineKeyboard
     for key, city in favorites_dict.items():
         city_name = city
         country = key.split("|", 1)[1] if "|" in key else ""
-        fav_payload = f"{city_name}|{country}" if country else city_name
+        payload = CityPayload(city_name, country)
 
         keyboard.append([
-            InlineKeyboardButton(f"🌤 {city_name}", callback_data=f"fav_{city_name}"),
-            InlineKeyboardButton("❌", callback_data=f"remove_favorite:{fav_payload}"),
+            InlineKeyboardButton(f"🌤 {city_name}", callback_data=city_callback("fav_", payload)),
+            InlineKeyboardButton("❌", callback_data=city_callback("remove_favorite:", payload)),
         ])
 
     if favorites_dict:
@@ -317,16 +307,17 @@ def create_notification_time_keyboard(lang: str) -> InlineKeyboardMarkup:
     
     return InlineKeyboardMarkup(keyboard)
 
-def create_forecast_keyboard(lang: str, city_name: str) -> InlineKeyboardMarkup:
-    """Создать клавиатуру для прогноза погоды"""
+def create_forecast_keyboard(lang: str, city_name: str, utc_offset: int = 0) -> InlineKeyboardMarkup:
+    """Создать клавиатуру для прогноза погоды; дни считаются по местному времени города"""
     if lang == 'rus':
         days_of_week = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
     else:
         days_of_week = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
 
-    from datetime import datetime, timedelta
-    now = datetime.now()
+    from datetime import timedelta
+    now = local_now(utc_offset)
     keyboard = []
+    day_action = city_callback("day_forecast_", CityPayload(city_name))
 
     for i in range(5):
         forecast_date = now + timedelta(days=i)
@@ -351,11 +342,11 @@ def create_forecast_keyboard(lang: str, city_name: str) -> InlineKeyboardMarkup:
         button_text = f"{day_name}, {day_num}.{month_num:02d}"
 
         if i % 2 == 0:
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"day_forecast_{city_name}_{i}")])
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"{day_action}_{i}")])
         else:
-            keyboard[-1].append(InlineKeyboardButton(button_text, callback_data=f"day_forecast_{city_name}_{i}"))
+            keyboard[-1].append(InlineKeyboardButton(button_text, callback_data=f"{day_action}_{i}"))
 
     keyboard.append([InlineKeyboardButton("◀️ Назад к погоде" if lang == 'rus' else "◀️ Back to weather",
-                                          callback_data=f"weather:{city_name}")])
+                                          callback_data=city_callback("weather:", CityPayload(city_name)))])
 
     return InlineKeyboardMarkup(keyboard)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import sys
+from array import array
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from config import LOCATIONS_MAX_ITEMS
+
+class LocationTable:
+    """Общая таблица мест: одна компактная запись на место, пользователи ссылаются на неё по ссылке"""
+
+    def __init__(self, max_items: int = LOCATIONS_MAX_ITEMS):
+        self._max_items = max_items
+        # Ключ места → номер ячейки, от давно не использованных к недавним
+        self._slots = OrderedDict()
+        self._names: List[str] = []
+        self._lat = array('d')
+        self._lon = array('d')
+        # Поколение растёт при каждом повторном использовании ячейки, и старые ссылки на неё перестают действовать
+        self._generations = array('I')
+
+    def intern(self, name: str, lat: float, lon: float) -> int:
+        """Вернуть ссылку на место, добавив его в таблицу при первом обращении; записи не изменяются"""
+        key = location_key(name, lat, lon)
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return self._handle(slot)
+
+        if len(self._slots) >= self._max_items:
+            # Ячейку давно не использованного места занимает новое
+            _, slot = self._slots.popitem(last=False)
+            self._generations[slot] = (self._generations[slot] + 1) & 0xFFFFFFFF
+            self._names[slot] = sys.intern(name)
+            self._lat[slot] = lat
+            self._lon[slot] = lon
+        else:
+            slot = len(self._names)
+            self._names.append(sys.intern(name))
+            self._lat.append(lat)
+            self._lon.append(lon)
+            self._generations.append(0)
+
+        self._slots[sys.intern(key)] = slot
+        return self._handle(slot)
+
+    def _handle(self, slot: int) -> int:
+        return self._generations[slot] << 32 | slot
+
+    def _slot(self, handle: int) -> Optional[int]:
+        """Номер ячейки по ссылке или None, если место уже вытеснено"""
+        slot = handle & 0xFFFFFFFF
+        if slot < len(self._generations) and self._generations[slot] == handle >> 32:
+            return slot
+        return None
+
+    def find(self, handles: Iterable[int], name: str) -> Optional[int]:
+        """Найти среди ссылок пользователя действующую ссылку на место с таким названием (последнюю)"""
+        name = name.strip().lower()
+        for handle in reversed(handles):
+            slot = self._slot(handle)
+            if slot is not None and self._names[slot].strip().lower() == name:
+                return handle
+        return None
+
+    def name(self, handle: int) -> Optional[str]:
+        slot = self._slot(handle)
+        return self._names[slot] if slot is not None else None
+
+    def coordinates(self, handle: int) -> Optional[Tuple[float, float]]:
+        slot = self._slot(handle)
+        return (self._lat[slot], self._lon[slot]) if slot is not None else None
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+def geolocation_key(lat: float, lon: float) -> str:
+    """Ключ места для присланной геолокации (с точностью около 10 м)"""
+    return f"{lat:.4f},{lon:.4f}"
+
+def location_key(name: str, lat: float, lon: float) -> str:
+    """Ключ записи: одноимённые места в разных точках — разные записи"""
+    return f"{name.strip().lower()}|{geolocation_key(lat, lon)}"
+
+locations = LocationTable()
\ No newline at end of file
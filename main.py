@@ -1,13 +1,28 @@
+import asyncio
 import logging
+import secrets
 from telegram import Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.request import HTTPXRequest
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, MAX_CONCURRENT_UPDATES, BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_BODY_BYTES, WEBHOOK_MAX_CONNECTIONS,
+    SHARD_WORKERS, SHARD_BASE_PORT, COMPACT_BACKLOG_ON_START
+)
 from utils import setup_logging
-from database import init_db
+from database import init_db, close_db
+from write_buffer import write_buffer
+from update_processor import PerUserUpdateProcessor
+from webhook import run_webhook
+from sharding import run_sharded
+from backlog import drain_backlog
+from edit_scheduler import SchedulingBot
 from handlers.commands import start, settings, cancel, help_command
 from handlers.callbacks import button_callback
 from handlers.messages import handle_reply, handle_location_message
+from handlers.preload import preload_user_data
+from handlers.notifications import restore_notification_jobs
 
 logger = logging.getLogger(__name__)
 
@@ -24,25 +39,77 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Не удалось отправить сообщение об ошибке: {e}")
 
+async def post_init(application: Application):
+    """Подготовка после инициализации приложения"""
+    restore_notification_jobs(application)
+    if BOT_MODE == 'polling' and COMPACT_BACKLOG_ON_START:
+        await drain_backlog(application)
+
+async def post_shutdown(application: Application):
+    """Освобождение ресурсов при остановке бота"""
+    write_buffer.close()
+    close_db()
+
+def build_application() -> Application:
+    """Собрать приложение со всеми обработчиками"""
+    application = (
+        Application.builder()
+        # Свой класс бота, чтобы прямые правки сообщений отменяли отложенные; пулы соединений как у билдера по умолчанию
+        .bot(SchedulingBot(BOT_TOKEN, request=HTTPXRequest(connection_pool_size=256), get_updates_request=HTTPXRequest()))
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    # Данные пользователя подгружаются из БД до основных обработчиков
+    application.add_handler(TypeHandler(Update, preload_user_data), group=-1)
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("settings", settings))
+    application.add_handler(CommandHandler("cancel", cancel))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_reply))
+    application.add_handler(MessageHandler(filters.LOCATION, handle_location_message))
+    application.add_error_handler(error_handler)
+    return application
+
 def main():
     try:
         logger.info("Запуск бота...")
         setup_logging()
         init_db()
 
-        application = Application.builder().token(BOT_TOKEN).build()
+        if BOT_MODE == 'sharded':
+            logger.info(f"Бот запущен, webhook {WEBHOOK_URL}, рабочих процессов: {SHARD_WORKERS}...")
+            asyncio.run(run_sharded(
+                url=WEBHOOK_URL,
+                host=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32),
+                workers=SHARD_WORKERS,
+                base_port=SHARD_BASE_PORT
+            ))
+            return
 
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("settings", settings))
-        application.add_handler(CommandHandler("cancel", cancel))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CallbackQueryHandler(button_callback))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_reply))
-        application.add_handler(MessageHandler(filters.LOCATION, handle_location_message))
-        application.add_error_handler(error_handler)
-        
-        logger.info("Бот запущен, polling...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        application = build_application()
+
+        if BOT_MODE == 'webhook':
+            logger.info(f"Бот запущен, webhook {WEBHOOK_URL}...")
+            asyncio.run(run_webhook(
+                application,
+                url=WEBHOOK_URL,
+                host=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32),
+                max_body_bytes=WEBHOOK_MAX_BODY_BYTES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS
+            ))
+        else:
+            logger.info("Бот запущен, polling...")
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
         
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
@@ -0,0 +1,148 @@
+import time
+import secrets
+import logging
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from config import CALLBACK_PAYLOAD_TTL_HOURS, CALLBACK_PAYLOAD_MAX_ITEMS
+from database import save_callback_payload_db, load_callback_payload_db_async, prune_callback_payloads_db
+
+logger = logging.getLogger(__name__)
+
+# Признак токена в callback_data: с '#' не начинается ни одно название города
+TOKEN_MARK = '#'
+
+class CityPayload(NamedTuple):
+    """Город из кнопки: название, страна и координаты, если они известны"""
+    city: str
+    country: str = ""
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+    @property
+    def has_coords(self) -> bool:
+        return self.lat is not None and self.lon is not None
+
+# Раз в сколько новых токенов удалять истёкшие из БД
+PRUNE_EVERY = 1000
+
+class PayloadRegistry:
+    """Короткие токены вместо длинных данных в callback_data; устаревшие токены вытесняются по TTL"""
+
+    def __init__(self, ttl_seconds: float, max_items: int, persistent: bool = True):
+        self._ttl = ttl_seconds
+        self._max_items = max_items
+        # Токены сохраняются в БД, чтобы кнопки в отправленных сообщениях работали после перезапуска
+        self._persistent = persistent
+        # Токен → (время истечения, данные, срок, записанный в БД); порядок — по времени последней выдачи
+        self._items: OrderedDict = OrderedDict()
+        self._tokens: Dict[CityPayload, str] = {}
+        self._created = 0
+
+    def register(self, payload: CityPayload) -> str:
+        """Выдать токен для данных (для одинаковых данных — тот же токен)"""
+        now = time.time()
+        self._evict(now)
+
+        token = self._tokens.get(payload)
+        if token is None:
+            token = secrets.token_urlsafe(6)
+            while token in self._items:
+                token = secrets.token_urlsafe(6)
+            self._tokens[payload] = token
+            persisted_until = 0.0
+            self._created += 1
+            if self._persistent and self._created % PRUNE_EVERY == 0:
+                prune_callback_payloads_db(now)
+        else:
+            persisted_until = self._items[token][2]
+
+        expires_at = now + self._ttl
+        # Продлеваем срок в БД не при каждом показе кнопки, а когда он израсходован наполовину
+        if self._persistent and expires_at - persisted_until >= self._ttl / 2:
+            save_callback_payload_db(token, payload.city, payload.country, payload.lat, payload.lon, expires_at)
+            persisted_until = expires_at
+
+        self._items[token] = (expires_at, payload, persisted_until)
+        self._items.move_to_end(token)
+        return token
+
+    def get(self, token: str) -> Optional[CityPayload]:
+        """Получить данные по токену из памяти или None, если токен истёк или неизвестен"""
+        item = self._items.get(token)
+        if item is None or item[0] < time.time():
+            return None
+        return item[1]
+
+    async def resolve(self, token: str) -> Optional[CityPayload]:
+        """Получить данные по токену; токены, выданные до перезапуска, ищутся в БД"""
+        payload = self.get(token)
+        if payload is not None or not self._persistent:
+            return payload
+
+        row = await load_callback_payload_db_async(token)
+        if row is None:
+            return None
+        city, country, lat, lon, expires_at = row
+        if expires_at < time.time():
+            return None
+
+        payload = CityPayload(city, country, lat, lon)
+        self._insert_by_expiry(token, (expires_at, payload, expires_at))
+        self._tokens.setdefault(payload, token)
+        return payload
+
+    def _insert_by_expiry(self, token: str, item: tuple):
+        """Вставить запись из БД так, чтобы порядок в памяти оставался порядком истечения"""
+        # Токен из БД выдан раньше токенов в памяти: переставляем за ним только те, что истекают позже
+        self._items.pop(token, None)
+        later = []
+        for other in reversed(self._items):
+            if self._items[other][0] <= item[0]:
+                break
+            later.append(other)
+        self._items[token] = item
+        for other in reversed(later):
+            self._items.move_to_end(other)
+
+    def _evict(self, now: float):
+        # Записи упорядочены по времени истечения, поэтому достаточно дойти до первой живой
+        while self._items:
+            token, (expires_at, payload, _) = next(iter(self._items.items()))
+            if expires_at >= now and len(self._items) < self._max_items:
+                break
+            del self._items[token]
+            # После перезапуска у одних данных может быть и старый, и новый токен
+            if self._tokens.get(payload) == token:
+                del self._tokens[payload]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+payload_registry = PayloadRegistry(CALLBACK_PAYLOAD_TTL_HOURS * 3600, CALLBACK_PAYLOAD_MAX_ITEMS)
+
+def city_callback(action: str, payload: CityPayload) -> str:
+    """Собрать callback_data вида '<action>#<токен>'"""
+    return f"{action}{TOKEN_MARK}{payload_registry.register(payload)}"
+
+async def parse_city_payload(raw: str) -> Optional[CityPayload]:
+    """Разобрать часть callback_data после действия: токен или старый формат город|lat,lon / город:страна"""
+    if raw.startswith(TOKEN_MARK):
+        return await payload_registry.resolve(raw[len(TOKEN_MARK):])
+
+    # Старые кнопки в уже отправленных сообщениях
+    if "|" in raw:
+        city, tail = raw.split("|", 1)
+    elif ":" in raw:
+        city, tail = raw.rsplit(":", 1)
+    else:
+        return CityPayload(raw)
+
+    if "," in tail:
+        try:
+            lat, lon = map(float, tail.split(",", 1))
+            return CityPayload(city, lat=lat, lon=lon)
+        except ValueError:
+            pass
+
+    return CityPayload(city, country=tail)
\ No newline at end of file
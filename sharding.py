@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+from typing import List, Optional
+
+from telegram import Bot, Update
+
+from config import (
+    BOT_TOKEN, WEBHOOK_MAX_BODY_BYTES, WEBHOOK_MAX_CONNECTIONS,
+    SHARD_LINK_CONNECTIONS, WEATHER_SHARED_CACHE_PATH
+)
+from webhook import WebhookServer, SECRET_HEADER, run_webhook, stop_signal
+
+logger = logging.getLogger(__name__)
+
+# Ключ bot_data рабочего процесса: (номер процесса, число процессов)
+SHARD_KEY = 'shard'
+
+def shard_of(user_id: int, workers: int) -> int:
+    """Номер рабочего процесса, которому принадлежит пользователь"""
+    return user_id % workers
+
+def owns_user(bot_data: dict, user_id: int) -> bool:
+    """Принадлежит ли пользователь этому процессу (вне режима 'sharded' — всегда да)"""
+    shard = bot_data.get(SHARD_KEY)
+    return shard is None or shard_of(user_id, shard[1]) == shard[0]
+
+def update_user_id(data: dict) -> Optional[int]:
+    """Пользователь апдейта из сырого JSON: from/user вложенного объекта, иначе чат"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get('from') or value.get('user')
+        if user:
+            return user['id']
+        chat = value.get('chat')
+        if chat:
+            return chat['id']
+    return None
+
+class _WorkerLink:
+    """Пул keep-alive соединений фронт-процесса с одним рабочим процессом"""
+
+    def __init__(self, port: int, path: str, secret_token: str, size: int):
+        self._port = port
+        self._path = path
+        self._secret = secret_token
+        self._idle: List[tuple] = []
+        self._slots = asyncio.Semaphore(size)
+
+    async def forward(self, body: bytes) -> int:
+        """Передать апдейт рабочему процессу и вернуть его HTTP-статус"""
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            try:
+                if conn is None:
+                    conn = await asyncio.open_connection('127.0.0.1', self._port)
+                reader, writer = conn
+                writer.write(
+                    f"POST {self._path} HTTP/1.1\r\n"
+                    f"Host: 127.0.0.1\r\n"
+                    f"{SECRET_HEADER}: {self._secret}\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                head = await reader.readuntil(b'\r\n\r\n')
+                status = int(head.split(b' ', 2)[1])
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                if conn is not None:
+                    conn[1].close()
+                logger.error(f"Рабочий процесс на порту {self._port} недоступен: {e}")
+                # Telegram повторит доставку, когда процесс поднимется
+                return 503
+
+            self._idle.append(conn)
+            return status
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+class ShardRouter(WebhookServer):
+    """Фронт-процесс: принимает вебхук и передаёт апдейт рабочему процессу, которому принадлежит пользователь"""
+
+    def __init__(self, host: str, port: int, path: str, secret_token: str, max_body_bytes: int,
+                 worker_ports: List[int], link_connections: int = SHARD_LINK_CONNECTIONS):
+        super().__init__(None, host, port, path, secret_token, max_body_bytes)
+        self._links = [_WorkerLink(worker_port, path, secret_token, link_connections) for worker_port in worker_ports]
+
+    async def _accept(self, method: str, path: str, headers: dict, body: bytes) -> int:
+        status = self._check(method, path, headers)
+        if status != 200:
+            return status
+
+        try:
+            user_id = update_user_id(json.loads(body))
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Некорректный апдейт в вебхуке: {e}")
+            return 400
+
+        # Апдейты без пользователя (например, посты каналов) обрабатывает первый процесс
+        link = self._links[shard_of(user_id, len(self._links)) if user_id is not None else 0]
+        status = await link.forward(body)
+        if status == 503:
+            self.rejected += 1
+        return status
+
+    async def stop(self):
+        await super().stop()
+        for link in self._links:
+            link.close()
+
+def _worker_main(index: int, workers: int, port: int, path: str, secret_token: str):
+    """Точка входа рабочего процесса: своё приложение, свои пользователи и их уведомления"""
+    from main import build_application
+    from utils import setup_logging
+    from database import init_db
+    from weather_api import enable_shared_cache
+
+    setup_logging()
+    init_db()
+    enable_shared_cache(WEATHER_SHARED_CACHE_PATH)
+
+    application = build_application()
+    application.bot_data[SHARD_KEY] = (index, workers)
+    logger.info(f"Рабочий процесс {index + 1}/{workers} слушает 127.0.0.1:{port}")
+
+    asyncio.run(run_webhook(
+        application,
+        url=None,
+        host='127.0.0.1',
+        port=port,
+        path=path,
+        secret_token=secret_token,
+        max_body_bytes=WEBHOOK_MAX_BODY_BYTES,
+        max_connections=WEBHOOK_MAX_CONNECTIONS
+    ))
+
+async def run_sharded(url: str, host: str, port: int, path: str, secret_token: str, workers: int, base_port: int):
+    """Запустить фронт-процесс вебхука и рабочие процессы до получения сигнала остановки"""
+    stop_event = stop_signal()
+
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(
+            target=_worker_main,
+            args=(index, workers, base_port + index, path, secret_token),
+            name=f"worker-{index}"
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    router = ShardRouter(host, port, path, secret_token, WEBHOOK_MAX_BODY_BYTES,
+                         [base_port + index for index in range(workers)])
+    try:
+        await router.start()
+        async with Bot(BOT_TOKEN) as bot:
+            await bot.set_webhook(
+                url=url,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+        await stop_event.wait()
+    finally:
+        await router.stop()
+        # Рабочие процессы по SIGTERM сами сбрасывают буфер записи и закрывают БД
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
\ No newline at end of file
@@ -0,0 +1,58 @@
+import pickle
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SQL_CREATE = 'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, fetched_at REAL NOT NULL, value BLOB NOT NULL)'
+SQL_GET = 'SELECT fetched_at, value FROM cache WHERE key = ?'
+SQL_PUT = 'INSERT OR REPLACE INTO cache (key, fetched_at, value) VALUES (?, ?, ?)'
+SQL_PRUNE = 'DELETE FROM cache WHERE fetched_at < ?'
+
+# Раз в сколько записей удалять устаревшие строки
+PRUNE_EVERY = 1000
+
+class SharedCache:
+    """Кэш в отдельном файле SQLite, общий для нескольких процессов; у каждого потока своё соединение"""
+
+    def __init__(self, path: str, max_age_seconds: float):
+        self._path = path
+        self._max_age = max_age_seconds
+        self._local = threading.local()
+        self._puts = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Потеря кэша при сбое не страшна
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(SQL_CREATE)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        """Возраст записи в секундах и значение или None"""
+        try:
+            row = self._conn().execute(SQL_GET, (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения общего кэша: {e}")
+            return None
+        if row is None:
+            return None
+        return time.time() - row[0], pickle.loads(row[1])
+
+    def put(self, key: str, value: Any):
+        try:
+            conn = self._conn()
+            now = time.time()
+            conn.execute(SQL_PUT, (key, now, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            self._puts += 1
+            if self._puts % PRUNE_EVERY == 0:
+                conn.execute(SQL_PRUNE, (now - self._max_age,))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи в общий кэш: {e}")
\ No newline at end of file
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота лежат в корне репозитория, пакета нет
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Отдельный файл БД на тест; соединение потока БД закрывается после теста"""
+    import database
+
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'bot.db'))
+    database.init_db()
+    yield database
+
+    def close(conn):
+        conn.close()
+        database._conn = None
+    database.run_in_db(close)
\ No newline at end of file
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+from telegram.error import NetworkError
+
+from backlog import compact_updates, drain_backlog
+
+NOW = datetime(2024, 1, 1)
+
+def _press(update_id: int, user_id: int, message_id: int, data: str) -> Update:
+    user = User(user_id, 'u', False)
+    message = Message(message_id, NOW, Chat(user_id, 'private'), from_user=user)
+    return Update(update_id, callback_query=CallbackQuery(str(update_id), user, 'chat', message=message, data=data))
+
+def _text(update_id: int, user_id: int, text: str) -> Update:
+    user = User(user_id, 'u', False)
+    return Update(update_id, message=Message(update_id, NOW, Chat(user_id, 'private'), from_user=user, text=text))
+
+def _ids(updates):
+    return [update.update_id for update in updates]
+
+def test_repeated_press_of_same_button_keeps_last():
+    updates = [_press(1, 10, 5, 'weather:#a'), _press(2, 10, 5, 'weather:#a'), _press(3, 10, 5, 'weather:#a')]
+    assert _ids(compact_updates(updates)) == [3]
+
+def test_different_buttons_on_same_message_are_kept():
+    updates = [_press(1, 10, 5, 'add_favorite_#a'), _press(2, 10, 5, 'week_forecast:#a')]
+    assert _ids(compact_updates(updates)) == [1, 2]
+
+def test_toggle_presses_are_never_collapsed():
+    updates = [_press(1, 10, 5, 'toggle_wind'), _press(2, 10, 5, 'toggle_wind')]
+    assert _ids(compact_updates(updates)) == [1, 2]
+
+def test_same_text_collapses_per_user_and_keeps_order():
+    updates = [_text(1, 10, 'Москва'), _text(2, 20, 'москва'), _text(3, 10, ' москва '), _text(4, 10, 'Казань')]
+    assert _ids(compact_updates(updates)) == [2, 3, 4]
+
+class _FakeBot:
+    def __init__(self, batches, fail_at=None):
+        self._batches = list(batches)
+        self._fail_at = fail_at
+        self.offsets = []
+
+    async def get_updates(self, offset=None, **kwargs):
+        self.offsets.append(offset)
+        if self._fail_at is not None and len(self.offsets) == self._fail_at:
+            raise NetworkError('timeout')
+        return self._batches.pop(0) if self._batches else []
+
+class _FakeApplication:
+    def __init__(self, bot):
+        self.bot = bot
+        self.update_queue = asyncio.Queue()
+
+def _drain(bot):
+    application = _FakeApplication(bot)
+    asyncio.run(drain_backlog(application))
+    queued = []
+    while not application.update_queue.empty():
+        queued.append(application.update_queue.get_nowait())
+    return _ids(queued)
+
+def test_drain_confirms_with_final_request_and_compacts():
+    bot = _FakeBot([[_press(1, 10, 5, 'a'), _press(2, 10, 5, 'a')], [_text(3, 10, 'x')]])
+    assert _drain(bot) == [2, 3]
+    assert bot.offsets == [None, 3, 4]
+
+def test_drain_error_keeps_already_confirmed_updates():
+    # Третий запрос падает: первая пачка подтверждена вторым запросом, вторая — нет
+    bot = _FakeBot([[_text(1, 10, 'a'), _text(2, 10, 'b')], [_text(3, 10, 'c')]], fail_at=3)
+    assert _drain(bot) == [1, 2]
+
+def test_drain_error_on_first_request_queues_nothing():
+    assert _drain(_FakeBot([[_text(1, 10, 'a')]], fail_at=1)) == []
\ No newline at end of file
@@ -0,0 +1,31 @@
+import pytest
+
+from city_index import alias_key, find_city, transliterate
+
+@pytest.mark.parametrize('spelling', [
+    'Нижний Новгород', 'нижний  новгород', 'Nizhniy Novgorod', 'Nizhny Novgorod', 'nizhnij-novgorod',
+])
+def test_spellings_resolve_to_same_city(spelling):
+    assert find_city(spelling).key == 'нижний новгород'
+
+@pytest.mark.parametrize('spelling', ['Санкт-Петербург', 'санкт петербург', 'St. Petersburg', 'Leningrad'])
+def test_exonyms_and_punctuation(spelling):
+    assert find_city(spelling).key == 'санкт-петербург'
+
+def test_yo_and_transliteration_variants():
+    assert find_city('Королев').key == 'королёв'
+    assert find_city('Korolyov').key == 'королёв'
+    assert find_city('Yekaterinburg').key == find_city('Ekaterinburg').key == 'екатеринбург'
+
+def test_record_carries_coordinates_and_title():
+    record = find_city('Moscow')
+    assert record.name == 'Москва'
+    assert (record.lat, record.lon) != (0, 0)
+
+def test_unknown_city_is_none():
+    assert find_city('Атлантида') is None
+    assert find_city('') is None
+
+def test_alias_key_and_transliterate():
+    assert alias_key('Khimki') == alias_key('Himki')
+    assert transliterate('щёлково') == 'shchelkovo'
\ No newline at end of file
@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+import database
+from config import FEATURE_BITS
+from database import MIGRATIONS, _init_db
+
+def _tables(conn: sqlite3.Connection) -> set:
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+def _version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def test_fresh_database_reaches_latest_version_without_legacy_tables():
+    conn = sqlite3.connect(':memory:')
+    _init_db(conn)
+    assert _version(conn) == len(MIGRATIONS)
+    assert 'features' not in _tables(conn)
+    assert 'history' in _tables(conn)
+
+def test_repeated_init_does_not_recreate_dropped_tables():
+    conn = sqlite3.connect(':memory:')
+    _init_db(conn)
+    _init_db(conn)
+    assert 'features' not in _tables(conn)
+    assert _version(conn) == len(MIGRATIONS)
+
+def test_legacy_features_are_migrated_to_bitmask():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript('''
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY, lang TEXT, region TEXT, timezone TEXT,
+                            pressure_unit TEXT, created_at DATETIME);
+        CREATE TABLE favorites (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, city_name TEXT,
+                                country TEXT, created_at DATETIME);
+        CREATE TABLE notifications (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, hour INTEGER,
+                                    minute INTEGER, timezone TEXT, region TEXT, notification_id TEXT,
+                                    created_at DATETIME);
+        CREATE TABLE features (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, feature_name TEXT,
+                               enabled BOOLEAN DEFAULT 1);
+    ''')
+    enabled, disabled = list(FEATURE_BITS)[:2]
+    conn.execute('INSERT INTO features (user_id, feature_name, enabled) VALUES (7, ?, 1)', (enabled,))
+    conn.execute('INSERT INTO features (user_id, feature_name, enabled) VALUES (7, ?, 0)', (disabled,))
+    conn.commit()
+
+    _init_db(conn)
+
+    assert 'features' not in _tables(conn)
+    mask = conn.execute('SELECT features FROM users WHERE user_id = 7').fetchone()[0]
+    assert mask == FEATURE_BITS[enabled]
+
+def _plan(conn: sqlite3.Connection, sql: str, params: tuple) -> str:
+    return ' | '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+
+@pytest.mark.parametrize('sql, params, index', [
+    (database.SQL_SELECT_USER, (1,), 'INTEGER PRIMARY KEY'),
+    (database.SQL_SELECT_NOTIFICATIONS, (1,), 'idx_notifications_user'),
+    (database.SQL_DELETE_NOTIFICATIONS, (1,), 'idx_notifications_user'),
+    (database.SQL_UPDATE_NEXT_FIRE, (0, 1, 'n'), 'idx_notifications_user'),
+    (database.SQL_SELECT_FAVORITES, (1,), 'idx_favorites_user'),
+    (database.SQL_DELETE_FAVORITES, (1,), 'idx_favorites_user'),
+    (database.SQL_SELECT_HISTORY, (1,), 'idx_history_user_time'),
+    (database.SQL_DELETE_HISTORY, (1,), 'idx_history_user_time'),
+    (database.SQL_SELECT_ALL_NOTIFICATIONS, (), 'idx_notifications_next_fire'),
+    (database.SQL_SELECT_CALLBACK_PAYLOAD, ('t',), 'PRIMARY KEY'),
+    (database.SQL_PRUNE_CALLBACK_PAYLOADS, (0,), 'idx_callback_payloads_expires'),
+    ('SELECT user_id FROM notifications WHERE hour = ? AND minute = ? AND timezone = ?',
+     (8, 0, 'Europe/Moscow'), 'idx_notifications_time'),
+])
+def test_queries_use_indexes(sql, params, index):
+    conn = sqlite3.connect(':memory:')
+    _init_db(conn)
+    plan = _plan(conn, sql, params)
+    assert index in plan
+    # Полный просмотр таблицы допустим только в порядке индекса
+    assert 'SCAN' not in plan.replace(f'SCAN notifications USING INDEX {index}', '')
+
+def test_update_next_fire_touches_only_one_notification(db):
+    notifications = [
+        {'id': 'a', 'hour': 8, 'minute': 0, 'timezone': 'Europe/Moscow', 'region': 'Москва'},
+        {'id': 'b', 'hour': 9, 'minute': 0, 'timezone': 'Europe/Moscow', 'region': 'Москва'},
+    ]
+    db.save_user_batch_db({1: {'notifications': notifications}}).result()
+    db.update_next_fire_db(1, 'a', 42).result()
+
+    rows = db.run_in_db(lambda conn: conn.execute(
+        'SELECT notification_id, id, next_fire_utc FROM notifications ORDER BY id').fetchall())
+    assert rows[0][:2] == ('a', 1) and rows[0][2] == 42
+    assert rows[1][:2] == ('b', 2) and rows[1][2] not in (None, 42)
\ No newline at end of file
@@ -0,0 +1,88 @@
+import asyncio
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+import edit_scheduler as scheduler_module
+from edit_scheduler import EditScheduler, SchedulingBot
+
+class _Message:
+    def __init__(self, text='исходный текст', reply_markup=None):
+        self.chat_id = 1
+        self.message_id = 7
+        self.text = text
+        self.reply_markup = reply_markup
+
+class _Query:
+    def __init__(self, message, error=None):
+        self.message = message
+        self.sent = []
+        self._error = error
+
+    async def edit_message_text(self, text, reply_markup=None):
+        if self._error:
+            raise self._error
+        self.sent.append(text)
+
+def _markup(label):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data='toggle_wind_gust')]])
+
+def _taps(scheduler, query, states, gap=0.005, settle=0.1):
+    async def scenario():
+        for text, markup in states:
+            await scheduler.edit(query, text, reply_markup=markup)
+            await asyncio.sleep(gap)
+        await asyncio.sleep(settle)
+    asyncio.run(scenario())
+
+def test_first_edit_is_immediate_and_burst_sends_only_last():
+    query = _Query(_Message())
+    scheduler = EditScheduler(debounce_ms=40, max_items=10)
+    states = [(f"состояние {i}", _markup(str(i))) for i in range(6)]
+    _taps(scheduler, query, states)
+    assert query.sent == ['состояние 0', 'состояние 5']
+
+def test_burst_ending_in_shown_state_is_skipped():
+    query = _Query(_Message())
+    scheduler = EditScheduler(debounce_ms=40, max_items=10)
+    on, off = ('меню', _markup('✅')), ('меню', _markup('❌'))
+    _taps(scheduler, query, [on, off, on])
+    assert query.sent == ['меню']
+    assert scheduler.skipped == 1
+
+def test_edit_equal_to_current_message_is_not_sent():
+    markup = _markup('❌')
+    query = _Query(_Message('меню', markup))
+    scheduler = EditScheduler(debounce_ms=40, max_items=10)
+    _taps(scheduler, query, [('меню', _markup('❌'))])
+    assert query.sent == []
+
+def test_not_modified_error_is_ignored():
+    query = _Query(_Message(), error=BadRequest('Message is not modified'))
+    scheduler = EditScheduler(debounce_ms=10, max_items=10)
+    _taps(scheduler, query, [('новый текст', None)])
+    assert scheduler.sent == 1
+
+def test_direct_edit_drops_pending_edit(monkeypatch):
+    query = _Query(_Message())
+    scheduler = EditScheduler(debounce_ms=40, max_items=10)
+    monkeypatch.setattr(scheduler_module, 'edit_scheduler', scheduler)
+
+    async def bot_edit(self, text, chat_id=None, message_id=None, **kwargs):
+        query.sent.append(text)
+    monkeypatch.setattr(scheduler_module.ExtBot, 'edit_message_text', bot_edit)
+    bot = SchedulingBot('123:abc')
+
+    async def scenario():
+        await scheduler.edit(query, 'день 1')
+        await scheduler.edit(query, 'день 2')
+        # Другой обработчик («к выбору дней») правит то же сообщение напрямую
+        await bot.edit_message_text('выбор дней', chat_id=1, message_id=7)
+        await asyncio.sleep(0.1)
+        # Следующая правка через планировщик не пропускается по старому показанному состоянию
+        await scheduler.edit(query, 'день 1')
+        await asyncio.sleep(0.1)
+    asyncio.run(scenario())
+
+    assert query.sent == ['день 1', 'выбор дней', 'день 1']
+    assert scheduler.superseded == 1
\ No newline at end of file
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from city_index import alias_key
+from gazetteer import Gazetteer, build_gazetteer
+
+def _row(geonameid, name, ascii_name, alternates, country, population, lat=10.0, lon=20.0, tz='Europe/Paris'):
+    fields = [''] * 19
+    fields[0] = str(geonameid)
+    fields[1], fields[2], fields[3] = name, ascii_name, ','.join(alternates)
+    fields[4], fields[5] = str(lat), str(lon)
+    fields[8] = country
+    fields[14] = str(population)
+    fields[17] = tz
+    return '\t'.join(fields)
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    rows = [
+        _row(1, 'Paris', 'Paris', ['Париж', 'PAR', 'https://en.wikipedia.org/wiki/Paris'], 'FR', 2_100_000, 48.8534, 2.3488),
+        _row(2, 'Paris', 'Paris', [], 'US', 25_000, 33.6609, -95.5555, 'America/Chicago'),
+        _row(3, 'Köln', 'Koeln', ['Cologne', 'Кёльн'], 'DE', 1_080_000, 50.9333, 6.95, 'Europe/Berlin'),
+        _row(4, 'Tiny', 'Tiny', [], 'FR', 10),
+        'битая строка',
+    ]
+    source = tmp_path / 'cities.txt'
+    source.write_text('\n'.join(rows) + '\n', encoding='utf-8')
+    out = tmp_path / 'gazetteer.bin'
+    assert build_gazetteer(str(source), str(out), min_population=1000) > 0
+    return Gazetteer.open(str(out))
+
+def test_most_populous_wins(gazetteer):
+    entry = gazetteer.lookup('paris')
+    assert (entry.country, entry.population, entry.timezone) == ('FR', 2_100_000, 'Europe/Paris')
+    assert (entry.lat, entry.lon) == (48.8534, 2.3488)
+
+def test_country_filter(gazetteer):
+    assert gazetteer.lookup('Paris', 'US').timezone == 'America/Chicago'
+    assert gazetteer.lookup('Paris', 'DE') is None
+
+def test_alternate_names(gazetteer):
+    assert gazetteer.lookup('Париж').name == 'Paris'
+    assert gazetteer.lookup('cologne').name == 'Köln'
+    assert gazetteer.lookup('Кёльн').name == 'Köln'
+
+def test_skipped_rows_and_aliases(gazetteer):
+    assert gazetteer.lookup('Tiny') is None
+    assert gazetteer.lookup('PAR') is None
+    assert gazetteer.lookup('') is None
+
+def test_binary_search_matches_linear_scan(tmp_path):
+    rnd = random.Random(5)
+    names = [''.join(rnd.choice('abcdeфыв') for _ in range(rnd.randint(1, 4))) for _ in range(300)]
+    rows = [_row(i, name, name, [], rnd.choice(['FR', 'DE']), rnd.randint(1000, 10**6))
+            for i, name in enumerate(names)]
+    source = tmp_path / 'cities.txt'
+    source.write_text('\n'.join(rows), encoding='utf-8')
+    build_gazetteer(str(source), str(tmp_path / 'g.bin'), min_population=1000)
+    gazetteer = Gazetteer.open(str(tmp_path / 'g.bin'))
+
+    for name in set(names) | {'zz', 'a' * 5}:
+        expected = [(int(r.split('\t')[14]), r.split('\t')[8]) for r in rows if alias_key(r.split('\t')[1]) == alias_key(name)]
+        entry = gazetteer.lookup(name)
+        if expected:
+            assert entry.population == max(expected)[0]
+        else:
+            assert entry is None
\ No newline at end of file
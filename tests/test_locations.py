@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+from locations import LocationTable
+from user_data import ProfileCache, UserDataManager, UserProfile
+
+def test_same_name_at_different_places_are_separate_records():
+    table = LocationTable(10)
+    illinois = table.intern('Springfield', 39.8017, -89.6437)
+    missouri = table.intern('Springfield', 37.2153, -93.2982)
+    assert illinois != missouri
+    assert table.coordinates(illinois) == (39.8017, -89.6437)
+    assert table.coordinates(missouri) == (37.2153, -93.2982)
+
+def test_same_place_is_shared():
+    table = LocationTable(10)
+    assert table.intern('Moscow', 55.7522, 37.6156) == table.intern('moscow ', 55.75221, 37.61559)
+    assert len(table) == 1
+
+def test_table_is_bounded_and_evicted_handles_expire():
+    table = LocationTable(2)
+    first = table.intern('A', 1, 1)
+    second = table.intern('B', 2, 2)
+    table.intern('A', 1, 1)  # A использовано недавно, вытесняется B
+    third = table.intern('C', 3, 3)
+
+    assert len(table) == 2
+    assert table.coordinates(second) is None
+    assert table.coordinates(first) == (1, 1)
+    # Ячейка B занята C, но старая ссылка на неё не указывает на новое место
+    assert third & 0xFFFFFFFF == second & 0xFFFFFFFF
+    assert table.find([second], 'C') is None
+    assert table.find([third], 'c') == third
+
+def test_users_do_not_move_each_others_places(monkeypatch):
+    monkeypatch.setattr('user_data.locations', LocationTable(10))
+    profiles = ProfileCache(10)
+    for user_id in (1, 2):
+        profiles.put(user_id, UserProfile())
+    context = SimpleNamespace(bot_data={'profiles': profiles})
+
+    UserDataManager.save_city_coordinates(context, 1, 'Springfield', 39.8017, -89.6437)
+    UserDataManager.save_city_coordinates(context, 2, 'Springfield', 37.2153, -93.2982)
+    assert UserDataManager.get_city_coordinates(context, 1, 'springfield') == {'lat': 39.8017, 'lon': -89.6437}
+    assert UserDataManager.get_city_coordinates(context, 2, 'Springfield') == {'lat': 37.2153, 'lon': -93.2982}
+
+    # Повторный запрос того же названия заменяет ссылку пользователя, а не добавляет вторую
+    UserDataManager.save_city_coordinates(context, 1, 'Springfield', 37.2153, -93.2982)
+    assert len(UserDataManager._get_profile(context, 1).location_ids) == 1
+    assert UserDataManager.get_city_coordinates(context, 1, 'Springfield') == {'lat': 37.2153, 'lon': -93.2982}
+    assert UserDataManager.get_city_coordinates(context, 1, 'Paris') is None
\ No newline at end of file
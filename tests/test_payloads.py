@@ -0,0 +1,62 @@
+import asyncio
+
+import database
+import payloads
+from payloads import CityPayload, PayloadRegistry, parse_city_payload
+
+def test_same_payload_gets_same_short_token():
+    registry = PayloadRegistry(3600, 100, persistent=False)
+    payload = CityPayload('Санкт-Петербург', 'RU', 59.9343, 30.3351)
+    token = registry.register(payload)
+    assert registry.register(payload) == token
+    assert registry.get(token) == payload
+    assert len(f"week_forecast:{payloads.TOKEN_MARK}{token}".encode()) <= 64
+
+def test_expired_and_unknown_tokens_resolve_to_none(monkeypatch):
+    registry = PayloadRegistry(60, 100, persistent=False)
+    token = registry.register(CityPayload('Казань'))
+    now = payloads.time.time()
+    monkeypatch.setattr(payloads.time, 'time', lambda: now + 61)
+    assert registry.get(token) is None
+    assert asyncio.run(registry.resolve('unknown')) is None
+
+def test_size_limit_evicts_oldest_token():
+    registry = PayloadRegistry(3600, 2, persistent=False)
+    first = registry.register(CityPayload('a'))
+    registry.register(CityPayload('b'))
+    registry.register(CityPayload('c'))
+    assert registry.get(first) is None
+
+def test_token_survives_restart(db):
+    payload = CityPayload('Paris', 'FR', 48.8566, 2.3522)
+    token = PayloadRegistry(3600, 100).register(payload)
+    # Поток БД выполняет задачи по очереди: после этого вызова запись уже сделана
+    database.run_in_db(lambda conn: None)
+
+    restarted = PayloadRegistry(3600, 100)
+    assert restarted.get(token) is None
+    assert asyncio.run(restarted.resolve(token)) == payload
+
+def test_legacy_formats_still_parse(monkeypatch):
+    assert asyncio.run(parse_city_payload('Москва|55.75,37.61')) == CityPayload('Москва', lat=55.75, lon=37.61)
+    assert asyncio.run(parse_city_payload('Paris:FR')) == CityPayload('Paris', country='FR')
+    assert asyncio.run(parse_city_payload('Казань')) == CityPayload('Казань')
+
+def test_restored_token_keeps_expiry_order(db, monkeypatch):
+    old = CityPayload('Paris', 'FR', 48.8566, 2.3522)
+    now = payloads.time.time()
+    monkeypatch.setattr(payloads.time, 'time', lambda: now - 1800)
+    old_token = PayloadRegistry(3600, 100).register(old)
+    database.run_in_db(lambda conn: None)
+
+    monkeypatch.setattr(payloads.time, 'time', lambda: now)
+    restarted = PayloadRegistry(3600, 100)
+    fresh = restarted.register(CityPayload('Казань'))
+    assert asyncio.run(restarted.resolve(old_token)) == old
+
+    # Токен из БД истекает раньше нового и должен вытесниться, не дожидаясь его
+    monkeypatch.setattr(payloads.time, 'time', lambda: now + 1801)
+    restarted.register(CityPayload('Омск'))
+    assert restarted.get(old_token) is None
+    assert len(restarted) == 2
+    assert restarted.get(fresh) == CityPayload('Казань')
\ No newline at end of file
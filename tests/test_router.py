@@ -0,0 +1,68 @@
+import asyncio
+import random
+
+import pytest
+
+from handlers.router import CallbackRouter
+
+def _named(name):
+    async def handler(update, context, data):
+        return name
+    return handler
+
+def _route(router: CallbackRouter, data: str):
+    handler = router.resolve(data)
+    return asyncio.run(handler(None, None, data)) if handler else None
+
+def test_exact_match_wins_over_prefix():
+    router = CallbackRouter()
+    router.prefix('fav_')(_named('prefix'))
+    router.exact('fav_back')(_named('exact'))
+    assert _route(router, 'fav_back') == 'exact'
+    assert _route(router, 'fav_#abc') == 'prefix'
+
+def test_longest_prefix_wins_regardless_of_registration_order():
+    router = CallbackRouter()
+    router.prefix('tz_add_')(_named('tz_add'))
+    router.prefix('tz_')(_named('tz'))
+    router.prefix('tz_add_my')(_named('tz_add_my'))
+    assert _route(router, 'tz_add_my') == 'tz_add_my'
+    assert _route(router, 'tz_add_UTC+3') == 'tz_add'
+    assert _route(router, 'tz_UTC+3') == 'tz'
+    assert _route(router, 't') is None
+
+def test_two_argument_handlers_are_wrapped():
+    router = CallbackRouter()
+
+    @router.exact('partners')
+    async def partners(update, context):
+        return 'ok'
+
+    assert _route(router, 'partners') == 'ok'
+
+def test_duplicate_routes_are_rejected():
+    router = CallbackRouter()
+    router.exact('a')(_named('a'))
+    router.prefix('p_')(_named('p'))
+    with pytest.raises(ValueError):
+        router.exact('a')(_named('again'))
+    with pytest.raises(ValueError):
+        router.prefix('p_')(_named('again'))
+
+def test_matches_naive_longest_prefix():
+    rng = random.Random(7)
+    prefixes = {''.join(rng.choice('ab_') for _ in range(rng.randint(1, 6))) for _ in range(60)}
+    router = CallbackRouter()
+    for prefix in prefixes:
+        router.prefix(prefix)(_named(prefix))
+
+    for _ in range(2000):
+        data = ''.join(rng.choice('ab_') for _ in range(rng.randint(0, 9)))
+        matching = [prefix for prefix in prefixes if data.startswith(prefix)]
+        assert _route(router, data) == (max(matching, key=len) if matching else None)
+
+def test_every_bot_button_has_a_route():
+    from handlers.callbacks import router
+    for data in ('main_menu', 'extra_features', 'toggle_wind_gust', 'day_forecast_#abc_2',
+                 'week_forecast:#abc', 'history_#abc', 'fav_#abc', 'settings_back'):
+        assert router.resolve(data) is not None, data
\ No newline at end of file
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from update_processor import PerUserUpdateProcessor
+
+def _update(update_id: int, user_id: int) -> Update:
+    user = User(user_id, 'u', False)
+    return Update(update_id, message=Message(update_id, datetime(2024, 1, 1), Chat(user_id, 'private'),
+                                             from_user=user, text='x'))
+
+async def _run(processor, updates, handler):
+    await asyncio.gather(*(processor.process_update(update, handler(update)) for update in updates))
+
+def test_updates_of_one_user_run_in_order_and_users_in_parallel():
+    log = []
+    active = set()
+    overlap = []
+
+    async def handler(update):
+        user_id = update.effective_user.id
+        assert user_id not in active
+        active.add(user_id)
+        overlap.append(len(active))
+        await asyncio.sleep(0.01)
+        log.append(update.update_id)
+        active.discard(user_id)
+
+    processor = PerUserUpdateProcessor(8)
+    updates = [_update(1, 10), _update(2, 10), _update(3, 20), _update(4, 10), _update(5, 20)]
+    asyncio.run(_run(processor, updates, handler))
+
+    assert [i for i in log if i in (1, 2, 4)] == [1, 2, 4]
+    assert [i for i in log if i in (3, 5)] == [3, 5]
+    assert max(overlap) == 2
+
+def test_failing_update_does_not_block_the_next_one():
+    done = []
+
+    async def handler(update):
+        if update.update_id == 1:
+            raise RuntimeError('boom')
+        done.append(update.update_id)
+
+    asyncio.run(_run(PerUserUpdateProcessor(4), [_update(1, 10), _update(2, 10)], handler))
+    assert done == [2]
+
+def test_admitted_updates_are_released_after_processing():
+    processor = PerUserUpdateProcessor(4)
+    updates = [_update(1, 10), _update(2, 10), _update(3, 20)]
+    seen = []
+
+    async def handler(update):
+        seen.append(processor.in_flight)
+        await asyncio.sleep(0)
+
+    for update in updates:
+        processor.admit(update)
+    assert processor.in_flight == 3
+
+    asyncio.run(_run(processor, updates, handler))
+    # Апдейт, ждущий своей очереди за тем же пользователем, остаётся учтённым
+    assert seen[0] == 3
+    assert processor.in_flight == 0
\ No newline at end of file
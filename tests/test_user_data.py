@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+
+import database
+from user_data import ProfileCache, UserDataManager, UserProfile
+
+ROW = {'lang': 'eng', 'region': 'Berlin', 'timezone': 'UTC+1', 'pressure_unit': 'hpa', 'features': 3,
+       'notifications': [], 'favorites': [('Paris', 'FR')]}
+
+def _context(limit: int = 10) -> SimpleNamespace:
+    return SimpleNamespace(bot_data={'profiles': ProfileCache(limit)})
+
+def _forbid_sync_reads(monkeypatch):
+    def fail(*args):
+        raise AssertionError("синхронное чтение БД из цикла событий")
+    monkeypatch.setattr(database, 'run_in_db', fail)
+
+def test_load_user_reads_asynchronously(monkeypatch):
+    _forbid_sync_reads(monkeypatch)
+
+    async def load(user_id):
+        return ROW
+    monkeypatch.setattr(database, 'load_user_db_async', load)
+
+    context = _context()
+    asyncio.run(UserDataManager.load_user(context, 1))
+    assert UserDataManager.get_user_lang(context, 1) == 'eng'
+    assert UserDataManager.get_user_region(context, 1) == 'Berlin'
+
+def test_evicted_profile_of_current_update_is_restored(monkeypatch):
+    _forbid_sync_reads(monkeypatch)
+    context = _context(limit=1)
+    profile = UserProfile.from_row(ROW)
+    context.bot_data['profiles'].put(1, profile)
+    UserDataManager.get_user_context(context, 1)
+
+    # Другой пользователь вытесняет профиль, пока апдейт ещё обрабатывается
+    context.bot_data['profiles'].put(2, UserProfile())
+    assert UserDataManager._get_profile(context, 1) is profile
+
+def test_missing_profile_falls_back_to_defaults_without_caching(monkeypatch):
+    _forbid_sync_reads(monkeypatch)
+    context = _context()
+    assert UserDataManager.get_user_lang(context, 5) == 'rus'
+    assert 5 not in context.bot_data['profiles']
\ No newline at end of file
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import weather_api
+from config import WEATHER_STALE_MAX_MINUTES
+from weather_api import cache_weather
+
+class _Clock:
+    now_value = datetime(2024, 1, 1, 12, 0)
+
+class _FakeDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return _Clock.now_value
+
+def _cached(monkeypatch, max_items: int = 100):
+    monkeypatch.setattr(weather_api, 'datetime', _FakeDatetime)
+    _Clock.now_value = datetime(2024, 1, 1, 12, 0)
+    calls = []
+
+    @cache_weather(ttl_minutes=10, max_items=max_items)
+    def get(city: str, lang: str = 'rus'):
+        calls.append(city)
+        return city.upper(), None
+
+    return get, calls
+
+def test_fresh_result_is_served_from_cache(monkeypatch):
+    get, calls = _cached(monkeypatch)
+    get('Москва')
+    get('москва ')
+    assert calls == ['Москва']
+
+def test_size_limit_evicts_oldest(monkeypatch):
+    get, calls = _cached(monkeypatch, max_items=3)
+    for city in ('a', 'b', 'c', 'd'):
+        get(city)
+    assert get.cache_size() == 3
+    get('a')
+    assert calls == ['a', 'b', 'c', 'd', 'a']
+
+def test_stale_entry_is_kept_for_revalidation_then_evicted(monkeypatch):
+    get, calls = _cached(monkeypatch)
+    get('a')
+
+    _Clock.now_value += timedelta(minutes=15)
+    age, data = get.peek('a')
+    assert age == 15 * 60 and data == ('A', None)
+
+    # Запись старше срока показа устаревших данных вытесняется при следующей записи
+    _Clock.now_value += timedelta(minutes=WEATHER_STALE_MAX_MINUTES)
+    get('b')
+    assert get.peek('a') is None
+    assert get.cache_size() == 1
+
+def test_only_known_cities_share_a_cache_key():
+    @cache_weather(ttl_minutes=10)
+    def get(city: str, lang: str = 'rus'):
+        return city, None
+
+    assert get.cache_key('Nizhniy Novgorod') == get.cache_key('Нижний  Новгород')
+    # Свёртка написаний не должна склеивать разные места вне справочника
+    assert get.cache_key('Khartoum') != get.cache_key('Hartoum')
+    assert get.cache_key('Paris, TX') != get.cache_key('Paris TX')
+    assert get.cache_key('Springfield ') == get.cache_key('springfield')
\ No newline at end of file
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import weather_api
+from handlers.weather import get_weather_swr
+from user_data import ProfileCache, UserProfile
+from weather_api import cache_weather
+
+class _FakeSharedCache:
+    def __init__(self, entry):
+        self._entry = entry
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.current_thread())
+        return self._entry
+
+    def put(self, key, value):
+        pass
+
+def _cached_function():
+    @cache_weather(ttl_minutes=10)
+    def get(city: str, lang: str = 'rus'):
+        return {'city': city}, f"погода {city}"
+    return get
+
+def test_shared_cache_is_read_off_the_event_loop(monkeypatch):
+    shared = _FakeSharedCache((5.0, ({'city': 'a'}, 'из общего кэша')))
+    monkeypatch.setattr(weather_api, '_shared_cache', shared)
+    get = _cached_function()
+
+    result = asyncio.run(get_weather_swr(None, None, None, get, 'a'))
+
+    assert result == ({'city': 'a'}, 'из общего кэша')
+    assert shared.threads and threading.main_thread() not in shared.threads
+
+def test_fresh_local_entry_skips_shared_cache(monkeypatch):
+    get = _cached_function()
+    get('a')
+    shared = _FakeSharedCache(None)
+    monkeypatch.setattr(weather_api, '_shared_cache', shared)
+
+    result = asyncio.run(get_weather_swr(None, None, None, get, 'a'))
+
+    assert result == ({'city': 'a'}, 'погода a')
+    assert shared.threads == []
+
+def test_stale_hits_share_one_refresh_and_drop_the_age_note():
+    calls = []
+    release = threading.Event()
+
+    @cache_weather(ttl_minutes=0)
+    def get(city: str, lang: str = 'rus'):
+        calls.append(city)
+        if len(calls) > 1:
+            release.wait(1)
+        return {'city': city}, f"погода {city}"
+
+    get('a')
+    profiles = ProfileCache(10)
+    profiles.put(1, UserProfile())
+    update = SimpleNamespace(update_id=1, effective_user=SimpleNamespace(id=1))
+    refreshed = []
+
+    async def on_refresh(weather_info, weather_text):
+        refreshed.append(weather_text)
+
+    async def scenario():
+        tasks = []
+        context = SimpleNamespace(bot_data={'profiles': profiles}, user_data={'last_update_id': 1},
+                                  application=SimpleNamespace(create_task=lambda coro, update: tasks.append(
+                                      asyncio.ensure_future(coro))))
+        shown = [await get_weather_swr(update, context, on_refresh, get, 'a') for _ in range(3)]
+        release.set()
+        await asyncio.gather(*tasks)
+        return shown
+
+    shown = asyncio.run(scenario())
+    assert all('мин назад' in text for _, text in shown)
+    # Первый вызов заполнил кэш, затем один фоновый запрос на три показа
+    assert calls == ['a', 'a']
+    # Текст не изменился, но пометку о возрасте данных всё равно убираем
+    assert refreshed == ['погода a'] * 3
\ No newline at end of file
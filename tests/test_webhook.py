@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+from update_processor import PerUserUpdateProcessor
+from webhook import SECRET_HEADER, WebhookServer
+
+class _FakeApplication:
+    def __init__(self):
+        self.bot = None
+        self.update_processor = PerUserUpdateProcessor(4)
+        self.update_queue = asyncio.Queue()
+
+def _body(update_id: int) -> bytes:
+    return json.dumps({'update_id': update_id, 'message': {
+        'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'a'}, 'text': 'x'}}).encode()
+
+def _server(application, max_pending: int = 10) -> WebhookServer:
+    return WebhookServer(application, '127.0.0.1', 0, '/hook', 'secret', 1024, max_pending_updates=max_pending)
+
+def _accept(server, body, method='POST', path='/hook', secret='secret'):
+    return asyncio.run(server._accept(method, path, {SECRET_HEADER: secret}, body))
+
+def test_requests_are_checked_before_parsing():
+    server = _server(_FakeApplication())
+    assert _accept(server, _body(1), path='/other') == 404
+    assert _accept(server, _body(1), method='GET') == 405
+    assert _accept(server, _body(1), secret='wrong') == 403
+    assert _accept(server, b'not json') == 400
+
+def test_non_object_body_is_rejected():
+    application = _FakeApplication()
+    server = _server(application)
+    for body in (b'null', b'[]', b'42', b'"update"'):
+        assert _accept(server, body) == 400
+    assert application.update_processor.in_flight == 0
+    assert application.update_queue.empty()
+
+def test_unprocessed_updates_are_capped():
+    application = _FakeApplication()
+    server = _server(application, max_pending=2)
+    assert [_accept(server, _body(i)) for i in (1, 2, 3)] == [200, 200, 503]
+    assert server.rejected == 1
+    assert application.update_queue.qsize() == 2
+
+    # После обработки место освобождается
+    application.update_processor._release(application.update_queue.get_nowait())
+    assert _accept(server, _body(4)) == 200
+
+def test_oversized_body_is_rejected_over_http():
+    async def scenario():
+        server = _server(_FakeApplication())
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write(b'POST /hook HTTP/1.1\r\nContent-Length: 4096\r\n\r\n')
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            writer.close()
+            return head
+        finally:
+            await server.stop()
+
+    assert asyncio.run(scenario()).startswith(b'HTTP/1.1 413 ')
+
+async def _post(reader, writer, body: bytes) -> int:
+    """Отправить апдейт, как это делает Telegram, и вернуть код ответа"""
+    writer.write(b'POST /hook HTTP/1.1\r\n' + f'{SECRET_HEADER}: secret\r\n'.encode()
+                 + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1])
+
+def test_flood_is_capped_and_retried_updates_are_accepted():
+    connections, per_connection, cap = 10, 30, 20
+
+    async def scenario():
+        application = _FakeApplication()
+        processor = application.update_processor
+        server = _server(application, max_pending=cap)
+        unblock = asyncio.Event()
+        handled = []
+        peak = 0
+
+        async def handler(update):
+            await unblock.wait()
+            handled.append(update.update_id)
+
+        async def consume():
+            # Как Application при concurrent_updates: апдейт сразу уходит в обработчик
+            nonlocal peak
+            while True:
+                update = await application.update_queue.get()
+                peak = max(peak, processor.in_flight)
+                asyncio.create_task(processor.process_update(update, handler(update)))
+
+        async def sender(first_id: int):
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            statuses = {}
+            for update_id in range(first_id, first_id + per_connection):
+                statuses[update_id] = await _post(reader, writer, _body(update_id))
+            return reader, writer, statuses
+
+        await server.start()
+        consumer = asyncio.create_task(consume())
+        try:
+            senders = await asyncio.gather(*(sender(1 + i * per_connection) for i in range(connections)))
+            statuses = {update_id: status for _, _, result in senders for update_id, status in result.items()}
+            accepted = [update_id for update_id, status in statuses.items() if status == 200]
+            rejected = [update_id for update_id, status in statuses.items() if status == 503]
+            flood = (len(accepted), len(rejected), server.rejected, processor.in_flight)
+
+            # Обработчики освободились — повторная доставка отклонённых проходит в пределах ограничения
+            unblock.set()
+            while processor.in_flight:
+                await asyncio.sleep(0.01)
+            reader, writer, _ = senders[0]
+            retried = []
+            for update_id in rejected[:cap]:
+                retried.append(await _post(reader, writer, _body(update_id)))
+            while processor.in_flight:
+                await asyncio.sleep(0.01)
+            for _, writer, _ in senders:
+                writer.close()
+            return flood, retried, peak, len(handled)
+        finally:
+            consumer.cancel()
+            await server.stop()
+
+    flood, retried, peak, handled = asyncio.run(scenario())
+    total = connections * per_connection
+    assert flood == (cap, total - cap, total - cap, cap)
+    assert peak <= cap
+    assert retried == [200] * cap
+    assert handled == 2 * cap
\ No newline at end of file
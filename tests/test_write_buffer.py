@@ -0,0 +1,47 @@
+import time
+
+import write_buffer as write_buffer_module
+from write_buffer import WriteBehindBuffer
+
+def _recording(monkeypatch):
+    batches = []
+    monkeypatch.setattr(write_buffer_module, 'save_user_batch_db', lambda batch: batches.append(batch))
+    return batches
+
+def test_changes_of_one_user_are_merged(monkeypatch):
+    batches = _recording(monkeypatch)
+    buffer = WriteBehindBuffer(interval_ms=60000, max_changes=100)
+    buffer.mark_dirty(1, lang='eng')
+    buffer.mark_dirty(1, region='Berlin')
+    buffer.mark_dirty(1, lang='rus')
+    assert buffer.is_pending(1)
+
+    buffer.flush()
+    assert batches == [{1: {'lang': 'rus', 'region': 'Berlin'}}]
+    assert not buffer.is_pending(1)
+    assert buffer.flush() is None
+
+def test_flushes_when_change_limit_is_reached(monkeypatch):
+    batches = _recording(monkeypatch)
+    buffer = WriteBehindBuffer(interval_ms=60000, max_changes=3)
+    for user_id in (1, 2, 3):
+        buffer.mark_dirty(user_id, lang='eng')
+    assert len(batches) == 1 and set(batches[0]) == {1, 2, 3}
+
+def test_flushes_after_interval(monkeypatch):
+    batches = _recording(monkeypatch)
+    buffer = WriteBehindBuffer(interval_ms=20, max_changes=100)
+    buffer.mark_dirty(1, timezone='UTC+3')
+    deadline = time.monotonic() + 2
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [{1: {'timezone': 'UTC+3'}}]
+
+def test_batch_reaches_database(db):
+    buffer = WriteBehindBuffer(interval_ms=60000, max_changes=100)
+    buffer.mark_dirty(42, lang='eng', region='Paris', features=5)
+    buffer.close()
+
+    row = db.run_in_db(lambda conn: conn.execute(
+        'SELECT lang, region, features FROM users WHERE user_id = 42').fetchone())
+    assert row == ('eng', 'Paris', 5)
\ No newline at end of file
@@ -0,0 +1,80 @@
+import logging
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Optional, Set, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+def _user_key(update: object) -> Optional[int]:
+    """Пользователь, к которому относится апдейт"""
+    if isinstance(update, Update) and update.effective_user:
+        return update.effective_user.id
+    return None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Разные пользователи обрабатываются параллельно, апдейты одного пользователя — строго по очереди"""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # Апдейты, пришедшие, пока предыдущий апдейт того же пользователя ещё обрабатывается
+        self._pending: Dict[int, Deque[Tuple[object, Awaitable[Any]]]] = {}
+        # Принятые вебхуком апдейты, обработка которых ещё не закончилась
+        self._admitted: Set[int] = set()
+
+    @property
+    def in_flight(self) -> int:
+        """Сколько принятых апдейтов ждут обработки или обрабатываются"""
+        return len(self._admitted)
+
+    def admit(self, update: Update):
+        """Учесть принятый апдейт; учёт снимается, когда его обработка закончена"""
+        self._admitted.add(update.update_id)
+
+    def _release(self, update: object):
+        if isinstance(update, Update):
+            self._admitted.discard(update.update_id)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user_id = _user_key(update)
+        if user_id is None:
+            try:
+                await coroutine
+            finally:
+                self._release(update)
+            return
+
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            # Очередь разберёт задача, которая уже обрабатывает этого пользователя; слот не занимаем
+            pending.append((update, coroutine))
+            return
+
+        pending = self._pending[user_id] = deque()
+        try:
+            while True:
+                try:
+                    await coroutine
+                except Exception as e:
+                    logger.error(f"Ошибка обработки апдейта пользователя {user_id}: {e}")
+                finally:
+                    self._release(update)
+                if not pending:
+                    break
+                update, coroutine = pending.popleft()
+        finally:
+            # При отмене задачи оставшиеся апдейты уже не будут обработаны
+            for leftover, leftover_coroutine in self._pending.pop(user_id):
+                leftover_coroutine.close()
+                self._release(leftover)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        for pending in self._pending.values():
+            for update, coroutine in pending:
+                coroutine.close()
+                self._release(update)
+            pending.clear()
\ No newline at end of file
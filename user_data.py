@@ -1,8 +1,17 @@
+import sys
+import time
 import uuid
 import logging
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
 from typing import Dict, List, Optional
 from telegram.ext import CallbackContext
-from config import DEFAULT_LANG, DEFAULT_REGION, DEFAULT_TIMEZONE, DEFAULT_PRESSURE_UNIT
+from config import (DEFAULT_LANG, DEFAULT_REGION, DEFAULT_TIMEZONE, DEFAULT_PRESSURE_UNIT, FEATURE_BITS,
+                    MAX_HISTORY_ITEMS, HOT_USERS_LIMIT)
+from utils import features_to_mask
+from locations import locations
+from write_buffer import write_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -10,56 +19,211 @@ def make_favorite_key(city_name: str, country: str) -> str:
     """Создать ключ для избранного"""
     return f"{city_name.strip().lower()}|{country.strip().upper()}"
 
+class FeatureFlags(Mapping):
+    """Представление битовой маски функций в виде словаря name → bool для старого кода"""
+
+    __slots__ = ('mask',)
+
+    def __init__(self, mask: int = 0):
+        self.mask = mask
+
+    def __getitem__(self, name: str) -> bool:
+        return bool(self.mask & FEATURE_BITS[name])
+
+    def __iter__(self):
+        return iter(FEATURE_BITS)
+
+    def __len__(self) -> int:
+        return len(FEATURE_BITS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+# Язык и единица давления хранятся в профиле маленькими числами
+LANGS = ('rus', 'eng')
+LANG_CODES = {lang: code for code, lang in enumerate(LANGS)}
+PRESSURE_UNITS = ('mmhg', 'hpa')
+PRESSURE_UNIT_CODES = {unit: code for code, unit in enumerate(PRESSURE_UNITS)}
+
+class UserProfile:
+    """Все данные одного пользователя в одном компактном объекте"""
+
+    __slots__ = ('lang', 'region', 'timezone', 'pressure_unit', 'features', 'notifications',
+                 'favorites', 'history', 'history_loaded', 'location_ids', 'geolocation_id')
+
+    def __init__(self):
+        self.lang = LANG_CODES[DEFAULT_LANG]
+        self.region = DEFAULT_REGION
+        self.timezone = DEFAULT_TIMEZONE
+        self.pressure_unit = None  # None — единица по умолчанию для языка пользователя
+        self.features = 0  # битовая маска FEATURE_BITS, по умолчанию всё выключено
+        # Коллекции создаются при первом обращении: у большинства пользователей они пустые
+        self.notifications = None
+        self.favorites = None  # ключ make_favorite_key → название города, в порядке добавления
+        self.history = None  # OrderedDict город → время запроса, самые свежие в конце
+        self.history_loaded = False
+        self.location_ids = None  # array ссылок на места из общей таблицы locations
+        self.geolocation_id = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'UserProfile':
+        """Собрать профиль из настроек, загруженных из БД"""
+        profile = cls()
+        profile.lang = LANG_CODES.get(row['lang'], profile.lang)
+        profile.region = sys.intern(row['region'] or DEFAULT_REGION)
+        profile.timezone = sys.intern(row['timezone'] or DEFAULT_TIMEZONE)
+        profile.pressure_unit = PRESSURE_UNIT_CODES.get(row['pressure_unit'])
+        profile.features = row['features'] or 0
+        if row['notifications']:
+            profile.notifications = row['notifications']
+        if row['favorites']:
+            profile.favorites = {make_favorite_key(city, country): city for city, country in row['favorites']}
+        return profile
+
+class UserContext:
+    """Данные пользователя для одного апдейта: профиль находится один раз, поля читаются напрямую"""
+
+    __slots__ = ('user_id', 'profile')
+
+    def __init__(self, user_id: int, profile: UserProfile):
+        self.user_id = user_id
+        self.profile = profile
+
+    @property
+    def lang(self) -> str:
+        return LANGS[self.profile.lang]
+
+    @property
+    def region(self) -> str:
+        return self.profile.region
+
+    @property
+    def timezone(self) -> str:
+        return self.profile.timezone
+
+    @property
+    def pressure_unit(self) -> str:
+        profile = self.profile
+        if profile.pressure_unit is None:
+            return 'mmhg' if profile.lang == LANG_CODES['rus'] else 'hpa'
+        return PRESSURE_UNITS[profile.pressure_unit]
+
+    @property
+    def features(self) -> FeatureFlags:
+        return FeatureFlags(self.profile.features)
+
+    def is_favorite(self, city_name: str, country: str) -> bool:
+        """Есть ли город в избранном"""
+        favorites = self.profile.favorites
+        return bool(favorites) and make_favorite_key(city_name, country) in favorites
+
+    def is_current_region(self, city_name: str) -> bool:
+        """Совпадает ли город с регионом пользователя"""
+        return city_name.lower() == self.profile.region.lower()
+
+class ProfileCache(OrderedDict):
+    """Профили недавно активных пользователей; самые давние вытесняются, их данные уже в БД"""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+
+    def put(self, user_id: int, profile: UserProfile) -> UserProfile:
+        """Положить профиль в кэш, вытеснив лишние"""
+        self[user_id] = profile
+        while len(self) > self.limit:
+            evicted_id, _ = self.popitem(last=False)
+            logger.debug(f"Профиль пользователя {evicted_id} вытеснен из памяти")
+        return profile
+
+    def touch(self, user_id: int):
+        """Отметить пользователя как недавно активного"""
+        self.move_to_end(user_id)
+
+def _get_profiles(bot_data: dict) -> ProfileCache:
+    profiles = bot_data.get('profiles')
+    if profiles is None:
+        profiles = bot_data['profiles'] = ProfileCache(HOT_USERS_LIMIT)
+    return profiles
+
+def _flush_pending(user_id: int):
+    """Отправить в БД несохранённые изменения пользователя перед повторной загрузкой"""
+    # Поток БД выполняет задачи по очереди, поэтому следующее чтение увидит эти изменения
+    if write_buffer.is_pending(user_id):
+        write_buffer.flush()
+
 class UserDataManager:
+    @staticmethod
+    def _get_profile(context: CallbackContext, user_id: int) -> UserProfile:
+        """Получить профиль пользователя из общего словаря user_id → профиль"""
+        profiles = _get_profiles(context.bot_data)
+
+        profile = profiles.get(user_id)
+        if profile is None:
+            user_context = context.__dict__.get('user_context')
+            if user_context is not None and user_context.user_id == user_id:
+                # Профиль текущего апдейта вытеснили другие пользователи, пока шла обработка — возвращаем его
+                profile = profiles.put(user_id, user_context.profile)
+            else:
+                # Профиль подгружается заранее через load_user; синхронно из цикла событий БД не читаем
+                logger.warning(f"Профиль пользователя {user_id} не подгружен заранее, используются настройки по умолчанию")
+                profile = UserProfile()
+
+        return profile
+
+    @staticmethod
+    async def load_user(context: CallbackContext, user_id: int):
+        """Подгрузить данные пользователя из БД, не блокируя цикл событий"""
+        profiles = _get_profiles(context.bot_data)
+        if user_id in profiles:
+            profiles.touch(user_id)
+            return
+
+        from database import load_user_db_async
+        _flush_pending(user_id)
+        row = await load_user_db_async(user_id)
+        # Пока шёл запрос, профиль мог загрузить другой обработчик — оставляем его
+        if user_id not in profiles:
+            profiles.put(user_id, UserProfile.from_row(row))
+
+    @staticmethod
+    def get_user_context(context: CallbackContext, user_id: int) -> UserContext:
+        """Получить данные пользователя для текущего апдейта (находятся один раз на апдейт)"""
+        user_context = context.__dict__.get('user_context')
+        if user_context is None or user_context.user_id != user_id:
+            user_context = UserContext(user_id, UserDataManager._get_profile(context, user_id))
+            context.user_context = user_context
+        return user_context
+
     @staticmethod
     def get_user_lang(context: CallbackContext, user_id: int) -> str:
         """Получить язык пользователя"""
-        if 'lang' not in context.bot_data:
-            context.bot_data['lang'] = {}
-        
-        if user_id not in context.bot_data['lang']:
-            from database import get_user_lang_db
-            lang = get_user_lang_db(user_id)
-            context.bot_data['lang'][user_id] = lang
-        
-        return context.bot_data['lang'][user_id]
+        return LANGS[UserDataManager._get_profile(context, user_id).lang]
     
     @staticmethod
     def set_user_lang(context: CallbackContext, user_id: int, lang: str):
         """Установить язык пользователя"""
-        if 'lang' not in context.bot_data:
-            context.bot_data['lang'] = {}
-        
-        context.bot_data['lang'][user_id] = lang
-        from database import set_user_lang_db
-        set_user_lang_db(user_id, lang)
+        UserDataManager._get_profile(context, user_id).lang = LANG_CODES[lang]
+        write_buffer.mark_dirty(user_id, lang=lang)
         logger.info(f"Язык пользователя {user_id} установлен: {lang}")
     
     @staticmethod
     def get_user_region(context: CallbackContext, user_id: int) -> str:
 
-        if 'region' not in context.bot_data:
-            context.bot_data['region'] = {}
-        
-        if user_id not in context.bot_data['region']:
-            context.bot_data['region'][user_id] = DEFAULT_REGION
-        
-        return context.bot_data['region'][user_id]
+        return UserDataManager._get_profile(context, user_id).region
     
     @staticmethod
     def set_user_region(context: CallbackContext, user_id: int, region: str):
         """Установить регион пользователя"""
-        if 'region' not in context.bot_data:
-            context.bot_data['region'] = {}
-        
-        context.bot_data['region'][user_id] = region
+        profile = UserDataManager._get_profile(context, user_id)
+        profile.region = sys.intern(region)
+        write_buffer.mark_dirty(user_id, region=region)
         
         # Обновляем регион в уведомлениях
-        if 'notifications' in context.bot_data and user_id in context.bot_data['notifications']:
-            notifications = context.bot_data['notifications'][user_id]
-            for notification in notifications:
-                notification['region'] = region
-            context.bot_data['notifications'][user_id] = notifications
+        if profile.notifications:
+            for notification in profile.notifications:
+                notification['region'] = profile.region
+            UserDataManager.set_user_notifications(context, user_id, profile.notifications)
         
         logger.info(f"Регион пользователя {user_id} установлен: {region}")
         return True
@@ -67,101 +231,79 @@ class UserDataManager:
     @staticmethod
     def get_user_timezone(context: CallbackContext, user_id: int) -> str:
         """Получить часовой пояс пользователя"""
-        if 'timezone' not in context.bot_data:
-            context.bot_data['timezone'] = {}
-        
-        if user_id not in context.bot_data['timezone']:
-            context.bot_data['timezone'][user_id] = DEFAULT_TIMEZONE
-        
-        return context.bot_data['timezone'][user_id]
+        return UserDataManager._get_profile(context, user_id).timezone
     
     @staticmethod
     def set_user_timezone(context: CallbackContext, user_id: int, timezone: str):
         """Установить часовой пояс пользователя"""
-        if 'timezone' not in context.bot_data:
-            context.bot_data['timezone'] = {}
-        
-        context.bot_data['timezone'][user_id] = timezone
+        UserDataManager._get_profile(context, user_id).timezone = sys.intern(timezone)
+        write_buffer.mark_dirty(user_id, timezone=timezone)
         logger.info(f"Часовой пояс пользователя {user_id} установлен: {timezone}")
         return True
     
     @staticmethod
     def get_user_pressure_unit(context: CallbackContext, user_id: int) -> str:
         """Получить единицу измерения давления"""
-        if 'pressure_unit' not in context.bot_data:
-            context.bot_data['pressure_unit'] = {}
+        profile = UserDataManager._get_profile(context, user_id)
         
-        if user_id not in context.bot_data['pressure_unit']:
-            lang = UserDataManager.get_user_lang(context, user_id)
-            context.bot_data['pressure_unit'][user_id] = 'mmhg' if lang == 'rus' else 'hpa'
+        if profile.pressure_unit is None:
+            return 'mmhg' if LANGS[profile.lang] == 'rus' else 'hpa'
         
-        return context.bot_data['pressure_unit'][user_id]
+        return PRESSURE_UNITS[profile.pressure_unit]
     
     @staticmethod
     def set_user_pressure_unit(context: CallbackContext, user_id: int, unit: str):
         """Установить единицу измерения давления"""
-        if 'pressure_unit' not in context.bot_data:
-            context.bot_data['pressure_unit'] = {}
-        
-        context.bot_data['pressure_unit'][user_id] = unit
+        UserDataManager._get_profile(context, user_id).pressure_unit = PRESSURE_UNIT_CODES[unit]
+        write_buffer.mark_dirty(user_id, pressure_unit=unit)
         logger.info(f"Единица давления пользователя {user_id} установлена: {unit}")
     
     @staticmethod
-    def get_user_features(context: CallbackContext, user_id: int) -> Dict:
+    def get_user_features(context: CallbackContext, user_id: int) -> FeatureFlags:
         """Получить настройки дополнительных функций"""
-        if 'features' not in context.bot_data:
-            context.bot_data['features'] = {}
-        
-        if user_id not in context.bot_data['features']:
-            # По умолчанию все функции выключены
-            context.bot_data['features'][user_id] = {
-                'cloudiness': False,
-                'wind_direction': False,
-                'wind_gust': False,
-                'sunrise_sunset': False
-            }
-        
-        return context.bot_data['features'][user_id]
+        return FeatureFlags(UserDataManager._get_profile(context, user_id).features)
+    
+    @staticmethod
+    def get_user_features_mask(context: CallbackContext, user_id: int) -> int:
+        """Получить битовую маску дополнительных функций"""
+        return UserDataManager._get_profile(context, user_id).features
     
     @staticmethod
     def set_user_features(context: CallbackContext, user_id: int, features: Dict):
-        if 'features' not in context.bot_data:
-            context.bot_data['features'] = {}
-        
-        context.bot_data['features'][user_id] = features
+        mask = features_to_mask(features)
+        UserDataManager._get_profile(context, user_id).features = mask
+        write_buffer.mark_dirty(user_id, features=mask)
         logger.info(f"Настройки функций пользователя {user_id} обновлены")
         return True
     
     @staticmethod
     def toggle_user_feature(context: CallbackContext, user_id: int, feature: str) -> bool:
         """Переключить дополнительную функцию"""
-        features = UserDataManager.get_user_features(context, user_id)
+        bit = FEATURE_BITS.get(feature)
         
-        if feature in features:
-            features[feature] = not features[feature]
-            UserDataManager.set_user_features(context, user_id, features)
-            logger.info(f"Функция {feature} пользователя {user_id} переключена: {features[feature]}")
+        if bit:
+            profile = UserDataManager._get_profile(context, user_id)
+            profile.features ^= bit
+            write_buffer.mark_dirty(user_id, features=profile.features)
+            logger.info(f"Функция {feature} пользователя {user_id} переключена: {bool(profile.features & bit)}")
             return True
         return False
     
     @staticmethod
     def get_user_notifications(context: CallbackContext, user_id: int):
         """Получить уведомления пользователя"""
-        if 'notifications' not in context.bot_data:
-            context.bot_data['notifications'] = {}
+        profile = UserDataManager._get_profile(context, user_id)
         
-        if user_id not in context.bot_data['notifications']:
-            context.bot_data['notifications'][user_id] = []
+        if profile.notifications is None:
+            profile.notifications = []
         
-        return context.bot_data['notifications'][user_id]
+        return profile.notifications
     
     @staticmethod
     def set_user_notifications(context: CallbackContext, user_id: int, notifications_list):
         """Установить уведомления пользователя"""
-        if 'notifications' not in context.bot_data:
-            context.bot_data['notifications'] = {}
-        
-        context.bot_data['notifications'][user_id] = notifications_list
+        UserDataManager._get_profile(context, user_id).notifications = notifications_list
+        write_buffer.mark_dirty(user_id, notifications=[dict(n) for n in notifications_list])
         return True
     
     @staticmethod
@@ -231,52 +373,43 @@ class UserDataManager:
         for notification in notifications:
             remove_notification_job(context, user_id, notification['id'])
         
-        context.bot_data['notifications'][user_id] = []
+        UserDataManager.set_user_notifications(context, user_id, [])
         logger.info(f"Все уведомления отключены для пользователя {user_id}")
         return True
     
+    @staticmethod
+    def _save_favorites(user_id: int, favs: dict):
+        """Поставить избранное пользователя в очередь записи в БД"""
+        write_buffer.mark_dirty(
+            user_id, favorites=[(city, key.split('|', 1)[1]) for key, city in favs.items()]
+        )
+
     @staticmethod
     def get_user_favorites(context: CallbackContext, user_id: int):
         """Получить избранное пользователя (старый формат)"""
-        if 'favorites' not in context.bot_data:
-            context.bot_data['favorites'] = {}
-        
-        if user_id not in context.bot_data['favorites']:
-            context.bot_data['favorites'][user_id] = []
-        
-        return context.bot_data['favorites'][user_id]
+        return list(UserDataManager.get_user_favorites_dict(context, user_id).values())
     
     @staticmethod
     def get_user_favorites_dict(context: CallbackContext, user_id: int) -> dict:
         """Получить избранное пользователя в формате словаря"""
-        if "favorites_dict" not in context.bot_data:
-            context.bot_data["favorites_dict"] = {}
+        profile = UserDataManager._get_profile(context, user_id)
         
-        if user_id not in context.bot_data["favorites_dict"]:
-            context.bot_data["favorites_dict"][user_id] = {}
-
-            old_list = UserDataManager.get_user_favorites(context, user_id)
-            for city in old_list:
-                key = f"{city.strip().lower()}|"
-                context.bot_data["favorites_dict"][user_id][key] = city
+        if profile.favorites is None:
+            profile.favorites = {}
 
-        return context.bot_data["favorites_dict"][user_id]
+        return profile.favorites
     
     @staticmethod
     def save_user_favorites_dict(context: CallbackContext, user_id: int, favs: dict) -> None:
         """Сохранить избранное пользователя в формате словаря"""
-        if "favorites_dict" not in context.bot_data:
-            context.bot_data["favorites_dict"] = {}
-        
-        context.bot_data["favorites_dict"][user_id] = favs
+        UserDataManager._get_profile(context, user_id).favorites = favs
+        UserDataManager._save_favorites(user_id, favs)
     
     @staticmethod
     def set_user_favorites(context: CallbackContext, user_id: int, favorites_list: list):
         """Установить избранное пользователя (старый формат)"""
-        if 'favorites' not in context.bot_data:
-            context.bot_data['favorites'] = {}
-        
-        context.bot_data['favorites'][user_id] = favorites_list
+        favs = {make_favorite_key(city, ""): city for city in favorites_list}
+        UserDataManager.save_user_favorites_dict(context, user_id, favs)
         return True
     
     @staticmethod
@@ -287,14 +420,7 @@ class UserDataManager:
         
         if fav_key not in favs_dict:
             favs_dict[fav_key] = city
-            UserDataManager.save_user_favorites_dict(context, user_id, favs_dict)
-            
-            # Также обновляем старый список для совместимости
-            favorites_list = UserDataManager.get_user_favorites(context, user_id)
-            if city not in favorites_list:
-                favorites_list.append(city)
-                UserDataManager.set_user_favorites(context, user_id, favorites_list)
-            
+            UserDataManager._save_favorites(user_id, favs_dict)
             logger.info(f"Город {city} добавлен в избранное для пользователя {user_id}")
             return True
         return False
@@ -307,14 +433,7 @@ class UserDataManager:
         
         if fav_key in favs_dict:
             del favs_dict[fav_key]
-            UserDataManager.save_user_favorites_dict(context, user_id, favs_dict)
-            
-            # Также обновляем старый список
-            favorites_list = UserDataManager.get_user_favorites(context, user_id)
-            if city in favorites_list:
-                favorites_list.remove(city)
-                UserDataManager.set_user_favorites(context, user_id, favorites_list)
-            
+            UserDataManager._save_favorites(user_id, favs_dict)
             logger.info(f"Город {city} удален из избранного для пользователя {user_id}")
             return True
         return False
@@ -322,77 +441,107 @@ class UserDataManager:
     @staticmethod
     def clear_user_favorites(context: CallbackContext, user_id: int):
         """Очистить избранное пользователя"""
-        if 'favorites' not in context.bot_data:
-            context.bot_data['favorites'] = {}
-        
-        context.bot_data['favorites'][user_id] = []
+        UserDataManager.save_user_favorites_dict(context, user_id, {})
         logger.info(f"Избранное очищено для пользователя {user_id}")
         return True
     
     @staticmethod
     def save_city_coordinates(context: CallbackContext, user_id: int, city: str, lat: float, lon: float):
         """Сохранить координаты города"""
-        if 'city_coordinates' not in context.bot_data:
-            context.bot_data['city_coordinates'] = {}
-        
-        if user_id not in context.bot_data['city_coordinates']:
-            context.bot_data['city_coordinates'][user_id] = {}
-        
-        context.bot_data['city_coordinates'][user_id][city] = {'lat': lat, 'lon': lon}
+        profile = UserDataManager._get_profile(context, user_id)
+        
+        location_id = locations.intern(city, lat, lon)
+        if city == 'geolocation':
+            profile.geolocation_id = location_id
+            return
+        
+        if profile.location_ids is None:
+            profile.location_ids = array('Q')
+        
+        # У пользователя одна запись на название: прежнюю ссылку заменяет новая
+        previous = locations.find(profile.location_ids, city)
+        if previous == location_id:
+            return
+        if previous is not None:
+            profile.location_ids.remove(previous)
+        profile.location_ids.append(location_id)
     
     @staticmethod
     def get_city_coordinates(context: CallbackContext, user_id: int, city: str):
         """Получить координаты города"""
-        if 'city_coordinates' not in context.bot_data:
-            return None
+        profile = UserDataManager._get_profile(context, user_id)
+        
+        if city == 'geolocation':
+            location_id = profile.geolocation_id
+        else:
+            location_id = locations.find(profile.location_ids or (), city)
         
-        if user_id not in context.bot_data['city_coordinates']:
+        coordinates = locations.coordinates(location_id) if location_id is not None else None
+        if coordinates is None:
+            # Места нет или оно уже вытеснено из общей таблицы
             return None
         
-        return context.bot_data['city_coordinates'][user_id].get(city)
+        lat, lon = coordinates
+        return {'lat': lat, 'lon': lon}
     
+    @staticmethod
+    async def load_user_history(context: CallbackContext, user_id: int):
+        """Подгрузить историю поиска из БД при первом открытии"""
+        profile = UserDataManager._get_profile(context, user_id)
+        if profile.history_loaded:
+            return
+
+        from database import load_history_db_async
+        rows = await load_history_db_async(user_id)
+
+        # Города, найденные до загрузки, свежее сохранённых — объединяем по времени запроса
+        merged = dict(rows)
+        if profile.history:
+            merged.update(profile.history)
+        history = OrderedDict(sorted(merged.items(), key=lambda item: item[1]))
+        while len(history) > MAX_HISTORY_ITEMS:
+            history.popitem(last=False)
+
+        profile.history = history
+        profile.history_loaded = True
+
     @staticmethod
     def add_to_history(context: CallbackContext, user_id: int, city_name: str):
         """Добавить город в историю поиска"""
-        from config import MAX_HISTORY_ITEMS
-        
-        if 'history' not in context.bot_data:
-            context.bot_data['history'] = {}
+        profile = UserDataManager._get_profile(context, user_id)
         
-        if user_id not in context.bot_data['history']:
-            context.bot_data['history'][user_id] = []
+        if profile.history is None:
+            profile.history = OrderedDict()
         
-        # Удаляем если уже есть (для уникальности)
-        history = context.bot_data['history'][user_id]
-        if city_name in history:
-            history.remove(city_name)
-        
-        # Добавляем в начало
-        history.insert(0, city_name)
+        # Повторный запрос переносит город в конец (самые свежие)
+        history = profile.history
+        history[city_name] = time.time()
+        history.move_to_end(city_name)
         
         # Ограничиваем размер истории
-        context.bot_data['history'][user_id] = history[:MAX_HISTORY_ITEMS]
+        while len(history) > MAX_HISTORY_ITEMS:
+            history.popitem(last=False)
         
+        write_buffer.mark_dirty(user_id, history=dict(history))
         logger.info(f"Город {city_name} добавлен в историю пользователя {user_id}")
         return True
     
     @staticmethod
     def get_user_history(context: CallbackContext, user_id: int):
         """Получить историю поиска пользователя"""
-        if 'history' not in context.bot_data:
-            context.bot_data['history'] = {}
+        history = UserDataManager._get_profile(context, user_id).history
         
-        if user_id not in context.bot_data['history']:
-            context.bot_data['history'][user_id] = []
+        if not history:
+            return []
         
-        return context.bot_data['history'][user_id]
+        return list(reversed(history))
     
     @staticmethod
     def clear_user_history(context: CallbackContext, user_id: int):
         """Очистить историю поиска"""
-        if 'history' not in context.bot_data:
-            context.bot_data['history'] = {}
-        
-        context.bot_data['history'][user_id] = []
+        profile = UserDataManager._get_profile(context, user_id)
+        profile.history = OrderedDict()
+        profile.history_loaded = True
+        write_buffer.mark_dirty(user_id, history_cleared=True, history={})
         logger.info(f"История очищена для пользователя {user_id}")
         return True
\ No newline at end of file
@@ -1,10 +1,10 @@
 import logging
 import logging.handlers
-from datetime import datetime
+from datetime import datetime, timedelta, timezone, time
 import pytz
 import requests
 from typing import Dict, Optional
-from config import LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, OPENSTREETMAP_URL
+from config import LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, OPENSTREETMAP_URL, FEATURE_BITS
 
 logger = logging.getLogger(__name__)
 
@@ -118,18 +118,46 @@ def get_utc_offset(timezone_str: str) -> str:
     except:
         return timezone_str
 
+def features_to_mask(features) -> int:
+    """Свернуть настройки дополнительных функций в битовую маску"""
+    if not features:
+        return 0
+
+    mask = getattr(features, 'mask', None)
+    if mask is not None:
+        return mask
+
+    return sum(bit for name, bit in FEATURE_BITS.items() if features.get(name))
+
+def get_next_fire_utc(hour: int, minute: int, timezone_str: str) -> Optional[int]:
+    """Ближайшее время срабатывания ежедневного уведомления (Unix time, UTC)"""
+    try:
+        if timezone_str.startswith('UTC'):
+            offset_str = timezone_str.replace('UTC', '').strip()
+            tz = timezone(timedelta(hours=float(offset_str) if offset_str else 0))
+        else:
+            tz = pytz.timezone(timezone_str)
+
+        def localize(day):
+            naive = datetime.combine(day, time(hour=hour, minute=minute))
+            return tz.localize(naive) if hasattr(tz, 'localize') else naive.replace(tzinfo=tz)
+
+        now = datetime.now(tz)
+        fire_at = localize(now.date())
+        if fire_at <= now:
+            fire_at = localize(now.date() + timedelta(days=1))
+
+        return int(fire_at.timestamp())
+    except Exception as e:
+        logger.error(f"Ошибка расчёта времени уведомления: {e}")
+        return None
+
 def normalize_city_name(city_name: str, lang: str) -> str:
     """Нормализовать название города"""
-    from config import RUSSIANCITYCOORDINATES
-    
+    from city_index import find_city
+
     if lang != 'rus':
         return city_name
 
-    city_lower = city_name.lower().strip()
-    if city_lower in RUSSIANCITYCOORDINATES:
-        # Возвращаем правильное название с заглавной буквы
-        for key in RUSSIANCITYCOORDINATES:
-            if key.lower() == city_lower:
-                return key.title()
-
-    return city_name
\ No newline at end of file
+    record = find_city(city_name)
+    return record.name if record else city_name
\ No newline at end of file
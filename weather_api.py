@@ -1,38 +1,135 @@
 import requests
 import functools
+import inspect
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import logging
 from typing import Dict, Tuple, Optional
 import pytz
 
-from config import WEATHER_TOKEN, OPENSTREETMAP_URL, RUSSIANCITYCOORDINATES, WEATHER_CACHE_TTL_MINUTES
-from utils import get_timezone_by_coordinates, calculate_timezone_by_longitude, get_location_info, get_utc_offset
+from config import (
+    WEATHER_TOKEN, OPENSTREETMAP_URL, WEATHER_CACHE_TTL_MINUTES, WEATHER_STALE_MAX_MINUTES,
+    WEATHER_CACHE_MAX_ITEMS
+)
+from forecast_store import Forecast
+from shared_cache import SharedCache
+from city_index import find_city
+from gazetteer import find_place
+from utils import get_timezone_by_coordinates, calculate_timezone_by_longitude, get_location_info, get_utc_offset, features_to_mask
 
 logger = logging.getLogger(__name__)
 
-def cache_weather(ttl_minutes=10):
+# Общий для процессов кэш (режим 'sharded'); в обычном режиме не используется
+_shared_cache: Optional[SharedCache] = None
+
+def enable_shared_cache(path: str):
+    """Включить общий для рабочих процессов кэш погоды"""
+    global _shared_cache
+    _shared_cache = SharedCache(path, (WEATHER_CACHE_TTL_MINUTES + WEATHER_STALE_MAX_MINUTES) * 60)
+
+def shared_cache_enabled() -> bool:
+    """Включён ли общий кэш: его чтение — запрос к SQLite, из цикла событий его не делают"""
+    return _shared_cache is not None
+
+def cache_weather(ttl_minutes=10, max_items=WEATHER_CACHE_MAX_ITEMS):
     """Декоратор для кэширования погоды"""
-    cache = {}
+    # Ключ → (время получения, результат); порядок — по времени добавления
+    cache: OrderedDict = OrderedDict()
+    # Функции вызываются из рабочих потоков asyncio.to_thread
+    lock = threading.Lock()
+    ttl = timedelta(minutes=ttl_minutes)
+    # Устаревшие записи ещё нужны для показа с фоновым обновлением, после этого срока — нет
+    keep = ttl + timedelta(minutes=WEATHER_STALE_MAX_MINUTES)
+
+    def store(key, cached_time: datetime, data):
+        with lock:
+            cache[key] = (cached_time, data)
+            cache.move_to_end(key)
+            oldest_allowed = datetime.now() - keep
+            while cache:
+                first_time, _ = next(iter(cache.values()))
+                if first_time >= oldest_allowed and len(cache) <= max_items:
+                    break
+                cache.popitem(last=False)
 
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            city = kwargs.get('city') or (args[0] if args else None)
-            lang = kwargs.get('lang', 'ru')
+        signature = inspect.signature(func)
+
+        def make_key(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = bound.arguments
+            city = params.get('city')
 
             if city:
-                key = f"{city.lower()}_{lang}"
+                # Разные написания известного города попадают в одну запись кэша; остальные названия различаются как есть
+                record = find_city(city)
+                place = record.key if record is not None else ' '.join(city.lower().split())
+            elif params.get('lat') is not None and params.get('lon') is not None:
+                place = (round(params['lat'], 4), round(params['lon'], 4))
+            else:
+                return None
+
+            # Текст ответа зависит от языка, функций, часового пояса и единиц давления
+            return (
+                place, params.get('lang'), features_to_mask(params.get('user_features')),
+                params.get('user_timezone'), params.get('pressure_unit')
+            )
+
+        def lookup(key):
+            """Запись из локального кэша, а если там нет свежей — из общего кэша процессов"""
+            entry = cache.get(key)
+            if _shared_cache is not None and (entry is None or datetime.now() - entry[0] >= ttl):
+                shared = _shared_cache.get(f"{func.__name__}:{key!r}")
+                if shared is not None:
+                    age, data = shared
+                    shared_time = datetime.now() - timedelta(seconds=age)
+                    if entry is None or shared_time > entry[0]:
+                        entry = (shared_time, data)
+                        store(key, shared_time, data)
+            return entry
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
 
-                if key in cache:
-                    cached_time, data = cache[key]
-                    if datetime.now() - cached_time < timedelta(minutes=ttl_minutes):
-                        return data
+            entry = lookup(key) if key is not None else None
+            if entry is not None:
+                cached_time, data = entry
+                if datetime.now() - cached_time < ttl:
+                    return data
 
             result = func(*args, **kwargs)
-            if city:
-                cache[key] = (datetime.now(), result)
+            if key is not None:
+                store(key, datetime.now(), result)
+                if _shared_cache is not None:
+                    _shared_cache.put(f"{func.__name__}:{key!r}", result)
             return result
 
+        def peek(*args, **kwargs) -> Optional[Tuple[float, tuple]]:
+            """Возраст в секундах и результат из кэша, даже если срок хранения истёк"""
+            key = make_key(args, kwargs)
+            entry = lookup(key) if key is not None else None
+            if entry is None:
+                return None
+            cached_time, data = entry
+            return (datetime.now() - cached_time).total_seconds(), data
+
+        def peek_local(*args, **kwargs) -> Optional[Tuple[float, tuple]]:
+            """То же, что peek, но только из памяти процесса, без обращения к общему кэшу"""
+            key = make_key(args, kwargs)
+            entry = cache.get(key) if key is not None else None
+            if entry is None:
+                return None
+            cached_time, data = entry
+            return (datetime.now() - cached_time).total_seconds(), data
+
+        wrapper.peek = peek
+        wrapper.peek_local = peek_local
+        wrapper.cache_key = lambda *args, **kwargs: make_key(args, kwargs)
+        wrapper.ttl_seconds = ttl_minutes * 60
+        wrapper.cache_size = lambda: len(cache)
         return wrapper
 
     return decorator
@@ -42,14 +139,15 @@ def normalize_city_name_for_russian(city_name: str, lang: str) -> str:
     if lang != 'rus':
         return city_name
 
-    city_lower = city_name.lower().strip()
-    if city_lower in RUSSIANCITYCOORDINATES:
-        # Возвращаем правильное название с заглавной буквы
-        for key in RUSSIANCITYCOORDINATES:
-            if key.lower() == city_lower:
-                return key.title()
+    record = find_city(city_name)
+    return record.name if record else city_name
 
-    return city_name
+def location_params(city: str) -> dict:
+    """Параметры места для запроса к API: координаты из справочника или название для геокодинга OWM"""
+    place = find_place(city)
+    if place:
+        return {'lat': place.lat, 'lon': place.lon}
+    return {'q': city}
 
 @cache_weather(ttl_minutes=WEATHER_CACHE_TTL_MINUTES)
 def get_weather(
@@ -62,21 +160,17 @@ def get_weather(
 ) -> tuple:
     """Получение погоды с сохранением координат и нормализацией русских городов"""
     try:
-        # Нормализуем название для русского языка
-        normalized_city = normalize_city_name_for_russian(city, lang)
-
-        # Проверяем, есть ли город в нашем словаре координат
-        city_lower = normalized_city.lower()
-        if lang == 'rus' and city_lower in RUSSIANCITYCOORDINATES:
-            lat, lon = RUSSIANCITYCOORDINATES[city_lower]
+        # Проверяем, есть ли город в нашем словаре координат (в любом написании)
+        record = find_city(city) if lang == 'rus' else None
+        if record:
             # Используем координаты из словаря
             return get_weather_by_coordinates(
-                lat, lon, lang, user_features, user_timezone, pressure_unit
+                record.lat, record.lon, lang, user_features, user_timezone, pressure_unit
             )
 
         url = 'https://api.openweathermap.org/data/2.5/weather'
         params = {
-            'q': normalized_city,
+            **location_params(city),
             'appid': WEATHER_TOKEN,
             'units': 'metric',
             'lang': 'ru' if lang == 'rus' else 'en'
@@ -239,6 +333,7 @@ def get_weather(
         logger.error(f"Ошибка get_weather: {e}")
         return None, f'❌ Ошибка: {e}' if lang == 'rus' else f'❌ Error: {e}'
 
+@cache_weather(ttl_minutes=WEATHER_CACHE_TTL_MINUTES)
 def get_weather_by_coordinates(
         lat: float,
         lon: float,
@@ -449,11 +544,11 @@ def get_weather_by_coordinates(
         return None, f'❌ Ошибка: {e}' if lang == 'rus' else f'❌ Error: {e}'
 
 def get_forecast(city: str, lang: str = "ru"):
-    """Получение прогноза погоды"""
+    """Получение прогноза погоды: (Forecast, None) или (None, текст ошибки)"""
     try:
         url = 'https://api.openweathermap.org/data/2.5/forecast'
         params = {
-            'q': city,
+            **location_params(city),
             'appid': WEATHER_TOKEN,
             'units': 'metric',
             'lang': 'ru' if lang == 'rus' else 'en',
@@ -462,68 +557,30 @@ def get_forecast(city: str, lang: str = "ru"):
         response = requests.get(url, params=params, timeout=10)
 
         if response.status_code == 404:
-            return None, None, f"Город {city} не найден" if lang == 'rus' else f"City {city} not found"
+            return None, f"Город {city} не найден" if lang == 'rus' else f"City {city} not found"
         elif response.status_code != 200:
-            return None, None, f"Ошибка: код {response.status_code}" if lang == 'rus' else f"Error: code {response.status_code}"
+            return None, f"Ошибка: код {response.status_code}" if lang == 'rus' else f"Error: code {response.status_code}"
 
-        data = response.json()
-        city_name = data['city']['name']
-        forecast_list = data['list']
-
-        return city_name, forecast_list, None
+        # Разбираем ответ здесь же, в рабочем потоке
+        return Forecast.from_api(response.json()), None
 
     except Exception as e:
-        return None, None, f'Ошибка: {e}' if lang == 'rus' else f'Error: {e}'
-
-def get_daily_forecast(forecast_list, day_offset: int = 0):
-    """Получение дневного прогноза"""
-    if not forecast_list:
-        return None
-
-    target_date = (datetime.now() + timedelta(days=day_offset)).date()
-    day_forecasts = []
-
-    for forecast in forecast_list:
-        forecast_dt = datetime.fromtimestamp(forecast['dt'])
-        if forecast_dt.date() == target_date:
-            day_forecasts.append(forecast)
+        return None, f'Ошибка: {e}' if lang == 'rus' else f'Error: {e}'
 
-    if not day_forecasts:
+def get_daily_forecast(forecast, day_offset: int = 0):
+    """Получение дневного прогноза из заранее посчитанных сводок"""
+    if forecast is None:
         return None
 
-    temps = [f['main']['temp'] for f in day_forecasts]
-    feels_like = [f['main']['feels_like'] for f in day_forecasts]
-    humidities = [f['main']['humidity'] for f in day_forecasts]
-
-    day_forecast = None
-    for forecast in day_forecasts:
-        hour = datetime.fromtimestamp(forecast['dt']).hour
-        if 12 <= hour <= 15:
-            day_forecast = forecast
-            break
-
-    if not day_forecast:
-        day_forecast = day_forecasts[0]
-
-    return {
-        'date': target_date,
-        'temp_min': min(temps),
-        'temp_max': max(temps),
-        'temp_day': day_forecast['main']['temp'],
-        'feels_like': day_forecast['main']['feels_like'],
-        'humidity': day_forecast['main']['humidity'],
-        'pressure': day_forecast['main']['pressure'],
-        'wind_speed': day_forecast['wind']['speed'],
-        'description': day_forecast['weather'][0]['description'],
-        'icon': day_forecast['weather'][0]['icon']
-    }
+    return forecast.days.get(forecast.local_date(day_offset))
 
 def get_extended_data(city: str, lang: str = "ru", features: dict = None, user_timezone: str = None) -> tuple:
     """Получение расширенных данных о городе"""
     try:
+        place = find_place(city)
         url = 'https://api.openweathermap.org/data/2.5/weather'
         params = {
-            'q': city,
+            **({'lat': place.lat, 'lon': place.lon} if place else {'q': city}),
             'appid': WEATHER_TOKEN,
             'units': 'metric',
             'lang': 'ru' if lang == 'rus' else 'en'
@@ -545,9 +602,11 @@ def get_extended_data(city: str, lang: str = "ru", features: dict = None, user_t
         # Нормализация названия
         city_name = normalize_city_name_for_russian(city_name, lang)
 
-        # Получаем часовой пояс
-        location_info = get_location_info(lat, lon)
-        if location_info:
+        # Получаем часовой пояс: из справочника без запроса к OpenStreetMap, иначе по координатам
+        location_info = None if place else get_location_info(lat, lon)
+        if place and place.timezone:
+            city_timezone = get_utc_offset(place.timezone)
+        elif location_info:
             tz_info = get_timezone_by_coordinates(lat, lon, location_info)
             city_timezone = tz_info.get('utc_offset', 'UTC+0') if tz_info else 'UTC+0'
         else:
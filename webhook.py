@@ -0,0 +1,183 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from config import WEBHOOK_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    503: 'Service Unavailable',
+}
+
+class WebhookServer:
+    """Встроенный HTTP-сервер для вебхука: проверяет секрет и ограничивает число необработанных апдейтов"""
+
+    def __init__(self, application: Optional[Application], host: str, port: int, path: str, secret_token: str,
+                 max_body_bytes: int, max_pending_updates: int = WEBHOOK_QUEUE_SIZE):
+        self._application = application
+        self._max_pending = max_pending_updates
+        self._host = host
+        self._port = port
+        self._path = path
+        self._secret = secret_token.encode()
+        self._max_body_bytes = max_body_bytes
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.rejected = 0
+
+    @property
+    def port(self) -> int:
+        """Фактический порт (при port=0 его выбирает система)"""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self._host, self._port)
+        logger.info(f"Вебхук слушает {self._host}:{self.port}{self._path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обработка соединения; Telegram держит соединения открытыми, поэтому запросов может быть несколько"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                parts = request_line.split(' ')
+                if len(parts) != 3:
+                    await self._respond(writer, 400, keep_alive=False)
+                    break
+                method, path, _ = parts
+
+                headers = {}
+                for line in header_lines:
+                    name, sep, value = line.partition(':')
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length', '0'))
+                except ValueError:
+                    await self._respond(writer, 400, keep_alive=False)
+                    break
+                if length < 0 or length > self._max_body_bytes:
+                    await self._respond(writer, 413, keep_alive=False)
+                    break
+
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status = await self._accept(method, path, headers, body)
+                await self._respond(writer, status, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _check(self, method: str, path: str, headers: dict) -> int:
+        """Проверить адрес, метод и секретный токен; вернуть HTTP-статус"""
+        if path != self._path:
+            return 404
+        if method != 'POST':
+            return 405
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, '').encode(), self._secret):
+            logger.warning("Запрос к вебхуку с неверным секретным токеном")
+            return 403
+        return 200
+
+    async def _accept(self, method: str, path: str, headers: dict, body: bytes) -> int:
+        """Проверить запрос и поставить апдейт в очередь; вернуть HTTP-статус"""
+        status = self._check(method, path, headers)
+        if status != 200:
+            return status
+
+        try:
+            data = json.loads(body)
+            update = Update.de_json(data, self._application.bot) if isinstance(data, dict) else None
+        except (ValueError, TypeError, KeyError) as e:
+            logger.error(f"Некорректный апдейт в вебхуке: {e}")
+            return 400
+        if update is None:
+            logger.error(f"Некорректный апдейт в вебхуке: ожидался объект, получено {body[:100]!r}")
+            return 400
+
+        # Приложение забирает апдейты из очереди сразу, поэтому ограничиваем число ещё не обработанных
+        processor = self._application.update_processor
+        if processor.in_flight >= self._max_pending:
+            # Telegram повторит доставку позже — так число задач не растёт без ограничений
+            self.rejected += 1
+            return 503
+
+        processor.admit(update)
+        self._application.update_queue.put_nowait(update)
+        return 200
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, keep_alive: bool):
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+        )
+        await writer.drain()
+
+def stop_signal() -> asyncio.Event:
+    """Событие, которое срабатывает по SIGINT/SIGTERM"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    return stop_event
+
+async def run_webhook(application: Application, url: Optional[str], host: str, port: int, path: str,
+                      secret_token: str, max_body_bytes: int, max_connections: int):
+    """Запустить приложение в режиме вебхука до получения сигнала остановки (без url вебхук не регистрируется)"""
+    stop_event = stop_signal()
+    server = WebhookServer(application, host, port, path, secret_token, max_body_bytes)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        await application.start()
+        await server.start()
+        if url:
+            await application.bot.set_webhook(
+                url=url,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=max_connections
+            )
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
\ No newline at end of file
@@ -0,0 +1,65 @@
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from config import WRITE_BEHIND_INTERVAL_MS, WRITE_BEHIND_MAX_CHANGES
+from database import save_user_batch_db
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindBuffer:
+    """Буфер отложенной записи изменённых настроек пользователей в БД"""
+
+    def __init__(self, interval_ms: int, max_changes: int):
+        self._interval = interval_ms / 1000
+        self._max_changes = max_changes
+        self._pending: Dict[int, dict] = {}
+        self._changes = 0
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def mark_dirty(self, user_id: int, **fields):
+        """Запомнить изменённые поля пользователя до ближайшего сброса"""
+        with self._lock:
+            self._pending.setdefault(user_id, {}).update(fields)
+            self._changes += 1
+            flush_now = self._changes >= self._max_changes
+
+            if not flush_now and self._timer is None:
+                self._timer = threading.Timer(self._interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if flush_now:
+            self.flush()
+
+    def is_pending(self, user_id: int) -> bool:
+        """Есть ли у пользователя изменения, ещё не отправленные в БД"""
+        with self._lock:
+            return user_id in self._pending
+
+    def flush(self) -> Optional[Future]:
+        """Записать все накопленные изменения одной транзакцией"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            batch, self._pending = self._pending, {}
+            changes, self._changes = self._changes, 0
+
+        if not batch:
+            return None
+
+        logger.debug(f"Сброс {changes} изменений ({len(batch)} пользователей) в БД")
+        return save_user_batch_db(batch)
+
+    def close(self):
+        """Принудительно сбросить буфер и дождаться записи"""
+        future = self.flush()
+        if future is not None:
+            future.result()
+        logger.info("Буфер отложенной записи сброшен")
+
+write_buffer = WriteBehindBuffer(WRITE_BEHIND_INTERVAL_MS, WRITE_BEHIND_MAX_CHANGES)
\ No newline at end of file